@@ -1,8 +1,17 @@
+import logging
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
 from canvasapi import Canvas
+from canvasapi.assignment import Assignment, AssignmentOverride
+from canvasapi.exceptions import CanvasException
+from canvasapi.new_quiz import NewQuiz
+from canvasapi.quiz import Quiz
 from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from flexible_assessment import canvas_session
+from flexible_assessment.canvas_graphql import PAGE_INFO, get_pages
 from oauth.oauth import get_oauth_token
 
 from dateutil import parser
@@ -12,9 +21,60 @@ from datetime import timedelta, datetime, timezone
 import math
 import json
 
+logger = logging.getLogger(__name__)
 
 ACCOMMODATION_MULTIPLIERS = [4.0, 3.5, 3.0, 2.5, 2.0, 1.75, 1.5, 1.25]
 BUFFER_TIME = 30  # time of buffer in minutes
+# Quizzes whose existing assignment overrides are fetched at the same time
+OVERRIDE_WORKERS = 8
+# Assignments in each page of QUIZ_OVERRIDES_QUERY, and overrides fetched
+# with each assignment
+QUIZ_PAGE_SIZE = 50
+OVERRIDE_PAGE_SIZE = 100
+
+OVERRIDE_FIELDS = """overrides: nodes {
+                    _id
+                    due_at: dueAt
+                    unlock_at: unlockAt
+                    lock_at: lockAt
+                    set {
+                        ... on AdhocStudents {
+                            students {
+                                _id
+                            }
+                        }
+                    }
+                }"""
+
+# Classic quiz assignments have a quiz, New Quizzes are external tool
+# assignments without one
+QUIZ_OVERRIDES_QUERY = f"""query QuizOverridesQuery($course_id: ID!, $first: Int, $after: String, $page_size: Int) {{
+    course(id: $course_id) {{
+        assignment_list: assignmentsConnection(first: $first, after: $after) {{
+            assignments: nodes {{
+                _id
+                quiz {{
+                    _id
+                }}
+                submission_types: submissionTypes
+                override_list: assignmentOverrides(first: $page_size) {{
+                    {OVERRIDE_FIELDS}
+                    {PAGE_INFO}
+                }}
+            }}
+            {PAGE_INFO}
+        }}
+    }}
+}}"""
+
+ASSIGNMENT_OVERRIDES_QUERY = f"""query AssignmentOverridesQuery($assignment_id: ID!, $first: Int, $after: String) {{
+    assignment(id: $assignment_id) {{
+        override_list: assignmentOverrides(first: $first, after: $after) {{
+            {OVERRIDE_FIELDS}
+            {PAGE_INFO}
+        }}
+    }}
+}}"""
 
 
 def check_midnight(query_time):
@@ -371,7 +431,12 @@ class AccommodationsCanvas(Canvas):
 
         self.base_url = base_url
         self.access_token = access_token
+        # Instructor named in log messages
+        self.display_name = request.session.get("display_name")
         super().__init__(base_url, access_token)
+        canvas_session.use_session(self)
+        # Assignment IDs of quizzes without one from get_quiz_data
+        self._assignment_ids = {}
 
     def get_quiz_data(self, course_id):
         """
@@ -380,6 +445,10 @@ class AccommodationsCanvas(Canvas):
         Quizzes are separated into two groups: those that are selectable (i.e., have a time limit or are open)
         and those that are unavailable (e.g., not published or outside availability window).
 
+        Each quiz records its assignment ID, so the rest of the workflow can
+        reach the quiz and its assignment without looking them up again, see
+        _get_quiz_assignment.
+
         Parameters
         ----------
         course_id : int
@@ -415,6 +484,7 @@ class AccommodationsCanvas(Canvas):
                 "lock_at_readable": readable_datetime(quiz.lock_at),
                 "should_warn": False,  # set this to true if the time window between start and end date is less than the time limit
                 "is_new_quiz": False,
+                "assignment_id": getattr(quiz, "assignment_id", None),
             }
             if is_quiz_selectable(quiz_data):
                 set_warn(quiz_data)
@@ -439,6 +509,7 @@ class AccommodationsCanvas(Canvas):
                     "lock_at_readable": readable_datetime(quiz.lock_at),
                     "should_warn": False,  # set this to true if the time window between start and end date is less than the time limit
                     "is_new_quiz": True,
+                    "assignment_id": quiz.id,  # New Quizzes use their assignment ID
                 }
                 if (
                     hasattr(quiz, "quiz_settings")
@@ -571,12 +642,85 @@ class AccommodationsCanvas(Canvas):
             multiplier_quiz_groups[multiplier] = quizzes_multiplied
         return multiplier_quiz_groups
 
+    def get_quiz_overrides(self, course_id):
+        """Gets the assignment and overrides of every quiz in a course in
+        one paginated GraphQL query, so overrides can be checked and planned
+        without a request for each quiz
+
+        Parameters
+        ----------
+        course_id : int
+            Canvas course ID
+
+        Returns
+        -------
+        quiz_overrides : dict
+            For each quiz by _get_quiz_key, a dict of its assignment ID,
+            whether it is a New Quiz and its overrides, see _to_override
+
+        Raises
+        ------
+        PermissionDenied
+            If a page is missing from the response
+        """
+
+        quiz_overrides = {}
+        assignment_pages = get_pages(
+            self,
+            QUIZ_OVERRIDES_QUERY,
+            {
+                "course_id": course_id,
+                "first": QUIZ_PAGE_SIZE,
+                "page_size": OVERRIDE_PAGE_SIZE,
+            },
+            ("data", "course", "assignment_list"),
+            "assignments",
+        )
+        for assignments in assignment_pages:
+            for assignment in assignments:
+                quiz = assignment.get("quiz")
+                submission_types = assignment.get("submission_types") or []
+                if quiz is None and "external_tool" not in submission_types:
+                    continue
+
+                # New Quizzes are identified by their assignment ID
+                is_new_quiz = quiz is None
+                quiz_id = assignment["_id"] if is_new_quiz else quiz["_id"]
+                override_pages = get_pages(
+                    self,
+                    ASSIGNMENT_OVERRIDES_QUERY,
+                    {"assignment_id": assignment["_id"], "first": OVERRIDE_PAGE_SIZE},
+                    ("data", "assignment", "override_list"),
+                    "overrides",
+                    connection=assignment.get("override_list"),
+                )
+                quiz_overrides[_get_quiz_key(is_new_quiz, quiz_id)] = {
+                    "assignment_id": int(assignment["_id"]),
+                    "is_new_quiz": is_new_quiz,
+                    "overrides": [
+                        _to_override(node)
+                        for overrides in override_pages
+                        for node in overrides
+                    ],
+                }
+
+        return quiz_overrides
+
     def get_existing_accommodations(
-        self, accommodations, students, multiplier_quiz_groups, course_id
+        self,
+        accommodations,
+        students,
+        multiplier_quiz_groups,
+        course_id,
+        quiz_overrides=None,
     ):
         """
         Find and return all existing accommodations on Canvas that conflict with the curent accommodations to be applied.
 
+        Overrides are read from get_quiz_overrides. Quizzes missing from it
+        are fetched by a pool of up to OVERRIDE_WORKERS threads, as each
+        needs two or three requests one after another.
+
         Parameters
         ----------
         accommodations : list of tuple of (str, str, int, str)
@@ -587,10 +731,12 @@ class AccommodationsCanvas(Canvas):
             Dictionary where each key is a multiplier (e.g., '1.5') and the value is a list of modified quiz dicts.
         course_id : int
             The Canvas course ID.
+        quiz_overrides : dict, optional
+            Overrides from get_quiz_overrides, fetched if not given.
 
         Returns
         -------
-        list of dict
+        existing_accommodations : list of dict
             Each dict represents an existing accommodation override for a student, containing:
             - login_id
             - display_name
@@ -605,8 +751,14 @@ class AccommodationsCanvas(Canvas):
             - unlock_at_override_readable
             - lock_at_override
             - lock_at_override_readable
+        stats : dict
+            Quizzes checked, seconds taken, quizzes fetched separately, workers
+            used and seconds taken for each quiz fetched separately by ID
         """
+        start = time.perf_counter()
         course = self.get_course(course_id)
+        if quiz_overrides is None:
+            quiz_overrides = self._try_get_quiz_overrides(course)
 
         # Create a mapping of user_id to student info
         student_tuples_by_user_id = {
@@ -623,17 +775,31 @@ class AccommodationsCanvas(Canvas):
         # Use the quiz structure from one multiplier as reference (all groups are parallel)
         reference_quiz_list = next(iter(multiplier_quiz_groups.values()))
 
+        missing_quizzes = [
+            quiz
+            for quiz in reference_quiz_list
+            if _get_quiz_key(quiz["is_new_quiz"], quiz["id"]) not in quiz_overrides
+        ]
+        workers = min(OVERRIDE_WORKERS, len(missing_quizzes))
+        fetched_overrides = {}
+        quiz_seconds = {}
+        if missing_quizzes:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(
+                    lambda quiz: self._get_quiz_overrides(course, quiz),
+                    missing_quizzes,
+                )
+                for quiz, (quiz_override, seconds) in zip(missing_quizzes, results):
+                    key = _get_quiz_key(quiz["is_new_quiz"], quiz["id"])
+                    fetched_overrides[key] = quiz_override
+                    quiz_seconds[quiz["id"]] = seconds
+
         for quiz_index, quiz in enumerate(reference_quiz_list):
-            quiz_assignment = None
-            if quiz["is_new_quiz"]:
-                quiz_assignment = course.get_assignment(quiz["id"])
-            else:
-                canvas_quiz = course.get_quiz(quiz["id"])
-                quiz_assignment = course.get_assignment(canvas_quiz.assignment_id)
-            assignment_overrides = quiz_assignment.get_overrides()
+            key = _get_quiz_key(quiz["is_new_quiz"], quiz["id"])
+            quiz_override = quiz_overrides.get(key) or fetched_overrides[key]
 
-            for override in assignment_overrides:
-                for student_id in override.student_ids:
+            for override in quiz_override["overrides"]:
+                for student_id in override["student_ids"]:
                     if student_id not in user_id_to_multiplier:
                         continue
 
@@ -649,13 +815,8 @@ class AccommodationsCanvas(Canvas):
                     ):
                         continue  # App does not plan to override this quiz
 
-                    unlock_at_override = (
-                        override.unlock_at if hasattr(override, "unlock_at") else None
-                    )
-
-                    lock_at_override = (
-                        override.lock_at if hasattr(override, "unlock_at") else None
-                    )
+                    unlock_at_override = override["unlock_at"]
+                    lock_at_override = override["lock_at"]
 
                     student_tuple = student_tuples_by_user_id[student_id]
                     override_dict = {
@@ -688,7 +849,91 @@ class AccommodationsCanvas(Canvas):
             ),
         )
 
-        return existing_accommodations
+        stats = {
+            "quizzes": len(reference_quiz_list),
+            "seconds": time.perf_counter() - start,
+            "fetched": len(missing_quizzes),
+            "workers": workers,
+            "quiz_seconds": quiz_seconds,
+        }
+
+        return existing_accommodations, stats
+
+    def _try_get_quiz_overrides(self, course):
+        """Gets every quiz's overrides with get_quiz_overrides, or an empty
+        dict if the query fails so each quiz's overrides are fetched
+        separately with _get_quiz_overrides instead"""
+
+        try:
+            return self.get_quiz_overrides(course.id)
+        except (CanvasException, PermissionDenied, requests.RequestException) as e:
+            logger.warning(
+                f"Unable to get quiz overrides in one query: {e!r}",
+                extra={"course": str(course), "user": self.display_name},
+            )
+            return {}
+
+    def _get_quiz_overrides(self, course, quiz):
+        """Fetches the overrides of a quiz through the REST API, for
+        quizzes missing from get_quiz_overrides
+
+        Parameters
+        ----------
+        course : canvasapi.course.Course
+        quiz : dict
+            Quiz from get_quiz_data
+
+        Returns
+        -------
+        quiz_override : dict
+            Assignment ID, whether the quiz is a New Quiz and its overrides,
+            as in get_quiz_overrides
+        seconds : float
+            Seconds taken to fetch the quiz's overrides
+        """
+
+        start = time.perf_counter()
+        quiz_assignment = self._get_quiz_assignment(course, quiz)
+        quiz_override = {
+            "assignment_id": quiz_assignment.id,
+            "is_new_quiz": quiz["is_new_quiz"],
+            "overrides": [
+                _from_assignment_override(override)
+                for override in quiz_assignment.get_overrides()
+            ],
+        }
+
+        return quiz_override, time.perf_counter() - start
+
+    def _get_quiz_assignment(self, course, quiz):
+        """Returns a quiz's assignment without a request when its assignment
+        ID is known from get_quiz_data, looking it up once otherwise
+
+        Parameters
+        ----------
+        course : canvasapi.course.Course
+        quiz : dict
+            Quiz from get_quiz_data
+
+        Returns
+        -------
+        canvasapi.assignment.Assignment
+            Assignment with only its ID and course ID
+        """
+
+        key = _get_quiz_key(quiz["is_new_quiz"], quiz["id"])
+        assignment_id = quiz.get("assignment_id") or self._assignment_ids.get(key)
+        if assignment_id is None:
+            # quizzes selected before assignment IDs were recorded
+            if quiz["is_new_quiz"]:
+                assignment_id = quiz["id"]
+            else:
+                assignment_id = course.get_quiz(quiz["id"]).assignment_id
+            self._assignment_ids[key] = assignment_id
+
+        return Assignment(
+            course._requester, {"id": assignment_id, "course_id": course.id}
+        )
 
     def set_extensions_for_new_quiz(self, new_quiz, extensions, course_id):
         quiz_url = f"{self.base_url}api/quiz/v1/courses/{course_id}/quizzes/{new_quiz.id}/accommodations"
@@ -696,7 +941,9 @@ class AccommodationsCanvas(Canvas):
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json",
         }
-        response = requests.post(quiz_url, headers=headers, data=json.dumps(extensions))
+        response = canvas_session.get_session().post(
+            quiz_url, headers=headers, data=json.dumps(extensions)
+        )
         response.raise_for_status()  # raise exception on HTTP error
 
     def add_time_extensions(self, student_groups, quiz_groups, course_id):
@@ -751,14 +998,16 @@ class AccommodationsCanvas(Canvas):
                             }
                         )
 
-                    # set extensions based on quiz type
+                    # set extensions based on quiz type, the quiz is not
+                    # fetched as only its ID is needed
+                    quiz_attributes = {"id": quiz["id"], "course_id": course_id}
                     if quiz["is_new_quiz"]:
-                        new_quiz = course.get_new_quiz(quiz["id"])
+                        new_quiz = NewQuiz(course._requester, quiz_attributes)
                         self.set_extensions_for_new_quiz(
                             new_quiz, extensions, course_id
                         )  # use our own custom function
                     else:
-                        canvas_quiz = course.get_quiz(quiz["id"])
+                        canvas_quiz = Quiz(course._requester, quiz_attributes)
                         canvas_quiz.set_extensions(extensions)  # use built in function
                 except:
                     quiz["time_limit_status"] = "failure"
@@ -775,11 +1024,15 @@ class AccommodationsCanvas(Canvas):
         existing_accommodations,
         should_override,
         course_id,
+        quiz_overrides=None,
     ):
         """
         Applies availability overrides to extend quiz access windows.
 
         Removes matching overrides and replaces them with new ones using adjusted `lock_at` times.
+        Each quiz's assignment comes from get_quiz_data, and when existing
+        overrides are replaced they are read from get_quiz_overrides, only
+        quizzes missing from it being fetched one at a time.
 
         Parameters
         ----------
@@ -793,6 +1046,9 @@ class AccommodationsCanvas(Canvas):
             Whether existing accommodations should be overriden or ignored
         course_id : int
             The Canvas course ID.
+        quiz_overrides : dict, optional
+            Overrides from get_quiz_overrides, fetched if not given and
+            needed.
 
         Returns
         -------
@@ -810,6 +1066,9 @@ class AccommodationsCanvas(Canvas):
         course = self.get_course(course_id)
         status = True  # represents the status of adding - if any adds fail set to false
 
+        if quiz_overrides is None and existing_accommodations and should_override:
+            quiz_overrides = self._try_get_quiz_overrides(course)
+
         for multiplier in ACCOMMODATION_MULTIPLIERS:
             multiplier = str(multiplier)
             student_list = student_groups.get(multiplier, None)
@@ -826,14 +1085,7 @@ class AccommodationsCanvas(Canvas):
                     continue
 
                 try:
-                    quiz_assignment = None
-                    if quiz["is_new_quiz"]:
-                        quiz_assignment = course.get_assignment(quiz["id"])
-                    else:
-                        canvas_quiz = course.get_quiz(quiz["id"])
-                        quiz_assignment = course.get_assignment(
-                            canvas_quiz.assignment_id
-                        )
+                    quiz_assignment = self._get_quiz_assignment(course, quiz)
 
                     override_settings = {
                         "unlock_at": (
@@ -860,10 +1112,16 @@ class AccommodationsCanvas(Canvas):
                     elif should_override:
                         # for the quiz, get all existing overrides
                         # for each existing quiz override, remove the students that need to be overridden by the app
-                        # assignment_overrides = quiz_assignment.get_overrides()
-                        assignment_overrides = quiz_assignment.get_overrides()
-                        for override in assignment_overrides:
-                            override_student_ids = set(override.student_ids)
+                        quiz_key = _get_quiz_key(quiz["is_new_quiz"], quiz["id"])
+                        quiz_override = quiz_overrides.get(quiz_key)
+                        if quiz_override is None:
+                            quiz_override, _ = self._get_quiz_overrides(course, quiz)
+                            quiz_overrides[quiz_key] = quiz_override
+                        # Kept in step with Canvas, as students of a later
+                        # multiplier can share the overrides changed here
+                        overrides = quiz_override["overrides"]
+                        for override in list(overrides):
+                            override_student_ids = set(override["student_ids"])
                             accommodation_student_ids = set(student_user_id_list)
                             new_override_student_ids = list(
                                 override_student_ids.difference(
@@ -878,27 +1136,17 @@ class AccommodationsCanvas(Canvas):
                             ):  # case 1 - override should be modified to have less students
                                 override_new = {
                                     "student_ids": new_override_student_ids,
-                                    "due_at": (
-                                        override.due_at
-                                        if hasattr(override, "due_at")
-                                        else None
-                                    ),
-                                    "unlock_at": (
-                                        override.unlock_at
-                                        if hasattr(override, "unlock_at")
-                                        else None
-                                    ),
-                                    "lock_at": (
-                                        override.lock_at
-                                        if hasattr(override, "lock_at")
-                                        else None
-                                    ),
+                                    "due_at": override["due_at"],
+                                    "unlock_at": override["unlock_at"],
+                                    "lock_at": override["lock_at"],
                                 }
                                 # it would be ideal to call override.edit() but it seems to break - deleting and creating the override works as well
-                                override.delete()
-                                quiz_assignment.create_override(
+                                self._delete_override(quiz_assignment, override)
+                                overrides.remove(override)
+                                created = quiz_assignment.create_override(
                                     assignment_override=override_new
                                 )
+                                overrides.append(_from_assignment_override(created))
                             elif new_override_student_ids and len(
                                 new_override_student_ids
                             ) == len(
@@ -906,12 +1154,14 @@ class AccommodationsCanvas(Canvas):
                             ):  # case 2 - override doesn't have any overlapping students
                                 pass
                             else:
-                                override.delete()
+                                self._delete_override(quiz_assignment, override)
+                                overrides.remove(override)
                         # create our new override with all the students
                         override_settings["student_ids"] = student_user_id_list
                         result = quiz_assignment.create_override(
                             assignment_override=override_settings
                         )
+                        overrides.append(_from_assignment_override(result))
                     else:
                         # remove student user ids from list if there is an entry in the existing accommodations with the current quiz and the student
                         # create new override with the rest of the students
@@ -953,3 +1203,50 @@ class AccommodationsCanvas(Canvas):
         end = time.time()
         print("synchronous execution time for add_availabilities: " + str(end - start))
         return quiz_groups, status
+
+    def _delete_override(self, assignment, override):
+        """Deletes an assignment override from get_quiz_overrides"""
+
+        AssignmentOverride(
+            assignment._requester,
+            {
+                "id": override["id"],
+                "assignment_id": assignment.id,
+                "course_id": assignment.course_id,
+            },
+        ).delete()
+
+
+def _get_quiz_key(is_new_quiz, quiz_id):
+    """Returns the key of a quiz in get_quiz_overrides, as classic quiz and
+    New Quiz IDs can overlap"""
+
+    return is_new_quiz, str(quiz_id)
+
+
+def _from_assignment_override(override):
+    """Converts a canvasapi AssignmentOverride to the dict of ID, student IDs
+    and dates from _to_override"""
+
+    return {
+        "id": override.id,
+        "student_ids": getattr(override, "student_ids", []),
+        "due_at": getattr(override, "due_at", None),
+        "unlock_at": getattr(override, "unlock_at", None),
+        "lock_at": getattr(override, "lock_at", None),
+    }
+
+
+def _to_override(node):
+    """Converts an assignment override node from QUIZ_OVERRIDES_QUERY to the
+    dict of ID, student IDs and dates used for planning overrides, the
+    student IDs are empty for section and group overrides"""
+
+    students = (node.get("set") or {}).get("students") or []
+    return {
+        "id": int(node["_id"]),
+        "student_ids": [int(student["_id"]) for student in students],
+        "due_at": node.get("due_at"),
+        "unlock_at": node.get("unlock_at"),
+        "lock_at": node.get("lock_at"),
+    }
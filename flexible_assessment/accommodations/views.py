@@ -507,10 +507,26 @@ class AccommodationsConfirm(views.AccommodationsListView):
 
         multiplier_quiz_groups = canvas.get_multiplier_quiz_groups(selected_quizzes)
 
-        existing_accommodations = canvas.get_existing_accommodations(
+        existing_accommodations, stats = canvas.get_existing_accommodations(
             accommodations, students, multiplier_quiz_groups, course_id
         )
 
+        course = models.Course.objects.get(pk=course_id)
+        logger.info(
+            "Found %s existing accommodations in %s quizzes in %.1fs, "
+            "%s quizzes fetched separately with %s workers (%s)",
+            len(existing_accommodations),
+            stats["quizzes"],
+            stats["seconds"],
+            stats["fetched"],
+            stats["workers"],
+            ", ".join(
+                "quiz {}: {:.2f}s".format(quiz_id, seconds)
+                for quiz_id, seconds in stats["quiz_seconds"].items()
+            ),
+            extra={"course": str(course), "user": request.session["display_name"]},
+        )
+
         request.session["multiplier_student_groups"] = multiplier_student_groups
         request.session["multiplier_quiz_groups"] = multiplier_quiz_groups
         request.session["existing_accommodations"] = existing_accommodations
@@ -0,0 +1,71 @@
+"""Cursor pagination for Canvas GraphQL queries
+
+FlexCanvas and AccommodationsCanvas page through GraphQL connections the
+same way: each paginated connection selects PAGE_INFO, and get_pages
+queries the next page with $after until Canvas reports no next page.
+"""
+
+from django.core.exceptions import PermissionDenied
+
+PAGE_INFO = """page_info: pageInfo {
+                    has_next_page: hasNextPage
+                    end_cursor: endCursor
+                }"""
+
+
+def get_pages(canvas, query, variables, path, nodes_key, connection=None):
+    """Yields each page of nodes of a cursor-paginated connection
+
+    Parameters
+    ----------
+    canvas : canvasapi.Canvas
+        Canvas API the query is sent with
+    query : str
+        GraphQL query taking $first and $after for the connection
+    variables : dict
+        Query variables other than $after
+    path : tuple
+        Keys leading to the connection in the query response
+    nodes_key : str
+        Alias of the connection nodes
+    connection : Union[dict, None]
+        First page of the connection if it was already fetched, for
+        connections nested in another query
+
+    Yields
+    ------
+    list
+        Nodes in the page
+
+    Raises
+    ------
+    PermissionDenied
+        If a page is missing from the response
+    """
+
+    while True:
+        if connection is None:
+            response = canvas.graphql(query, variables=variables)
+            connection = get_path(response, path)
+
+        nodes = connection.get(nodes_key) if connection is not None else None
+        if nodes is None:
+            raise PermissionDenied
+        yield nodes
+
+        # Responses without page info are complete
+        page_info = connection.get("page_info") or {}
+        if not page_info.get("has_next_page"):
+            return
+        variables = dict(variables, after=page_info["end_cursor"])
+        connection = None
+
+
+def get_path(data, path):
+    """Follows keys through nested dicts, returning None if any is missing"""
+
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
@@ -0,0 +1,90 @@
+"""Process-wide HTTP session for Canvas API requests
+
+FlexCanvas and AccommodationsCanvas send every REST and GraphQL request,
+including those canvasapi makes, through one requests.Session per worker
+process. Its connection pool keeps up to CANVAS_HTTP_POOL_SIZE connections
+to Canvas alive, so the TLS handshake is paid once per connection rather
+than once per request, and requests sent without a timeout get
+CANVAS_HTTP_CONNECT_TIMEOUT and CANVAS_HTTP_READ_TIMEOUT.
+
+The session is shared by every user and thread, so it never stores
+cookies and each request carries its own Authorization header.
+"""
+
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+_session = None
+_lock = threading.Lock()
+
+
+class TimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to requests sent without
+    one"""
+
+    def __init__(self, timeout, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def get_session():
+    """Returns the process-wide Canvas session, creating it on first use
+
+    Returns
+    -------
+    requests.Session
+    """
+
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def close_session():
+    """Closes the pooled connections, a new session is created on next use"""
+
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def use_session(canvas):
+    """Routes the requests canvasapi makes for a Canvas instance through
+    the shared session instead of its own
+
+    Parameters
+    ----------
+    canvas : canvasapi.Canvas
+    """
+
+    canvas._Canvas__requester._session = get_session()
+
+
+def _create_session():
+    session = requests.Session()
+    # Blocks cookies so no user's Canvas cookies are sent for another
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    adapter = TimeoutAdapter(
+        (settings.CANVAS_HTTP_CONNECT_TIMEOUT, settings.CANVAS_HTTP_READ_TIMEOUT),
+        pool_connections=1,
+        pool_maxsize=settings.CANVAS_HTTP_POOL_SIZE,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
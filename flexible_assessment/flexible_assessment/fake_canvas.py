@@ -0,0 +1,1113 @@
+"""Local stand-in for the Canvas APIs this app uses, for load and
+integration tests
+
+    python manage.py run_fake_canvas --port 8001 --latency 0.05
+
+serves the courses in the database, e.g. those made by
+create_synthetic_courses, with synthetic grades and quizzes. With
+CANVAS_DOMAIN=http://localhost:8001/ the app, the grade submission worker
+and the benchmarks send their Canvas requests to it.
+
+It answers the REST endpoints canvasapi calls for the app (courses and
+their settings, users, assignment groups, quizzes and their extensions,
+assignments and their overrides, calendar events), the New Quizzes
+endpoints and OAuth. GraphQL requests are answered by operation name for
+the queries and mutations in instructor/canvas_api.py and
+accommodations/canvas_api.py, so arbitrary GraphQL is not supported.
+
+Like Canvas, lists are paginated with Link headers or GraphQL cursors, and
+each access token has a leaky bucket rate limit. A request holds
+PREFLIGHT_COST of the bucket while it runs and is then charged its cost,
+both reported in X-Request-Cost and X-Rate-Limit-Remaining headers, and
+requests that would overflow the bucket get 403 Rate Limit Exceeded.
+"""
+
+import base64
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from . import synthetic
+from .models import Roles
+
+DEFAULT_PER_PAGE = 10
+MAX_PER_PAGE = 100
+# Canvas rate limit bucket, units it drains per second and the units a
+# request holds while it runs, see instructor/throttle.py
+RATE_LIMIT = 700
+LEAK_RATE = 10
+PREFLIGHT_COST = 50
+REQUEST_COST = 1
+# Extra multiple of the request cost charged per GraphQL mutation
+MUTATION_COST = 0.1
+TOKEN_LIFETIME = 3600
+
+NOT_FOUND = {"errors": [{"message": "The specified resource does not exist."}]}
+
+
+class CanvasState:
+    """Courses, quizzes, overrides and calendar events served by the fake
+    Canvas, changed by the requests it answers
+
+    Every request is handled while holding lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.courses = {}
+        self.calendar_events = {}
+        # Assignment groups, graded assignments and enrollments by ID, for
+        # GraphQL queries that do not name the course
+        self.groups = {}
+        self.assignments = {}
+        self.enrollments = {}
+        self._ids = itertools.count(1)
+
+    def next_id(self):
+        return next(self._ids)
+
+    def add_course(self, course_id, name, payload, users, quizzes=(), new_quizzes=()):
+        """Adds a course
+
+        Parameters
+        ----------
+        course_id : int
+        name : str
+        payload : dict
+            Response to the assignment group queries, as built by
+            synthetic.build_graphql_payload
+        users : list
+            Students as (user ID, display name, login ID)
+        quizzes : Iterable[dict]
+            Classic quizzes, see build_quizzes
+        new_quizzes : Iterable[dict]
+            New Quizzes, see build_quizzes
+        """
+
+        course = {
+            "course": {
+                "id": course_id,
+                "name": name,
+                "course_code": name,
+                "apply_assignment_group_weights": True,
+            },
+            "settings": {
+                "allow_final_grade_override": False,
+                "hide_final_grades": False,
+            },
+            "users": [
+                {
+                    "id": user_id,
+                    "name": display_name,
+                    "sortable_name": display_name,
+                    "short_name": display_name,
+                    "sis_user_id": login_id,
+                    "login_id": login_id,
+                }
+                for user_id, display_name, login_id in users
+            ],
+            "groups": [],
+            "enrollments": [],
+            "quizzes": {},
+            "new_quizzes": {},
+            "assignments": {},
+            "overrides": {},
+            "extensions": {},
+        }
+
+        for node in payload["data"]["course"]["assignment_groups"]["groups"]:
+            group = {
+                "course_id": course_id,
+                "node": {
+                    key: node[key]
+                    for key in ("rules", "group_id", "group_name", "group_weight")
+                    if key in node
+                },
+                "assignments": [],
+                "grades": (node.get("grade_list") or {}).get("grades", []),
+            }
+            for assignment in (node.get("assignment_list") or {}).get(
+                "assignments", []
+            ):
+                assignment = dict(assignment)
+                submissions = assignment.pop("submission_list", None) or {}
+                self.assignments[str(assignment["_id"])] = {
+                    "node": assignment,
+                    "submissions": submissions.get("submissions", []),
+                }
+                group["assignments"].append(assignment)
+            course["groups"].append(group)
+            self.groups[str(node["group_id"])] = group
+
+            for grade in group["grades"]:
+                enrollment_id = str(grade["enrollment"]["_id"])
+                if enrollment_id not in self.enrollments:
+                    enrollment = {"_id": enrollment_id, "override_score": None}
+                    self.enrollments[enrollment_id] = enrollment
+                    course["enrollments"].append(enrollment)
+
+        for quiz in quizzes:
+            course["quizzes"][quiz["id"]] = quiz
+            course["assignments"][quiz["assignment_id"]] = _quiz_assignment(
+                course_id, quiz["assignment_id"], quiz
+            )
+        for quiz in new_quizzes:
+            course["new_quizzes"][quiz["id"]] = quiz
+            assignment_id = int(quiz["id"])
+            course["assignments"][assignment_id] = _quiz_assignment(
+                course_id, assignment_id, quiz
+            )
+
+        self.courses[course_id] = course
+
+    def add_synthetic_course(
+        self,
+        course,
+        seed=0,
+        missing_fraction=0.03,
+        assignment_count=3,
+        quiz_count=5,
+        new_quiz_count=5,
+        payload=None,
+    ):
+        """Adds a course from the database with synthetic grades, see
+        synthetic.build_graphql_payload, and quizzes, see build_quizzes
+
+        Parameters
+        ----------
+        course : Course
+        payload : Union[dict, None]
+            Assignment group response to serve instead of building one
+        """
+
+        if payload is None:
+            payload = synthetic.build_graphql_payload(
+                course,
+                seed=seed,
+                missing_fraction=missing_fraction,
+                assignment_count=assignment_count,
+            )
+        users = course.usercourse_set.filter(role=Roles.STUDENT).values_list(
+            "user_id", "user__display_name", "user__login_id"
+        )
+        self.add_course(
+            course.id,
+            course.title,
+            payload,
+            list(users),
+            build_quizzes(self, quiz_count),
+            build_quizzes(self, new_quiz_count, new=True),
+        )
+
+
+def build_quizzes(state, count, new=False):
+    """Builds timed quizzes, one a day from tomorrow, open for two hours
+    with a one hour time limit
+
+    Parameters
+    ----------
+    state : CanvasState
+        State whose IDs the quizzes take
+    count : int
+    new : bool
+        True for New Quizzes, which are identified by their assignment ID
+
+    Returns
+    -------
+    list
+        Quizzes as Canvas returns them
+    """
+
+    start = datetime.now(timezone.utc).replace(
+        hour=9, minute=0, second=0, microsecond=0
+    )
+    quizzes = []
+    for index in range(count):
+        unlock_at = start + timedelta(days=index + 1)
+        lock_at = unlock_at + timedelta(hours=2)
+        quiz = {
+            "title": "{} {}".format("New Quiz" if new else "Quiz", index + 1),
+            "due_at": _to_iso(lock_at),
+            "unlock_at": _to_iso(unlock_at),
+            "lock_at": _to_iso(lock_at),
+            "published": True,
+            "points_possible": 10.0,
+        }
+        if new:
+            quiz["id"] = str(state.next_id())
+            quiz["quiz_settings"] = {
+                "has_time_limit": True,
+                "session_time_limit_in_seconds": 3600,
+            }
+        else:
+            quiz["id"] = state.next_id()
+            quiz["assignment_id"] = state.next_id()
+            quiz["time_limit"] = 60
+            quiz["html_url"] = "/quizzes/{}".format(quiz["id"])
+        quizzes.append(quiz)
+
+    return quizzes
+
+
+class RateLimiter:
+    """Leaky bucket rate limit for each access token"""
+
+    def __init__(self, limit=RATE_LIMIT, leak_rate=LEAK_RATE):
+        self.limit = limit
+        self.leak_rate = leak_rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def start(self, token):
+        """Holds PREFLIGHT_COST for a request, returning False if the
+        bucket has no room for it"""
+
+        with self._lock:
+            level = self._drain(token)
+            if level + PREFLIGHT_COST > self.limit:
+                return False
+            self._buckets[token] = (level + PREFLIGHT_COST, time.monotonic())
+            return True
+
+    def finish(self, token, cost):
+        """Charges a finished request its cost, returning the units left"""
+
+        with self._lock:
+            level = max(self._drain(token) - PREFLIGHT_COST + cost, 0)
+            self._buckets[token] = (level, time.monotonic())
+            return self.limit - level
+
+    def remaining(self, token):
+        with self._lock:
+            return self.limit - self._drain(token)
+
+    def _drain(self, token):
+        level, updated = self._buckets.get(token, (0, time.monotonic()))
+        return max(level - (time.monotonic() - updated) * self.leak_rate, 0)
+
+
+class FakeCanvasServer(ThreadingHTTPServer):
+    """HTTP server answering Canvas requests from a CanvasState
+
+    Parameters
+    ----------
+    address : tuple
+        (host, port), port 0 picks a free port
+    state : CanvasState
+    latency : float
+        Seconds added to every response
+    jitter : float
+        Up to this many seconds are added at random to every response
+    max_per_page : int
+        Largest page of a list or GraphQL connection
+    rate_limit : int
+        Units in each access token's rate limit bucket
+    leak_rate : float
+        Units each bucket drains per second
+    request_cost : float
+        Units charged for each request, a GraphQL request with n mutations
+        is charged 1 + n * MUTATION_COST times as much
+    verbose : bool
+        True to log every request
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        state,
+        latency=0,
+        jitter=0,
+        max_per_page=MAX_PER_PAGE,
+        rate_limit=RATE_LIMIT,
+        leak_rate=LEAK_RATE,
+        request_cost=REQUEST_COST,
+        verbose=False,
+    ):
+        super().__init__(address, FakeCanvasHandler)
+        self.state = state
+        self.latency = latency
+        self.jitter = jitter
+        self.max_per_page = max_per_page
+        self.rate_limiter = RateLimiter(rate_limit, leak_rate)
+        self.request_cost = request_cost
+        self.verbose = verbose
+
+    @property
+    def url(self):
+        """Base URL to use as CANVAS_DOMAIN"""
+
+        host, port = self.server_address[:2]
+        return "http://{}:{}/".format(host, port)
+
+    def start(self):
+        """Serves requests from a daemon thread, returning the thread"""
+
+        thread = threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeCanvasHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def handle_request(self, method):
+        url = urlsplit(self.path)
+        path = re.sub("/+", "/", url.path)
+        request = Request(method, path, url.query, self._read_body(), self.headers)
+
+        route = _find_route(method, path)
+        if route is None:
+            self._send(404, NOT_FOUND)
+            return
+        view, args, authenticated = route
+
+        if not authenticated:
+            self._wait()
+            with self.server.state.lock:
+                response = view(self.server, request, *args)
+            self._send(*response)
+            return
+
+        token = request.token
+        if not token:
+            self._send(401, {"errors": [{"message": "Invalid access token."}]})
+            return
+        limiter = self.server.rate_limiter
+        if not limiter.start(token):
+            self._send(
+                403,
+                "403 Forbidden (Rate Limit Exceeded)",
+                {
+                    "X-Request-Cost": "0",
+                    "X-Rate-Limit-Remaining": _format_cost(limiter.remaining(token)),
+                },
+            )
+            return
+
+        self._wait()
+        with self.server.state.lock:
+            response = view(self.server, request, *args)
+        status, data = response[:2]
+        headers = response[2] if len(response) > 2 else {}
+        cost = self.server.request_cost * request.cost
+        headers = dict(
+            headers,
+            **{
+                "X-Request-Cost": _format_cost(cost),
+                "X-Rate-Limit-Remaining": _format_cost(limiter.finish(token, cost)),
+            }
+        )
+        self._send(status, data, headers)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _wait(self):
+        delay = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _send(self, status, data, headers=None):
+        if isinstance(data, str):
+            body = data.encode("utf-8")
+            content_type = "text/plain; charset=utf-8"
+        else:
+            body = json.dumps(data).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Request:
+    """Parsed request passed to the views
+
+    Attributes
+    ----------
+    params : dict
+        Query string and form parameters, nested as canvasapi flattens them
+    json : Union[dict, list, None]
+        JSON body
+    cost : float
+        Multiple of the request cost to charge, set by views
+    """
+
+    def __init__(self, method, path, query, body, headers):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.cost = 1
+
+        pairs = parse_qsl(query, keep_blank_values=True)
+        self.json = None
+        content_type = headers.get("Content-Type") or ""
+        if body and "json" in content_type:
+            self.json = json.loads(body)
+        elif body:
+            pairs += parse_qsl(body.decode("utf-8"), keep_blank_values=True)
+        self.params = _parse_params(pairs)
+
+    @property
+    def token(self):
+        authorization = self.headers.get("Authorization") or ""
+        if authorization.startswith("Bearer "):
+            return authorization[len("Bearer ") :].strip()
+        return None
+
+
+# Views take the server, the request and the groups matched in the path, and
+# return (status, data) or (status, data, headers)
+
+
+def get_course(server, request, course_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None:
+        return 404, NOT_FOUND
+    return 200, course["course"]
+
+
+def get_settings(server, request, course_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None:
+        return 404, NOT_FOUND
+    return 200, course["settings"]
+
+
+def update_settings(server, request, course_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None:
+        return 404, NOT_FOUND
+    for key, value in request.params.items():
+        if key in course["settings"]:
+            course["settings"][key] = value
+    return 200, course["settings"]
+
+
+def get_users(server, request, course_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None:
+        return 404, NOT_FOUND
+    return _paginate(server, request, course["users"])
+
+
+def get_assignment_groups(server, request, course_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None:
+        return 404, NOT_FOUND
+    groups = [_assignment_group(group) for group in course["groups"]]
+    return _paginate(server, request, groups)
+
+
+def assignment_group(server, request, course_id, group_id):
+    group = server.state.groups.get(group_id)
+    if group is None or group["course_id"] != int(course_id):
+        return 404, NOT_FOUND
+    if request.method == "PUT" and "group_weight" in request.params:
+        group["node"]["group_weight"] = float(request.params["group_weight"])
+    return 200, _assignment_group(group)
+
+
+def get_quizzes(server, request, course_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None:
+        return 404, NOT_FOUND
+    return _paginate(server, request, list(course["quizzes"].values()))
+
+
+def get_quiz(server, request, course_id, quiz_id):
+    course = server.state.courses.get(int(course_id))
+    quiz = course and course["quizzes"].get(int(quiz_id))
+    if quiz is None:
+        return 404, NOT_FOUND
+    return 200, quiz
+
+
+def set_quiz_extensions(server, request, course_id, quiz_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None or int(quiz_id) not in course["quizzes"]:
+        return 404, NOT_FOUND
+    extensions = request.params.get("quiz_extensions") or []
+    saved = course["extensions"].setdefault(int(quiz_id), {})
+    for extension in extensions:
+        extension = dict(extension, quiz_id=int(quiz_id))
+        saved[extension["user_id"]] = extension
+    return 200, {"quiz_extensions": [saved[e["user_id"]] for e in extensions]}
+
+
+def get_new_quizzes(server, request, course_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None:
+        return 404, NOT_FOUND
+    return _paginate(server, request, list(course["new_quizzes"].values()))
+
+
+def get_new_quiz(server, request, course_id, quiz_id):
+    course = server.state.courses.get(int(course_id))
+    quiz = course and course["new_quizzes"].get(quiz_id)
+    if quiz is None:
+        return 404, NOT_FOUND
+    return 200, quiz
+
+
+def set_new_quiz_accommodations(server, request, course_id, quiz_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None or quiz_id not in course["new_quizzes"]:
+        return 404, NOT_FOUND
+    saved = course["extensions"].setdefault(quiz_id, {})
+    for accommodation in request.json or []:
+        saved[accommodation["user_id"]] = accommodation
+    return 200, {
+        "message": "Accommodations processed",
+        "successful": [{"user_id": a["user_id"]} for a in request.json or []],
+        "failed": [],
+    }
+
+
+def get_assignment(server, request, course_id, assignment_id):
+    course = server.state.courses.get(int(course_id))
+    assignment = course and course["assignments"].get(int(assignment_id))
+    if assignment is None:
+        return 404, NOT_FOUND
+    return 200, assignment
+
+
+def get_overrides(server, request, course_id, assignment_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None or int(assignment_id) not in course["assignments"]:
+        return 404, NOT_FOUND
+    overrides = course["overrides"].get(int(assignment_id), {})
+    return _paginate(server, request, list(overrides.values()))
+
+
+def create_override(server, request, course_id, assignment_id):
+    course = server.state.courses.get(int(course_id))
+    if course is None or int(assignment_id) not in course["assignments"]:
+        return 404, NOT_FOUND
+    settings = request.params.get("assignment_override") or {}
+    student_ids = settings.get("student_ids") or []
+    if not student_ids:
+        return 400, {"errors": {"set": [{"message": "student_ids is required"}]}}
+
+    override = {
+        "id": server.state.next_id(),
+        "assignment_id": int(assignment_id),
+        "course_id": int(course_id),
+        "title": settings.get("title") or "{} students".format(len(student_ids)),
+        "student_ids": student_ids,
+    }
+    # Canvas only returns the dates an override sets
+    for key in ("due_at", "unlock_at", "lock_at"):
+        if settings.get(key) is not None:
+            override[key] = settings[key]
+    course["overrides"].setdefault(int(assignment_id), {})[override["id"]] = override
+    return 201, override
+
+
+def delete_override(server, request, course_id, assignment_id, override_id):
+    course = server.state.courses.get(int(course_id))
+    overrides = course and course["overrides"].get(int(assignment_id), {})
+    if not overrides or int(override_id) not in overrides:
+        return 404, NOT_FOUND
+    return 200, overrides.pop(int(override_id))
+
+
+def calendar_event(server, request, event_id=None):
+    events = server.state.calendar_events
+    if event_id is None:
+        event = dict(request.params.get("calendar_event") or {})
+        event["id"] = server.state.next_id()
+        events[event["id"]] = event
+        return 201, event
+
+    event = events.get(int(event_id))
+    if event is None:
+        return 404, NOT_FOUND
+    if request.method == "PUT":
+        event.update(request.params.get("calendar_event") or {})
+    return 200, event
+
+
+def graphql(server, request):
+    document = request.json or {}
+    query = document.get("query") or ""
+    variables = document.get("variables") or {}
+    match = re.match(r"\s*(?:query|mutation)\s+(\w+)", query)
+    operation = match and GRAPHQL_OPERATIONS.get(match.group(1))
+    if operation is None:
+        message = "Operation not supported by the fake Canvas"
+        return 200, {"errors": [{"message": message}]}
+
+    data = operation(server, request, variables)
+    return 200, {"data": data}
+
+
+def authorize(server, request):
+    redirect_uri = request.params.get("redirect_uri")
+    if not redirect_uri:
+        return 400, {"error": "invalid_request"}
+    params = {"code": "code-{}".format(server.state.next_id())}
+    if request.params.get("state"):
+        params["state"] = request.params["state"]
+    location = "{}?{}".format(redirect_uri, urlencode(params))
+    return 302, "", {"Location": location}
+
+
+def get_token(server, request):
+    token_id = server.state.next_id()
+    return 200, {
+        "access_token": "fake-token-{}".format(token_id),
+        "token_type": "Bearer",
+        "refresh_token": "fake-refresh-{}".format(token_id),
+        "expires_in": TOKEN_LIFETIME,
+        "user": {"id": 1, "name": "Fake Canvas User"},
+    }
+
+
+# GraphQL operations in instructor/canvas_api.py and
+# accommodations/canvas_api.py, answered with their aliases
+
+
+def _groups(server, request, variables):
+    return _get_course_groups(server, variables, flat=False)
+
+
+def _flat_groups(server, request, variables):
+    return _get_course_groups(server, variables, flat=True)
+
+
+def _get_course_groups(server, variables, flat):
+    """Returns a page of a course's assignment groups, with the first page
+    of their grades unless flat, in which case their rules are included"""
+
+    course = server.state.courses.get(_to_int(variables.get("course_id")))
+    if course is None:
+        return {"course": None}
+    page_size = variables.get("page_size")
+    nodes = []
+    for group in course["groups"]:
+        node = dict(group["node"])
+        if not flat:
+            node.pop("rules", None)
+            node["grade_list"] = _connection(
+                server, group["grades"], "grades", page_size
+            )
+        nodes.append(node)
+
+    groups = _connection(
+        server, nodes, "groups", variables.get("first"), variables.get("after")
+    )
+    return {"course": {"assignment_groups": groups}}
+
+
+def _group_grades(server, request, variables):
+    group = server.state.groups.get(str(variables.get("group_id")))
+    if group is None:
+        return {"assignment_group": None}
+    grades = _connection(
+        server,
+        group["grades"],
+        "grades",
+        variables.get("first"),
+        variables.get("after"),
+    )
+    return {"assignment_group": {"grade_list": grades}}
+
+
+def _group_assignments(server, request, variables):
+    group = server.state.groups.get(str(variables.get("group_id")))
+    if group is None:
+        return {"assignment_group": None}
+    nodes = []
+    for assignment in group["assignments"]:
+        submissions = server.state.assignments[str(assignment["_id"])]["submissions"]
+        node = dict(assignment)
+        node["submission_list"] = _connection(
+            server, submissions, "submissions", variables.get("page_size")
+        )
+        nodes.append(node)
+
+    assignments = _connection(
+        server, nodes, "assignments", variables.get("first"), variables.get("after")
+    )
+    return {"assignment_group": {"assignment_list": assignments}}
+
+
+def _assignment_submissions(server, request, variables):
+    assignment = server.state.assignments.get(str(variables.get("assignment_id")))
+    if assignment is None:
+        return {"assignment": None}
+    submissions = _connection(
+        server,
+        assignment["submissions"],
+        "submissions",
+        variables.get("first"),
+        variables.get("after"),
+    )
+    return {"assignment": {"submission_list": submissions}}
+
+
+def _override_scores(server, request, variables):
+    course = server.state.courses.get(_to_int(variables.get("course_id")))
+    if course is None:
+        return {"course": None}
+    nodes = [
+        {
+            "_id": enrollment["_id"],
+            "grades": {"override_score": enrollment["override_score"]},
+        }
+        for enrollment in course["enrollments"]
+    ]
+    enrollments = _connection(
+        server, nodes, "enrollments", variables.get("first"), variables.get("after")
+    )
+    return {"course": {"enrollment_list": enrollments}}
+
+
+def _allow_override(server, request, variables):
+    course = server.state.courses.get(_to_int(variables.get("course_id")))
+    if course is None:
+        return {"course": None}
+    allow = course["settings"]["allow_final_grade_override"]
+    return {"course": {"allowFinalGradeOverride": allow}}
+
+
+def _set_override_scores(server, request, variables):
+    data = {}
+    index = 0
+    while "enrollment_id{}".format(index) in variables:
+        enrollment_id = str(variables["enrollment_id{}".format(index)])
+        override = variables.get("override{}".format(index))
+        enrollment = server.state.enrollments.get(enrollment_id)
+        if enrollment is None:
+            data["o{}".format(index)] = {
+                "grades": None,
+                "errors": [{"message": "enrollment not found"}],
+            }
+        else:
+            enrollment["override_score"] = override
+            data["o{}".format(index)] = {
+                "grades": {"overrideScore": override},
+                "errors": None,
+            }
+        index += 1
+
+    request.cost = 1 + MUTATION_COST * index
+    return data
+
+
+def _quiz_overrides(server, request, variables):
+    course = server.state.courses.get(_to_int(variables.get("course_id")))
+    if course is None:
+        return {"course": None}
+    nodes = []
+    for assignment_id, assignment in course["assignments"].items():
+        quiz_id = assignment.get("quiz_id")
+        overrides = _override_nodes(course, assignment_id)
+        nodes.append(
+            {
+                "_id": str(assignment_id),
+                "quiz": {"_id": str(quiz_id)} if quiz_id else None,
+                "submission_types": assignment["submission_types"],
+                "override_list": _connection(
+                    server, overrides, "overrides", variables.get("page_size")
+                ),
+            }
+        )
+
+    assignments = _connection(
+        server, nodes, "assignments", variables.get("first"), variables.get("after")
+    )
+    return {"course": {"assignment_list": assignments}}
+
+
+def _assignment_overrides(server, request, variables):
+    assignment_id = _to_int(variables.get("assignment_id"))
+    for course in server.state.courses.values():
+        if assignment_id in course["assignments"]:
+            overrides = _connection(
+                server,
+                _override_nodes(course, assignment_id),
+                "overrides",
+                variables.get("first"),
+                variables.get("after"),
+            )
+            return {"assignment": {"override_list": overrides}}
+    return {"assignment": None}
+
+
+def _override_nodes(course, assignment_id):
+    return [
+        {
+            "_id": str(override["id"]),
+            "due_at": override.get("due_at"),
+            "unlock_at": override.get("unlock_at"),
+            "lock_at": override.get("lock_at"),
+            "set": {
+                "students": [
+                    {"_id": str(student_id)} for student_id in override["student_ids"]
+                ]
+            },
+        }
+        for override in course["overrides"].get(assignment_id, {}).values()
+    ]
+
+
+GRAPHQL_OPERATIONS = {
+    "AssignmentGroupQuery": _groups,
+    "FlatAssignmentGroupQuery": _flat_groups,
+    "AssignmentGroupGradesQuery": _group_grades,
+    "AssignmentGroupAssignmentsQuery": _group_assignments,
+    "AssignmentSubmissionsQuery": _assignment_submissions,
+    "OverrideScoresQuery": _override_scores,
+    "AllowOverrideQuery": _allow_override,
+    "OverrideFinalScores": _set_override_scores,
+    "QuizOverridesQuery": _quiz_overrides,
+    "AssignmentOverridesQuery": _assignment_overrides,
+}
+
+# (method, path, view, authenticated), paths are matched in full
+ROUTES = [
+    ("GET", r"/api/v1/courses/(\d+)", get_course, True),
+    ("GET", r"/api/v1/courses/(\d+)/settings", get_settings, True),
+    ("PUT", r"/api/v1/courses/(\d+)/settings", update_settings, True),
+    ("GET", r"/api/v1/courses/(\d+)/search_users", get_users, True),
+    ("GET", r"/api/v1/courses/(\d+)/users", get_users, True),
+    ("GET", r"/api/v1/courses/(\d+)/assignment_groups", get_assignment_groups, True),
+    ("GET", r"/api/v1/courses/(\d+)/assignment_groups/(\d+)", assignment_group, True),
+    ("PUT", r"/api/v1/courses/(\d+)/assignment_groups/(\d+)", assignment_group, True),
+    ("GET", r"/api/v1/courses/(\d+)/quizzes", get_quizzes, True),
+    ("GET", r"/api/v1/courses/(\d+)/quizzes/(\d+)", get_quiz, True),
+    (
+        "POST",
+        r"/api/v1/courses/(\d+)/quizzes/(\d+)/extensions",
+        set_quiz_extensions,
+        True,
+    ),
+    ("GET", r"/api/v1/courses/(\d+)/assignments/(\d+)", get_assignment, True),
+    ("GET", r"/api/v1/courses/(\d+)/assignments/(\d+)/overrides", get_overrides, True),
+    (
+        "POST",
+        r"/api/v1/courses/(\d+)/assignments/(\d+)/overrides",
+        create_override,
+        True,
+    ),
+    (
+        "DELETE",
+        r"/api/v1/courses/(\d+)/assignments/(\d+)/overrides/(\d+)",
+        delete_override,
+        True,
+    ),
+    ("POST", r"/api/v1/calendar_events", calendar_event, True),
+    ("GET", r"/api/v1/calendar_events/(\d+)", calendar_event, True),
+    ("PUT", r"/api/v1/calendar_events/(\d+)", calendar_event, True),
+    ("GET", r"/api/quiz/v1/courses/(\d+)/quizzes", get_new_quizzes, True),
+    ("GET", r"/api/quiz/v1/courses/(\d+)/quizzes/(\d+)", get_new_quiz, True),
+    (
+        "POST",
+        r"/api/quiz/v1/courses/(\d+)/quizzes/(\d+)/accommodations",
+        set_new_quiz_accommodations,
+        True,
+    ),
+    ("POST", r"/api/graphql", graphql, True),
+    ("GET", r"/login/oauth2/auth", authorize, False),
+    ("POST", r"/login/oauth2/token", get_token, False),
+]
+
+
+def _find_route(method, path):
+    """Returns the view for a request with the groups matched in its path
+    and whether it needs an access token, None if no route matches"""
+
+    path = path.rstrip("/") or "/"
+    for route_method, pattern, view, authenticated in ROUTES:
+        if route_method != method:
+            continue
+        match = re.fullmatch(pattern, path)
+        if match:
+            return view, match.groups(), authenticated
+    return None
+
+
+def _paginate(server, request, items):
+    """Returns a page of a REST list with its Link header"""
+
+    try:
+        page = max(int(request.params.get("page", 1)), 1)
+        per_page = int(request.params.get("per_page", DEFAULT_PER_PAGE))
+    except (TypeError, ValueError):
+        return 400, {"errors": [{"message": "invalid page"}]}
+    per_page = min(max(per_page, 1), server.max_per_page)
+    last = max((len(items) + per_page - 1) // per_page, 1)
+    start = (page - 1) * per_page
+
+    def link(number, rel):
+        params = [
+            (key, value)
+            for key, value in parse_qsl(request.query, keep_blank_values=True)
+            if key not in ("page", "per_page")
+        ]
+        params += [("page", number), ("per_page", per_page)]
+        host = request.headers.get("Host") or "localhost"
+        return '<http://{}{}?{}>; rel="{}"'.format(
+            host, request.path, urlencode(params), rel
+        )
+
+    links = [link(page, "current"), link(1, "first"), link(last, "last")]
+    if page < last:
+        links.append(link(page + 1, "next"))
+    if page > 1:
+        links.append(link(page - 1, "prev"))
+
+    return 200, items[start : start + per_page], {"Link": ", ".join(links)}
+
+
+def _connection(server, nodes, nodes_key, first=None, after=None):
+    """Returns a page of a GraphQL connection with its page info, cursors
+    are the encoded offset of the next node"""
+
+    start = _decode_cursor(after) if after else 0
+    size = min(first or server.max_per_page, server.max_per_page)
+    end = min(start + size, len(nodes))
+    return {
+        nodes_key: nodes[start:end],
+        "page_info": {
+            "has_next_page": end < len(nodes),
+            "end_cursor": base64.b64encode(str(end).encode()).decode(),
+        },
+    }
+
+
+def _decode_cursor(cursor):
+    try:
+        return int(base64.b64decode(cursor).decode())
+    except (ValueError, TypeError):
+        return 0
+
+
+def _assignment_group(group):
+    node = group["node"]
+    return {
+        "id": int(node["group_id"]),
+        "name": node.get("group_name"),
+        "group_weight": node.get("group_weight"),
+        "course_id": group["course_id"],
+    }
+
+
+def _quiz_assignment(course_id, assignment_id, quiz):
+    # Classic quizzes have their own ID, New Quizzes are external tools
+    is_new_quiz = "assignment_id" not in quiz
+    return {
+        "id": assignment_id,
+        "quiz_id": None if is_new_quiz else quiz["id"],
+        "submission_types": ["external_tool" if is_new_quiz else "online_quiz"],
+        "course_id": course_id,
+        "name": quiz["title"],
+        "due_at": quiz["due_at"],
+        "unlock_at": quiz["unlock_at"],
+        "lock_at": quiz["lock_at"],
+        "points_possible": quiz["points_possible"],
+        "published": quiz["published"],
+    }
+
+
+def _parse_params(pairs):
+    """Nests query string and form parameters as canvasapi flattens them,
+    e.g. a[b][]=1 becomes {"a": {"b": [1]}} and a[][b]=1&a[][b]=2 becomes
+    {"a": [{"b": 1}, {"b": 2}]}"""
+
+    params = {}
+    for key, value in pairs:
+        match = re.fullmatch(r"([^\[]+)((?:\[[^\]]*\])*)", key)
+        if not match:
+            continue
+        keys = [match.group(1)] + re.findall(r"\[([^\]]*)\]", match.group(2))
+        _set_param(params, keys, _to_value(value))
+    return params
+
+
+def _set_param(container, keys, value):
+    key, rest = keys[0], keys[1:]
+    if key == "":
+        if not rest:
+            container.append(value)
+            return
+        # A repeated key starts the next dict of the list
+        if not container or rest[0] in container[-1]:
+            container.append({})
+        _set_param(container[-1], rest, value)
+        return
+
+    if not rest:
+        container[key] = value
+        return
+    child = container.get(key)
+    if not isinstance(child, (dict, list)):
+        child = container[key] = [] if rest[0] == "" else {}
+    _set_param(child, rest, value)
+
+
+def _to_value(value):
+    """Converts a form value to the type Canvas stores"""
+
+    if value in ("true", "True"):
+        return True
+    if value in ("false", "False"):
+        return False
+    if value in ("", "None", "null"):
+        return None
+    if re.fullmatch(r"-?\d+", value):
+        return int(value)
+    return value
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_iso(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _format_cost(value):
+    return "{:.4f}".format(value)
@@ -0,0 +1,128 @@
+"""Populates the database with synthetic courses for load and query-count
+tests, e.g.
+
+    python manage.py create_synthetic_courses --students 10000 --payload-dir payloads
+
+creates course 90000 with 10,000 students and writes the Canvas GraphQL
+response for its assignment groups to payloads/course_90000.json.
+"""
+
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from flexible_assessment import synthetic
+from flexible_assessment.models import Course, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates synthetic courses with students, assessments, flex "
+        "allocations and comments, and matching Canvas GraphQL payloads"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--courses", type=int, default=1)
+        parser.add_argument("--students", type=int, default=1000)
+        parser.add_argument("--assessments", type=int, default=4)
+        parser.add_argument(
+            "--assignments",
+            type=int,
+            default=3,
+            help="Assignments per assignment group in the GraphQL payload",
+        )
+        parser.add_argument("--first-course-id", type=int, default=90000)
+        parser.add_argument(
+            "--first-user-id",
+            type=int,
+            default=900000000,
+            help="User ID of the first course's instructor, "
+            "students and later courses follow it",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--null-fraction",
+            type=float,
+            default=0.1,
+            help="Fraction of students who have not chosen flex allocations",
+        )
+        parser.add_argument(
+            "--missing-fraction",
+            type=float,
+            default=0.03,
+            help="Fraction of students without a score in each group",
+        )
+        parser.add_argument(
+            "--payload-dir",
+            help="Directory for Canvas GraphQL payloads, not written if not given",
+        )
+        parser.add_argument(
+            "--replace",
+            action="store_true",
+            help="Delete existing courses and users with the same IDs first",
+        )
+
+    def handle(self, *args, **options):
+        if options["students"] < 0 or options["assessments"] < 1:
+            raise CommandError("At least one assessment is required.")
+
+        if options["payload_dir"]:
+            os.makedirs(options["payload_dir"], exist_ok=True)
+
+        users_per_course = options["students"] + 1
+        for index in range(options["courses"]):
+            course_id = options["first_course_id"] + index
+            first_user_id = options["first_user_id"] + index * users_per_course
+            user_ids = range(first_user_id, first_user_id + users_per_course)
+            self.clear(course_id, user_ids, options["replace"])
+
+            start = time.perf_counter()
+            course = synthetic.create_course(
+                course_id,
+                options["students"],
+                options["assessments"],
+                first_user_id=first_user_id,
+                seed=options["seed"] + index,
+                null_fraction=options["null_fraction"],
+            )
+            self.stdout.write(
+                "Created course {} with {} students in {:.2f}s".format(
+                    course_id, options["students"], time.perf_counter() - start
+                )
+            )
+
+            if options["payload_dir"]:
+                payload = synthetic.build_graphql_payload(
+                    course,
+                    seed=options["seed"] + index,
+                    missing_fraction=options["missing_fraction"],
+                    assignment_count=options["assignments"],
+                )
+                path = os.path.join(
+                    options["payload_dir"], "course_{}.json".format(course_id)
+                )
+                with open(path, "w") as f:
+                    json.dump(payload, f)
+                self.stdout.write("Wrote {}".format(path))
+
+    @transaction.atomic
+    def clear(self, course_id, user_ids, replace):
+        """Deletes the course and users about to be created if replace is
+        True, otherwise raises CommandError if any exist"""
+
+        courses = Course.objects.filter(pk=course_id)
+        users = UserProfile.objects.filter(
+            user_id__gte=user_ids.start, user_id__lt=user_ids.stop
+        )
+        if not replace:
+            if courses.exists() or users.exists():
+                raise CommandError(
+                    "Course {} or its user IDs already exist, "
+                    "use --replace to recreate them.".format(course_id)
+                )
+            return
+
+        courses.delete()
+        users.delete()
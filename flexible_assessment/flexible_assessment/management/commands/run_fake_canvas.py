@@ -0,0 +1,125 @@
+"""Runs a local fake Canvas serving the courses in the database, e.g.
+
+    python manage.py create_synthetic_courses --students 2000
+    python manage.py run_fake_canvas --port 8001 --latency 0.05 --jitter 0.05
+
+then run the app, the grade submission worker or the benchmarks with
+CANVAS_DOMAIN=http://localhost:8001/. See flexible_assessment/fake_canvas.py
+for what it answers.
+"""
+
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from flexible_assessment import fake_canvas
+from flexible_assessment.models import Course
+
+
+class Command(BaseCommand):
+    help = "Serves the Canvas APIs the app uses for courses in the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8001)
+        parser.add_argument(
+            "--courses",
+            nargs="+",
+            type=int,
+            help="Course IDs to serve, all courses if not given",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--assignments",
+            type=int,
+            default=3,
+            help="Assignments per assignment group",
+        )
+        parser.add_argument("--quizzes", type=int, default=5)
+        parser.add_argument("--new-quizzes", type=int, default=5)
+        parser.add_argument(
+            "--payload-dir",
+            help="Directory of assignment group responses written by "
+            "create_synthetic_courses, used instead of new ones when present",
+        )
+        parser.add_argument(
+            "--latency", type=float, default=0, help="Seconds added to responses"
+        )
+        parser.add_argument(
+            "--jitter",
+            type=float,
+            default=0,
+            help="Up to this many seconds added at random to responses",
+        )
+        parser.add_argument(
+            "--per-page",
+            type=int,
+            default=fake_canvas.MAX_PER_PAGE,
+            help="Largest page of a list or GraphQL connection",
+        )
+        parser.add_argument(
+            "--rate-limit",
+            type=float,
+            default=fake_canvas.RATE_LIMIT,
+            help="Units in each access token's rate limit bucket",
+        )
+        parser.add_argument(
+            "--leak-rate",
+            type=float,
+            default=fake_canvas.LEAK_RATE,
+            help="Units the rate limit bucket drains per second",
+        )
+        parser.add_argument(
+            "--request-cost",
+            type=float,
+            default=fake_canvas.REQUEST_COST,
+            help="Units charged per request, more for GraphQL mutations",
+        )
+        parser.add_argument("--verbose", action="store_true")
+
+    def handle(self, *args, **options):
+        courses = Course.objects.order_by("id")
+        if options["courses"]:
+            courses = courses.filter(id__in=options["courses"])
+        if not courses:
+            raise CommandError("No courses to serve.")
+
+        state = fake_canvas.CanvasState()
+        for index, course in enumerate(courses):
+            state.add_synthetic_course(
+                course,
+                seed=options["seed"] + index,
+                assignment_count=options["assignments"],
+                quiz_count=options["quizzes"],
+                new_quiz_count=options["new_quizzes"],
+                payload=self.load_payload(options["payload_dir"], course.id),
+            )
+            self.stdout.write("Serving course {}".format(course.id))
+
+        server = fake_canvas.FakeCanvasServer(
+            (options["host"], options["port"]),
+            state,
+            latency=options["latency"],
+            jitter=options["jitter"],
+            max_per_page=options["per_page"],
+            rate_limit=options["rate_limit"],
+            leak_rate=options["leak_rate"],
+            request_cost=options["request_cost"],
+            verbose=options["verbose"],
+        )
+        self.stdout.write("Fake Canvas running at {}".format(server.url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    def load_payload(self, payload_dir, course_id):
+        if not payload_dir:
+            return None
+        path = os.path.join(payload_dir, "course_{}.json".format(course_id))
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
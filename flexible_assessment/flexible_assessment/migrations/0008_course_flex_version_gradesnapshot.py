@@ -0,0 +1,43 @@
+# Generated by Django 4.2.15 on 2026-10-17 11:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("flexible_assessment", "0007_rename_overidden_flexassessment_override"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="flex_version",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="GradeSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("gradebook_hash", models.CharField(max_length=64)),
+                ("flex_version", models.IntegerField()),
+                ("data", models.JSONField()),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "course",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="flexible_assessment.course",
+                    ),
+                ),
+            ],
+        ),
+    ]
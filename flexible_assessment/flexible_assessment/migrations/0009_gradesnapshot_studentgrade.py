@@ -0,0 +1,85 @@
+# Generated by Django 4.2.15 on 2026-10-17 11:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("flexible_assessment", "0008_course_flex_version_gradesnapshot"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="gradesnapshot",
+            name="data",
+        ),
+        migrations.AddField(
+            model_name="gradesnapshot",
+            name="assessment_ids",
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name="gradesnapshot",
+            name="averages",
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name="gradesnapshot",
+            name="default_sum",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="gradesnapshot",
+            name="difference_sum",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="gradesnapshot",
+            name="override_sum",
+            field=models.FloatField(default=0),
+        ),
+        migrations.CreateModel(
+            name="StudentGrade",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("scores", models.JSONField(default=list)),
+                ("default_total", models.FloatField()),
+                ("override_total", models.FloatField(null=True)),
+                ("default", models.DecimalField(decimal_places=3, max_digits=8)),
+                (
+                    "override",
+                    models.DecimalField(decimal_places=3, max_digits=8, null=True),
+                ),
+                (
+                    "snapshot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="flexible_assessment.gradesnapshot",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="studentgrade",
+            constraint=models.UniqueConstraint(
+                fields=("snapshot_id", "user_id"), name="Snapshot and User unique"
+            ),
+        ),
+    ]
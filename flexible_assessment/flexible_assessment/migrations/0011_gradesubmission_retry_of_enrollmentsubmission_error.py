@@ -0,0 +1,28 @@
+# Generated by Django 4.2.15 on 2026-10-17 11:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("flexible_assessment", "0010_gradesubmission_enrollmentsubmission"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="enrollmentsubmission",
+            name="error",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="gradesubmission",
+            name="retry_of",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="retries",
+                to="flexible_assessment.gradesubmission",
+            ),
+        ),
+    ]
@@ -140,6 +140,9 @@ class Course(models.Model):
         Displays for students at the top of Assessments page
     comment_instructions: Textfield
         Displays for students before their comment box
+    flex_version : int
+        Incremented when assessments or flex allocations in the course
+        change, used to invalidate grade snapshots
     """
 
     id = models.IntegerField(primary_key=True)
@@ -157,10 +160,16 @@ class Course(models.Model):
         default="Please enter your reasons for the choices you made.",
     )
     calendar_id = models.IntegerField(null=True, blank=True, default=None)
+    flex_version = models.IntegerField(default=0)
 
     def __str__(self):
         return "{} - {}".format(self.title, self.id)
 
+    def bump_flex_version(self):
+        """Invalidates grade snapshots of the course after flex data changes"""
+
+        bump_flex_version(self.pk)
+
     def set_flex_assessments(self, assessment):
         """Creates flex assessment objects for new assessments in the course"""
 
@@ -185,6 +194,8 @@ class Course(models.Model):
             fas_to_reset.update(flex=None)
             student.usercomment_set.filter(course=self).update(comment="")
 
+        self.bump_flex_version()
+
     def reset_all_students(self):
         """Resets flex allocations for all students in the course"""
 
@@ -194,6 +205,8 @@ class Course(models.Model):
         comments_to_reset = UserComment.objects.filter(course=self)
         comments_to_reset.update(comment="")
 
+        self.bump_flex_version()
+
 
 class UserCourse(models.Model):
     """Table linking users and courses for many-to-many relationship,
@@ -327,3 +340,205 @@ class UserComment(models.Model):
 
     def __str__(self):
         return "{}, {} comment".format(self.user.display_name, self.course.title)
+
+
+class GradeSnapshot(models.Model):
+    """Table of computed final grades for a course, reused while the
+    Canvas gradebook and the course flex data are unchanged
+
+    Per student totals are stored in StudentGrade rows. The sums of the
+    override, default and difference columns are kept so course averages
+    can be adjusted when one student's totals are updated.
+
+    Attributes
+    ----------
+    course : OneToOneField -> Course
+        Course the grades were computed for
+    gradebook_hash : str
+        Hash of the Canvas gradebook the grades were computed from
+    flex_version : int
+        Course flex_version the grades were computed at
+    assessment_ids : JSON
+        Assessment IDs as strings, in the order of StudentGrade scores
+    override_sum : float
+        Sum of override totals, default totals where flex is not valid
+    default_sum : float
+        Sum of default totals
+    difference_sum : float
+        Sum of override minus default totals, 0 where flex is not valid
+    averages : JSON
+        Override, default and difference averages as strings
+    updated : DateTime
+        Time the snapshot was last computed
+    """
+
+    course = models.OneToOneField(Course, on_delete=models.CASCADE)
+    gradebook_hash = models.CharField(max_length=64)
+    flex_version = models.IntegerField()
+    assessment_ids = models.JSONField(default=list)
+    override_sum = models.FloatField(default=0)
+    default_sum = models.FloatField(default=0)
+    difference_sum = models.FloatField(default=0)
+    averages = models.JSONField(default=list)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{} grades, version {}".format(self.course.title, self.flex_version)
+
+
+class StudentGrade(models.Model):
+    """Table of a student's computed final grades in a grade snapshot
+
+    Attributes
+    ----------
+    snapshot : ForeignKey -> GradeSnapshot
+        Grade snapshot the totals belong to
+    user : ForeignKey -> UserProfile
+        Student
+    scores : JSON
+        Assessment group score for each of the snapshot assessments,
+        None where there is no score
+    default_total : float
+        Unrounded default total
+    override_total : float
+        Unrounded override total, null if flex allocation is not valid
+    default : Decimal
+        Default total rounded to 3 decimal places
+    override : Decimal
+        Override total rounded to 3 decimal places, null if flex
+        allocation is not valid
+    """
+
+    snapshot = models.ForeignKey(GradeSnapshot, on_delete=models.CASCADE)
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
+    scores = models.JSONField(default=list)
+    default_total = models.FloatField()
+    override_total = models.FloatField(null=True)
+    default = models.DecimalField(max_digits=8, decimal_places=3)
+    override = models.DecimalField(max_digits=8, decimal_places=3, null=True)
+
+    class Meta:
+        constraints = [
+            models.constraints.UniqueConstraint(
+                fields=["snapshot_id", "user_id"], name="Snapshot and User unique"
+            )
+        ]
+
+    def __str__(self):
+        return "{}, {}".format(self.user.display_name, self.snapshot)
+
+
+class JobStatus(models.TextChoices):
+    """States of a background grade submission"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class EnrollmentStatus(models.TextChoices):
+    """States of one student's final grade in a grade submission"""
+
+    PENDING = "pending"
+    SUBMITTED = "submitted"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+
+class GradeSubmission(models.Model):
+    """Table of final grade submissions to Canvas, queued by the final
+    grades page and run by the run_grade_submissions worker
+
+    Attributes
+    ----------
+    course : ForeignKey -> Course
+        Course whose final grades are submitted
+    user : ForeignKey -> UserProfile
+        Instructor who submitted, whose Canvas token is used
+    flat : bool
+        True if assignment groups are scored with flat grading
+    hide_totals : bool
+        Value of the Canvas 'Hide totals in student grades summary' setting
+        applied once all grades are submitted
+    redirect_uri : str
+        Canvas OAuth callback URI, used to refresh the instructor's token
+    retry_of : ForeignKey -> GradeSubmission
+        Submission whose failed grades are sent again, null if all final
+        grades are submitted
+    status : str
+        Queued, running, done or failed
+    error : str
+        Reason the submission failed
+    created : DateTime
+        Time the submission was queued
+    started : DateTime
+        Time the worker started the submission
+    finished : DateTime
+        Time the submission was done or failed
+    """
+
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
+    flat = models.BooleanField(default=False)
+    hide_totals = models.BooleanField(default=True)
+    redirect_uri = models.CharField(max_length=255)
+    retry_of = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, null=True, related_name="retries"
+    )
+    status = models.CharField(
+        max_length=10, choices=JobStatus.choices, default=JobStatus.QUEUED
+    )
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return "{} grade submission, {}".format(self.course.title, self.status)
+
+
+class EnrollmentSubmission(models.Model):
+    """Table of each student's final grade in a grade submission
+
+    Attributes
+    ----------
+    submission : ForeignKey -> GradeSubmission
+        Grade submission the grade belongs to
+    user : ForeignKey -> UserProfile
+        Student
+    enrollment_id : str
+        Canvas enrollment ID of the student
+    override : Decimal
+        Final grade override sent to Canvas
+    status : str
+        Pending, submitted, skipped if Canvas already has the override,
+        or failed
+    error : str
+        Reason the override could not be submitted
+    """
+
+    submission = models.ForeignKey(
+        GradeSubmission, on_delete=models.CASCADE, related_name="enrollments"
+    )
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
+    enrollment_id = models.CharField(max_length=20)
+    override = models.DecimalField(max_digits=5, decimal_places=2)
+    status = models.CharField(
+        max_length=10,
+        choices=EnrollmentStatus.choices,
+        default=EnrollmentStatus.PENDING,
+    )
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return "{}, {}".format(self.user.display_name, self.status)
+
+
+def bump_flex_version(course_id):
+    """Increments course flex_version and deletes its grade snapshot"""
+
+    Course.objects.filter(pk=course_id).update(
+        flex_version=models.F("flex_version") + 1
+    )
+    GradeSnapshot.objects.filter(course_id=course_id).delete()
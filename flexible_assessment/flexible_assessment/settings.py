@@ -69,6 +69,15 @@ CANVAS_OAUTH_SCOPES = [
 ]
 CANVAS_OAUTH_TOKEN_EXPIRATION_BUFFER = timedelta()
 
+# Seconds Canvas gradebooks are cached for, see instructor.gradebook_cache
+CANVAS_CACHE_TTL = int(os.environ.get("CANVAS_CACHE_TTL", 300))
+
+# Connections kept open to Canvas per worker process and seconds to wait for
+# Canvas to connect and respond, see flexible_assessment.canvas_session
+CANVAS_HTTP_POOL_SIZE = int(os.environ.get("CANVAS_HTTP_POOL_SIZE", 16))
+CANVAS_HTTP_CONNECT_TIMEOUT = float(os.environ.get("CANVAS_HTTP_CONNECT_TIMEOUT", 5))
+CANVAS_HTTP_READ_TIMEOUT = float(os.environ.get("CANVAS_HTTP_READ_TIMEOUT", 60))
+
 LTI_CONFIG = "flexible_assessment.json"
 
 ROOT_URLCONF = "flexible_assessment.urls"
@@ -121,6 +130,24 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The canvas cache is shared by all workers, create its table with
+# python manage.py createcachetable
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "canvas": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "canvas_cache",
+        "TIMEOUT": CANVAS_CACHE_TTL,
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -1,7 +1,15 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from instructor import grade_snapshot
 
-from .models import FlexAssessment, UserCourse, Roles
+from .models import (
+    Assessment,
+    Course,
+    FlexAssessment,
+    Roles,
+    UserCourse,
+    bump_flex_version,
+)
 
 
 @receiver(post_save, sender=UserCourse)
@@ -16,3 +24,33 @@ def add_flex_assessments(sender, instance, created, **kwargs):
             for assessment in assessments
         ]
         FlexAssessment.objects.bulk_create(flex_assessments)
+
+
+@receiver(post_save, sender=FlexAssessment)
+def update_grades_on_flex_change(sender, instance, **kwargs):
+    """Updates the student's totals in the grade snapshot when their flex
+    allocation changes"""
+
+    course_id = (
+        Assessment.objects.filter(pk=instance.assessment_id)
+        .values_list("course_id", flat=True)
+        .first()
+    )
+    if course_id is not None:
+        grade_snapshot.update_student_grades(course_id, instance.user_id)
+
+
+@receiver(post_save, sender=Assessment)
+@receiver(post_delete, sender=Assessment)
+def invalidate_grades_on_assessment_change(sender, instance, **kwargs):
+    """Invalidates grade snapshot when assessments in the course change"""
+
+    bump_flex_version(instance.course_id)
+
+
+@receiver(post_save, sender=Course)
+def invalidate_grades_on_course_change(sender, instance, created, **kwargs):
+    """Invalidates grade snapshot when the course changes"""
+
+    if not created:
+        bump_flex_version(instance.pk)
@@ -0,0 +1,337 @@
+"""Synthetic courses for benchmarks and load tests
+
+Rows are created with bulk inserts, so the post_save signals that keep
+flex assessments and grade snapshots in sync are not sent.
+"""
+
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+
+from .models import (
+    Assessment,
+    Course,
+    FlexAssessment,
+    Roles,
+    UserComment,
+    UserCourse,
+    UserProfile,
+)
+
+BATCH_SIZE = 2000
+
+
+@transaction.atomic
+def create_course(
+    course_id,
+    student_count,
+    assessment_count=4,
+    first_user_id=None,
+    seed=0,
+    null_fraction=0.1,
+):
+    """Creates a course with an instructor, students, assessments, flex
+    allocations and comments
+
+    Assessment defaults split 100 as evenly as possible, with min and max
+    10 either side. Students move a random amount of their allocation from
+    one assessment to another, except null_fraction of them who have not
+    chosen and have null flex allocations.
+
+    Parameters
+    ----------
+    course_id : int
+        Canvas course ID to use
+    student_count : int
+        Number of students
+    assessment_count : int
+        Number of assessments, matched to assignment groups
+        course_id * 100 + 1, course_id * 100 + 2, ...
+    first_user_id : Union[int, None]
+        User ID of the instructor, students follow it. Defaults to
+        course_id * 100000
+    seed : int
+        Random seed
+    null_fraction : float
+        Fraction of students without flex allocations
+
+    Returns
+    -------
+    course : Course
+    """
+
+    rng = np.random.default_rng(seed)
+    if first_user_id is None:
+        first_user_id = course_id * 100000
+
+    course = Course.objects.create(id=course_id, title="Synthetic {}".format(course_id))
+
+    instructor = UserProfile(
+        user_id=first_user_id,
+        login_id="instructor{}".format(first_user_id),
+        display_name="Instructor {}".format(first_user_id),
+    )
+    students = [
+        UserProfile(
+            user_id=user_id,
+            login_id="student{}".format(user_id),
+            display_name="Student {}".format(user_id),
+        )
+        for user_id in range(first_user_id + 1, first_user_id + 1 + student_count)
+    ]
+    UserProfile.objects.bulk_create([instructor] + students, batch_size=BATCH_SIZE)
+
+    # IDs are set directly since related object descriptors dominate
+    # the cost of building this many rows
+    UserCourse.objects.bulk_create(
+        [UserCourse(user_id=first_user_id, course_id=course_id, role=Roles.TEACHER)]
+        + [
+            UserCourse(user_id=student.user_id, course_id=course_id, role=Roles.STUDENT)
+            for student in students
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    # Allocations are in hundredths so they sum to exactly 100
+    defaults = np.full(assessment_count, 10000 // assessment_count)
+    defaults[: 10000 % assessment_count] += 1
+    mins = np.maximum(defaults - 1000, 0)
+    maxs = np.minimum(defaults + 1000, 10000)
+
+    assessments = [
+        Assessment(
+            title="Assessment {}".format(index + 1),
+            default=_to_percent(defaults[index]),
+            min=_to_percent(mins[index]),
+            max=_to_percent(maxs[index]),
+            course=course,
+            group=course_id * 100 + index + 1,
+            order=index,
+        )
+        for index in range(assessment_count)
+    ]
+    Assessment.objects.bulk_create(assessments)
+
+    flexes = _random_flexes(rng, student_count, defaults, mins, maxs)
+    chose = rng.random(student_count) >= null_fraction
+    percents = {value: _to_percent(value) for value in np.unique(flexes)}
+    FlexAssessment.objects.bulk_create(
+        [
+            FlexAssessment(
+                user_id=student.user_id,
+                assessment_id=assessment.id,
+                flex=percents[flex] if chose[row] else None,
+            )
+            for row, student in enumerate(students)
+            for assessment, flex in zip(assessments, flexes[row])
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    UserComment.objects.bulk_create(
+        [
+            UserComment(
+                user_id=student.user_id,
+                course_id=course_id,
+                comment="Comment {}".format(student.user_id) if chose[row] else "",
+            )
+            for row, student in enumerate(students)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    return course
+
+
+def build_groups(course, seed=0, missing_fraction=0.03, assignment_count=3):
+    """Builds Canvas assignment groups and enrollments for a course, as
+    returned by FlexCanvas.get_groups_and_enrollments
+
+    Group scores are those reported by build_graphql_payload with the same
+    arguments.
+
+    Parameters
+    ----------
+    course : Course
+        Course with students and assessments matched to groups
+    seed : int
+        Random seed
+    missing_fraction : float
+        Fraction of students without a score in each group
+    assignment_count : int
+        Number of assignments in each group
+
+    Returns
+    -------
+    group_dict : dict
+        Contains assignment group and grades data
+    user_enrollment_dict : dict
+        Contains enrollment ID for each user
+    """
+
+    students, assessments, _, group_scores = _get_scores(
+        course, seed, missing_fraction, assignment_count
+    )
+
+    group_dict = {}
+    for index, assessment in enumerate(assessments):
+        grades = [
+            (str(user_id), None if np.isnan(score) else float(score))
+            for (user_id, _), score in zip(students, group_scores[index])
+        ]
+        group_dict[str(assessment.group)] = {
+            "group_name": assessment.title,
+            "group_weight": float(assessment.default),
+            "grade_list": {"grades": grades},
+        }
+
+    user_enrollment_dict = {
+        str(user_id): _enrollment_id(user_id) for user_id, _ in students
+    }
+
+    return group_dict, user_enrollment_dict
+
+
+def build_graphql_payload(course, seed=0, missing_fraction=0.03, assignment_count=3):
+    """Builds the Canvas GraphQL response to the assignment group query in
+    FlexCanvas.get_flat_groups_and_enrollments for a course
+
+    Each group has assignment_count published assignments worth 10 points.
+    Its current score is the average of the assignment percentages rounded
+    to 2 decimal places, so flat and regular grading agree to within 0.005. The response also answers the query in
+    FlexCanvas.get_groups_and_enrollments, which ignores the extra fields.
+
+    Parameters
+    ----------
+    course : Course
+        Course with students and assessments matched to groups
+    seed : int
+        Random seed
+    missing_fraction : float
+        Fraction of students without a score in each group
+    assignment_count : int
+        Number of assignments in each group
+
+    Returns
+    -------
+    dict
+        GraphQL response data
+    """
+
+    students, assessments, assignment_scores, group_scores = _get_scores(
+        course, seed, missing_fraction, assignment_count
+    )
+
+    groups = []
+    for index, assessment in enumerate(assessments):
+        missing = np.isnan(group_scores[index])
+        assignments = []
+        for number in range(assignment_count):
+            scores = assignment_scores[index, number]
+            assignment_id = str(assessment.group * 100 + number + 1)
+            submissions = [
+                {
+                    "score": None if missing[column] else float(scores[column]) / 10,
+                    "user_id": str(user_id),
+                }
+                for column, (user_id, _) in enumerate(students)
+            ]
+            assignments.append(
+                {
+                    "_id": assignment_id,
+                    "max_score": 10.0,
+                    "name": "{} {}".format(assessment.title, number + 1),
+                    "published": True,
+                    "gradingType": "points",
+                    "omitFromFinalGrade": False,
+                    "submission_list": {"submissions": submissions},
+                }
+            )
+
+        grades = [
+            {
+                "current_score": None if missing[column] else float(score),
+                "enrollment": {
+                    "_id": _enrollment_id(user_id),
+                    "user": {"user_id": str(user_id), "display_name": display_name},
+                },
+            }
+            for column, ((user_id, display_name), score) in enumerate(
+                zip(students, group_scores[index])
+            )
+        ]
+
+        groups.append(
+            {
+                "rules": {"dropHighest": None, "dropLowest": None, "neverDrop": None},
+                "group_id": str(assessment.group),
+                "group_name": assessment.title,
+                "group_weight": float(assessment.default),
+                "assignment_list": {"assignments": assignments},
+                "grade_list": {"grades": grades},
+            }
+        )
+
+    return {"data": {"course": {"assignment_groups": {"groups": groups}}}}
+
+
+def _get_scores(course, seed, missing_fraction, assignment_count):
+    """Draws assignment percentages around a score for each student and
+    group, and group scores as their average, NaN where missing
+
+    Returns students as (user ID, display name), assessments in order,
+    groups x assignments x students assignment percentages and groups x
+    students group scores
+    """
+
+    rng = np.random.default_rng(seed)
+    students = list(
+        course.usercourse_set.filter(role=Roles.STUDENT)
+        .order_by("user_id")
+        .values_list("user_id", "user__display_name")
+    )
+    assessments = list(course.assessment_set.order_by("order"))
+    shape = (len(assessments), len(students))
+
+    ability = np.clip(rng.normal(75, 12, shape), 0, 100)
+    noise = rng.normal(0, 8, (len(assessments), assignment_count, len(students)))
+    assignment_scores = np.round(np.clip(ability[:, np.newaxis, :] + noise, 0, 100), 2)
+    if assignment_count:
+        group_scores = np.round(assignment_scores.mean(axis=1), 2)
+    else:
+        group_scores = np.round(ability, 2)
+    group_scores[rng.random(shape) < missing_fraction] = np.nan
+
+    return students, assessments, assignment_scores, group_scores
+
+
+def _enrollment_id(user_id):
+    return str(user_id + 50000000)
+
+
+def _to_percent(hundredths):
+    return Decimal(int(hundredths)).scaleb(-2)
+
+
+def _random_flexes(rng, student_count, defaults, mins, maxs):
+    """Moves a random amount of each student's allocation from one
+    assessment to another, keeping it within the bounds"""
+
+    assessment_count = len(defaults)
+    flexes = np.tile(defaults, (student_count, 1))
+    if assessment_count < 2 or student_count == 0:
+        return flexes
+
+    rows = np.arange(student_count)
+    source = rng.integers(0, assessment_count, student_count)
+    target = (
+        source + rng.integers(1, assessment_count, student_count)
+    ) % assessment_count
+    room = np.minimum(defaults[source] - mins[source], maxs[target] - defaults[target])
+    # Move whole percentages
+    amount = (rng.random(student_count) * (room // 100 + 1)).astype(int) * 100
+    flexes[rows, source] -= amount
+    flexes[rows, target] += amount
+
+    return flexes
@@ -1,6 +1,7 @@
 from unittest.mock import patch
 from functools import wraps
 from canvasapi.calendar_event import CalendarEvent
+from instructor.gradebook import GradeBook
 
 
 def use_mock_canvas(location="instructor.views.FlexCanvas"):
@@ -136,6 +137,14 @@ class MockFlexCanvas(MockCanvas):
         self.groups_dict = {str(group.id): group for group in self.get_course(1).groups}
         self.calendar_item = None
         self.allow_override = False
+        self.overrides = {}
+
+    def get_gradebook(self, course_id, flat=False):
+        if flat:
+            groups, enrollments = self.get_flat_groups_and_enrollments(course_id)
+        else:
+            groups, enrollments = self.get_groups_and_enrollments(course_id)
+        return GradeBook.from_groups(groups, enrollments)
 
     def get_groups_and_enrollments(self, course_id):
         dict = {k: v.asdict() for k, v in self.groups_dict.items()}
@@ -152,6 +161,23 @@ class MockFlexCanvas(MockCanvas):
     def is_allow_override(self, course_id):
         return self.allow_override
 
+    def get_override_scores(self, course_id):
+        return dict(self.overrides)
+
+    def set_overrides(self, overrides, on_batch=None):
+        self.overrides.update(overrides)
+        if on_batch is not None:
+            on_batch(list(overrides), {})
+        stats = {
+            "submitted": len(overrides),
+            "requests": 1,
+            "seconds": 0,
+            "per_second": 0,
+            "peak_workers": 1,
+            "throttled": 0,
+        }
+        return {}, stats
+
     def create_calendar_event(self, calendar_event):
         self.calendar_item = MockCalendarEvent(calendar_event)
         return self.calendar_item
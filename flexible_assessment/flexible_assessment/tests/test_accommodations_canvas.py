@@ -0,0 +1,346 @@
+import warnings
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from accommodations.canvas_api import AccommodationsCanvas
+from canvasapi.course import Course
+from canvasapi.exceptions import Forbidden
+from django.test import TestCase, override_settings
+from flexible_assessment import fake_canvas, synthetic
+
+STUDENT_IDS = [96000001, 96000002, 96000003]
+
+
+@patch("accommodations.canvas_api.get_oauth_token", return_value="token")
+class TestAccommodationsCanvas(TestCase):
+    def setUp(self):
+        course = synthetic.create_course(960, 4, 2, seed=2)
+        self.state = fake_canvas.CanvasState()
+        self.state.add_synthetic_course(course, quiz_count=3, new_quiz_count=2)
+
+        server = fake_canvas.FakeCanvasServer(
+            ("127.0.0.1", 0), self.state, max_per_page=2
+        )
+        server.start()
+        self.addCleanup(server.stop)
+        settings = override_settings(CANVAS_DOMAIN=server.url)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        warnings.filterwarnings("ignore", "Canvas may respond unexpectedly")
+        self.addCleanup(warnings.resetwarnings)
+
+        self.students = [
+            SimpleNamespace(
+                user_id=user_id,
+                login_id="student{}".format(user_id),
+                display_name="Student {}".format(index),
+            )
+            for index, user_id in enumerate(STUDENT_IDS)
+        ]
+        # The last student has no accommodation
+        self.accommodations = [
+            (student.login_id, "3.0", student.user_id, "3.0x", None)
+            for student in self.students[:2]
+        ]
+
+    def select_quizzes(self, canvas):
+        """Returns the course's quizzes as the quiz selection page does"""
+
+        quizzes, _ = canvas.get_quiz_data(960)
+        for quiz in quizzes:
+            quiz["add_time_after"] = True
+            quiz["add_buffer"] = False
+        return quizzes
+
+    def get_assignment(self, canvas, quiz):
+        course = canvas.get_course(960)
+        if quiz["is_new_quiz"]:
+            return course.get_assignment(quiz["id"])
+        return course.get_assignment(course.get_quiz(quiz["id"]).assignment_id)
+
+    def add_overrides(self, canvas, quizzes, student_ids=STUDENT_IDS):
+        for quiz in quizzes:
+            self.get_assignment(canvas, quiz).create_override(
+                assignment_override={
+                    "student_ids": student_ids,
+                    "unlock_at": quiz["unlock_at"],
+                    "lock_at": quiz["lock_at"],
+                }
+            )
+
+    def test_overrides_of_every_quiz_are_found(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes = self.select_quizzes(canvas)
+        # Quizzes without an override are still checked
+        self.add_overrides(canvas, quizzes[1:])
+        quiz_groups = canvas.get_multiplier_quiz_groups(quizzes)
+
+        existing, stats = canvas.get_existing_accommodations(
+            self.accommodations, self.students, quiz_groups, 960
+        )
+
+        self.assertEqual(len(existing), 2 * (len(quizzes) - 1))
+        self.assertEqual(
+            [(e["title"], e["display_name"]) for e in existing],
+            sorted(
+                (quiz["title"], student.display_name)
+                for quiz in quizzes[1:]
+                for student in self.students[:2]
+            ),
+        )
+        self.assertEqual(existing[0]["unlock_at_override"], existing[0]["unlock_at"])
+        self.assertEqual(existing[0]["lock_at_override"], existing[0]["lock_at"])
+        self.assertEqual(stats["quizzes"], len(quizzes))
+        self.assertEqual(stats["fetched"], 0)
+
+    def test_missing_quizzes_are_fetched_separately(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes = self.select_quizzes(canvas)
+        self.add_overrides(canvas, quizzes)
+        quiz_groups = canvas.get_multiplier_quiz_groups(quizzes)
+
+        existing, _ = canvas.get_existing_accommodations(
+            self.accommodations, self.students, quiz_groups, 960
+        )
+        with patch("accommodations.canvas_api.OVERRIDE_WORKERS", 2):
+            fetched, stats = canvas.get_existing_accommodations(
+                self.accommodations, self.students, quiz_groups, 960, {}
+            )
+
+        self.assertEqual(fetched, existing)
+        self.assertEqual(stats["fetched"], len(quizzes))
+        self.assertEqual(stats["workers"], 2)
+        self.assertEqual(set(stats["quiz_seconds"]), {quiz["id"] for quiz in quizzes})
+
+    def test_quiz_overrides_are_read_in_pages(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes = self.select_quizzes(canvas)
+        # More overrides than fit in a page
+        for student_id in STUDENT_IDS:
+            self.add_overrides(canvas, quizzes[:1], [student_id])
+
+        with patch.object(
+            AccommodationsCanvas, "graphql", wraps=canvas.graphql
+        ) as graphql:
+            quiz_overrides = canvas.get_quiz_overrides(960)
+
+        self.assertGreater(graphql.call_count, 1)
+        self.assertEqual(len(quiz_overrides), len(quizzes))
+        for quiz in quizzes:
+            quiz_override = quiz_overrides[(quiz["is_new_quiz"], str(quiz["id"]))]
+            self.assertEqual(
+                quiz_override["assignment_id"], self.get_assignment(canvas, quiz).id
+            )
+            self.assertEqual(quiz_override["is_new_quiz"], quiz["is_new_quiz"])
+
+        overrides = quiz_overrides[(quizzes[0]["is_new_quiz"], str(quizzes[0]["id"]))][
+            "overrides"
+        ]
+        self.assertEqual(
+            [override["student_ids"] for override in overrides],
+            [[student_id] for student_id in STUDENT_IDS],
+        )
+        self.assertEqual(overrides[0]["lock_at"], quizzes[0]["lock_at"])
+        self.assertIsNone(overrides[0]["due_at"])
+
+    def test_availabilities_replace_overlapping_overrides(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes = [
+            next(
+                quiz for quiz in self.select_quizzes(canvas) if not quiz["is_new_quiz"]
+            )
+        ]
+        assignment = self.get_assignment(canvas, quizzes[0])
+        self.add_overrides(canvas, quizzes, STUDENT_IDS[1:])
+        quiz_groups = canvas.get_multiplier_quiz_groups(quizzes)
+        student_groups = canvas.get_multiplier_student_groups(
+            self.accommodations, self.students
+        )
+        existing, _ = canvas.get_existing_accommodations(
+            self.accommodations, self.students, quiz_groups, 960
+        )
+
+        with patch("canvasapi.course.Course.get_quiz") as get_quiz, patch(
+            "canvasapi.course.Course.get_assignment"
+        ) as get_assignment:
+            _, status = canvas.add_availabilities(
+                student_groups, quiz_groups, existing, True, 960
+            )
+
+        self.assertTrue(status)
+        # The quiz's assignment comes from get_quiz_overrides
+        get_quiz.assert_not_called()
+        get_assignment.assert_not_called()
+        overrides = {
+            tuple(override.student_ids): override
+            for override in assignment.get_overrides()
+        }
+        # The accommodated student is moved out of the existing override
+        self.assertEqual(set(overrides), {(STUDENT_IDS[2],), tuple(STUDENT_IDS[:2])})
+        self.assertEqual(overrides[(STUDENT_IDS[2],)].lock_at, quizzes[0]["lock_at"])
+        self.assertEqual(
+            overrides[tuple(STUDENT_IDS[:2])].lock_at,
+            quiz_groups["3.0"][0]["lock_at_new"],
+        )
+
+    def test_availabilities_split_override_shared_by_multipliers(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes = self.select_quizzes(canvas)
+        # Every student shares one override
+        self.add_overrides(canvas, quizzes)
+        quiz_groups = canvas.get_multiplier_quiz_groups(quizzes)
+        accommodations = self.accommodations[:1] + [
+            (self.students[1].login_id, "4.0", self.students[1].user_id, "4.0x", None)
+        ]
+        student_groups = canvas.get_multiplier_student_groups(
+            accommodations, self.students
+        )
+        existing, _ = canvas.get_existing_accommodations(
+            accommodations, self.students, quiz_groups, 960
+        )
+
+        _, status = canvas.add_availabilities(
+            student_groups, quiz_groups, existing, True, 960
+        )
+
+        self.assertTrue(status)
+        for quiz in quizzes:
+            overrides = {
+                tuple(override.student_ids): override
+                for override in self.get_assignment(canvas, quiz).get_overrides()
+            }
+            self.assertEqual(
+                set(overrides),
+                {(STUDENT_IDS[0],), (STUDENT_IDS[1],), (STUDENT_IDS[2],)},
+            )
+            self.assertEqual(overrides[(STUDENT_IDS[2],)].lock_at, quiz["lock_at"])
+            for student_id, multiplier in zip(STUDENT_IDS, ["3.0", "4.0"]):
+                quiz_group = next(
+                    group
+                    for group in quiz_groups[multiplier]
+                    if group["id"] == quiz["id"]
+                )
+                self.assertEqual(
+                    overrides[(student_id,)].lock_at, quiz_group["lock_at_new"]
+                )
+
+    def test_existing_accommodations_fall_back_when_quiz_overrides_fail(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes = self.select_quizzes(canvas)
+        self.add_overrides(canvas, quizzes)
+        quiz_groups = canvas.get_multiplier_quiz_groups(quizzes)
+        existing, _ = canvas.get_existing_accommodations(
+            self.accommodations, self.students, quiz_groups, 960
+        )
+
+        with patch.object(
+            AccommodationsCanvas, "get_quiz_overrides", side_effect=Forbidden("")
+        ), self.assertLogs("accommodations.canvas_api", "WARNING"):
+            fetched, stats = canvas.get_existing_accommodations(
+                self.accommodations, self.students, quiz_groups, 960
+            )
+
+        # Each quiz's overrides are fetched separately instead
+        self.assertEqual(fetched, existing)
+        self.assertEqual(stats["fetched"], len(quizzes))
+
+    def test_availabilities_fall_back_when_quiz_overrides_fail(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes = self.select_quizzes(canvas)
+        self.add_overrides(canvas, quizzes, STUDENT_IDS[1:])
+        quiz_groups = canvas.get_multiplier_quiz_groups(quizzes)
+        student_groups = canvas.get_multiplier_student_groups(
+            self.accommodations, self.students
+        )
+        existing, _ = canvas.get_existing_accommodations(
+            self.accommodations, self.students, quiz_groups, 960
+        )
+
+        with patch.object(
+            AccommodationsCanvas, "get_quiz_overrides", side_effect=Forbidden("")
+        ), self.assertLogs("accommodations.canvas_api", "WARNING"):
+            _, status = canvas.add_availabilities(
+                student_groups, quiz_groups, existing, True, 960
+            )
+
+        # Each quiz's overrides are fetched separately instead
+        self.assertTrue(status)
+        for quiz in quizzes:
+            self.assertEqual(
+                {
+                    tuple(override.student_ids)
+                    for override in self.get_assignment(canvas, quiz).get_overrides()
+                },
+                {(STUDENT_IDS[2],), tuple(STUDENT_IDS[:2])},
+            )
+
+    def test_quiz_data_records_assignment_ids(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes = self.select_quizzes(canvas)
+
+        # New Quiz IDs are strings
+        for quiz in quizzes:
+            self.assertEqual(
+                str(quiz["assignment_id"]), str(self.get_assignment(canvas, quiz).id)
+            )
+
+    def test_apply_does_not_look_up_quizzes(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes = self.select_quizzes(canvas)
+        quiz_groups = canvas.get_multiplier_quiz_groups(quizzes)
+        student_groups = canvas.get_multiplier_student_groups(
+            self.accommodations, self.students
+        )
+
+        with patch.object(Course, "get_quiz") as get_quiz, patch.object(
+            Course, "get_new_quiz"
+        ) as get_new_quiz, patch.object(Course, "get_assignment") as get_assignment:
+            _, extension_status = canvas.add_time_extensions(
+                student_groups, quiz_groups, 960
+            )
+            _, availability_status = canvas.add_availabilities(
+                student_groups, quiz_groups, [], False, 960
+            )
+
+        self.assertTrue(extension_status)
+        self.assertTrue(availability_status)
+        get_quiz.assert_not_called()
+        get_new_quiz.assert_not_called()
+        get_assignment.assert_not_called()
+        for quiz in quizzes:
+            extensions = self.state.courses[960]["extensions"][quiz["id"]]
+            self.assertEqual(set(extensions), set(STUDENT_IDS[:2]))
+            self.assertEqual(
+                len(list(self.get_assignment(canvas, quiz).get_overrides())), 1
+            )
+
+    def test_quiz_without_assignment_id_is_looked_up_once(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes = [
+            next(
+                quiz for quiz in self.select_quizzes(canvas) if not quiz["is_new_quiz"]
+            )
+        ]
+        assignment_id = quizzes[0].pop("assignment_id")
+        quiz_groups = canvas.get_multiplier_quiz_groups(quizzes)
+        # Students with two multipliers
+        accommodations = self.accommodations[:1] + [
+            (self.students[1].login_id, "4.0", self.students[1].user_id, "4.0x", None)
+        ]
+        student_groups = canvas.get_multiplier_student_groups(
+            accommodations, self.students
+        )
+
+        with patch.object(
+            Course, "get_quiz", autospec=True, side_effect=Course.get_quiz
+        ) as get_quiz:
+            _, status = canvas.add_availabilities(
+                student_groups, quiz_groups, [], False, 960
+            )
+
+        self.assertTrue(status)
+        get_quiz.assert_called_once()
+        self.assertEqual(
+            canvas._assignment_ids, {(False, str(quizzes[0]["id"])): assignment_id}
+        )
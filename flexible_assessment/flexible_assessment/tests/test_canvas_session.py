@@ -0,0 +1,63 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+from accommodations.canvas_api import AccommodationsCanvas
+from django.test import SimpleTestCase, override_settings
+from flexible_assessment import canvas_session
+from instructor.canvas_api import FlexCanvas
+from requests.adapters import HTTPAdapter
+
+
+@override_settings(
+    CANVAS_HTTP_POOL_SIZE=3,
+    CANVAS_HTTP_CONNECT_TIMEOUT=2,
+    CANVAS_HTTP_READ_TIMEOUT=7,
+)
+class TestCanvasSession(SimpleTestCase):
+    def setUp(self):
+        canvas_session.close_session()
+        self.addCleanup(canvas_session.close_session)
+
+    def test_session_is_shared_across_threads(self):
+        sessions = []
+        threads = [
+            threading.Thread(
+                target=lambda: sessions.append(canvas_session.get_session())
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len({id(session) for session in sessions}), 1)
+        canvas_session.close_session()
+        self.assertIsNot(canvas_session.get_session(), sessions[0])
+
+    def test_session_uses_configured_pool_and_timeouts(self):
+        session = canvas_session.get_session()
+        adapter = session.get_adapter("https://canvas.test/api/graphql")
+
+        self.assertEqual(adapter._pool_maxsize, 3)
+        with patch.object(HTTPAdapter, "send") as send:
+            adapter.send(MagicMock())
+            adapter.send(MagicMock(), timeout=1)
+
+        self.assertEqual(send.call_args_list[0][1]["timeout"], (2, 7))
+        self.assertEqual(send.call_args_list[1][1]["timeout"], 1)
+
+    def test_session_does_not_keep_cookies(self):
+        session = canvas_session.get_session()
+
+        self.assertEqual(session.cookies.get_policy().allowed_domains(), ())
+
+    @patch("accommodations.canvas_api.get_oauth_token", return_value="token")
+    @patch("instructor.canvas_api.get_oauth_token", return_value="token")
+    def test_canvas_clients_share_session(self, *args):
+        session = canvas_session.get_session()
+        flex_canvas = FlexCanvas(MagicMock())
+        accommodations_canvas = AccommodationsCanvas(MagicMock())
+
+        self.assertIs(flex_canvas._Canvas__requester._session, session)
+        self.assertIs(accommodations_canvas._Canvas__requester._session, session)
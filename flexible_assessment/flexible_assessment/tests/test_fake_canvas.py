@@ -0,0 +1,208 @@
+import copy
+import warnings
+from unittest.mock import MagicMock, patch
+
+import requests
+from accommodations.canvas_api import AccommodationsCanvas
+from canvasapi.exceptions import Forbidden
+from django.test import TestCase, override_settings
+from flexible_assessment import fake_canvas, synthetic
+from instructor.canvas_api import FlexCanvas
+from oauth import canvas_oauth
+
+
+class TestFakeCanvas(TestCase):
+    def setUp(self):
+        self.course = synthetic.create_course(960, 7, 3, seed=2)
+        self.payload = synthetic.build_graphql_payload(self.course, seed=2)
+        self.state = fake_canvas.CanvasState()
+        self.state.add_synthetic_course(
+            self.course, payload=copy.deepcopy(self.payload), quiz_count=2
+        )
+        self.server = self.start_server()
+
+        warnings.filterwarnings("ignore", "Canvas may respond unexpectedly")
+        self.addCleanup(warnings.resetwarnings)
+
+    def start_server(self, **kwargs):
+        server = fake_canvas.FakeCanvasServer(
+            ("127.0.0.1", 0), self.state, max_per_page=3, **kwargs
+        )
+        server.start()
+        self.addCleanup(server.stop)
+
+        settings = override_settings(CANVAS_DOMAIN=server.url)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        return server
+
+    def flex_canvas(self):
+        return FlexCanvas(None, access_token="token")
+
+    def test_grades_are_fetched_in_pages(self):
+        canvas = self.flex_canvas()
+        with patch.object(FlexCanvas, "graphql", return_value=self.payload):
+            expected = canvas.get_flat_groups_and_enrollments(960)
+            expected_groups = canvas.get_groups_and_enrollments(960)
+
+        with patch.object(FlexCanvas, "graphql", wraps=canvas.graphql) as graphql:
+            self.assertEqual(canvas.get_flat_groups_and_enrollments(960), expected)
+            self.assertEqual(canvas.get_groups_and_enrollments(960), expected_groups)
+        # 7 grades in pages of 3
+        self.assertGreater(graphql.call_count, 3 * 3)
+
+    @patch("instructor.canvas_api.OVERRIDE_RETRY_DELAY", 0)
+    def test_overrides_are_set(self):
+        canvas = self.flex_canvas()
+        _, enrollments = canvas.get_groups_and_enrollments(960)
+        overrides = {
+            enrollment_id: 70.5 + i
+            for i, enrollment_id in enumerate(enrollments.values())
+        }
+
+        failed, stats = canvas.set_overrides(
+            dict(overrides, missing=50.0), batch_size=3
+        )
+
+        self.assertEqual(failed, {"missing": "enrollment not found"})
+        self.assertEqual(stats["submitted"], len(overrides))
+        self.assertEqual(canvas.get_override_scores(960), overrides)
+
+    def test_responses_report_rate_limit(self):
+        response = self.flex_canvas()._post_graphql(
+            "query AllowOverrideQuery($course_id: ID) {}", {"course_id": 960}
+        )
+
+        self.assertEqual(
+            response.json()["data"]["course"]["allowFinalGradeOverride"], False
+        )
+        self.assertEqual(response.headers["X-Request-Cost"], "1.0000")
+        self.assertAlmostEqual(
+            float(response.headers["X-Rate-Limit-Remaining"]), 699, places=0
+        )
+
+    def test_full_bucket_is_throttled(self):
+        self.start_server(rate_limit=60, leak_rate=0, request_cost=20)
+        canvas = self.flex_canvas()
+
+        canvas.get_course(960)
+        with self.assertRaises(Forbidden):
+            canvas.get_course(960)
+        # Other access tokens have their own bucket
+        FlexCanvas(None, access_token="other").get_course(960)
+
+    def test_requests_need_access_token(self):
+        response = requests.get(self.server.url + "api/v1/courses/960")
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_lists_are_paginated(self):
+        users = list(self.flex_canvas().get_course(960).get_users())
+
+        self.assertEqual(len(users), 7)
+        self.assertEqual(len({user.id for user in users}), 7)
+        self.assertEqual(users[0].sis_user_id, "student{}".format(users[0].id))
+
+    def test_course_settings(self):
+        canvas = self.flex_canvas()
+        course = canvas.get_course(960)
+
+        self.assertFalse(canvas.is_allow_override(960))
+        canvas.set_override_true(960)
+        self.assertTrue(canvas.is_allow_override(960))
+        course.update_settings(hide_final_grades=True)
+        self.assertTrue(course.get_settings()["hide_final_grades"])
+
+        group = course.get_assignment_group(96001)
+        group.edit(group_weight=0)
+        self.assertEqual(course.get_assignment_group(96001).group_weight, 0)
+
+    def test_calendar_events(self):
+        canvas = self.flex_canvas()
+        event = canvas.create_calendar_event(
+            {
+                "context_code": "course_960",
+                "title": "Flexible Assessment",
+                "end_at": "2030-01-01T00:00:00Z",
+            }
+        )
+        event.edit(calendar_event={"end_at": "2030-01-02T00:00:00Z"})
+
+        event = canvas.get_calendar_event(event.id)
+        self.assertEqual(event.title, "Flexible Assessment")
+        self.assertEqual(event.end_at, "2030-01-02T00:00:00Z")
+
+    @patch("accommodations.canvas_api.get_oauth_token", return_value="token")
+    def test_quizzes_and_overrides(self, *args):
+        canvas = AccommodationsCanvas(MagicMock())
+        quizzes, unavailable = canvas.get_quiz_data(960)
+
+        self.assertEqual(len(quizzes), 7)
+        self.assertEqual(unavailable, [])
+
+        course = canvas.get_course(960)
+        classic_quiz = next(q for q in quizzes if not q["is_new_quiz"])
+        quiz = course.get_quiz(classic_quiz["id"])
+        quiz.set_extensions([{"user_id": 96000001, "extra_time": 30}])
+        assignment = course.get_assignment(quiz.assignment_id)
+        assignment.create_override(
+            assignment_override={
+                "student_ids": [96000001, 96000002],
+                "lock_at": "2030-01-01T00:00:00Z",
+                "due_at": None,
+            }
+        )
+
+        overrides = list(assignment.get_overrides())
+        self.assertEqual(len(overrides), 1)
+        self.assertEqual(overrides[0].student_ids, [96000001, 96000002])
+        self.assertEqual(overrides[0].lock_at, "2030-01-01T00:00:00Z")
+        self.assertFalse(hasattr(overrides[0], "due_at"))
+        overrides[0].delete()
+        self.assertEqual(list(assignment.get_overrides()), [])
+
+        new_quiz = next(q for q in quizzes if q["is_new_quiz"])
+        canvas.set_extensions_for_new_quiz(
+            course.get_new_quiz(new_quiz["id"]),
+            [{"user_id": 96000001, "extra_time": 30}],
+            960,
+        )
+        self.assertEqual(
+            self.state.courses[960]["extensions"][new_quiz["id"]],
+            {96000001: {"user_id": 96000001, "extra_time": 30}},
+        )
+
+    def test_oauth_token(self):
+        with override_settings(
+            CANVAS_OAUTH_ACCESS_TOKEN_URL=self.server.url + "login/oauth2/token"
+        ):
+            access_token, _, refresh_token = canvas_oauth.get_access_token(
+                "authorization_code", "id", "secret", "https://flex.test", code="c"
+            )
+
+        self.assertTrue(access_token)
+        self.assertTrue(refresh_token)
+
+
+class TestParseParams(TestCase):
+    def test_nested_params(self):
+        params = fake_canvas._parse_params(
+            [
+                ("assignment_override[student_ids][]", "1"),
+                ("assignment_override[student_ids][]", "2"),
+                ("assignment_override[lock_at]", "None"),
+                ("quiz_extensions[][user_id]", "1"),
+                ("quiz_extensions[][extra_time]", "30"),
+                ("quiz_extensions[][user_id]", "2"),
+                ("hide_final_grades", "True"),
+            ]
+        )
+
+        self.assertEqual(
+            params,
+            {
+                "assignment_override": {"student_ids": [1, 2], "lock_at": None},
+                "quiz_extensions": [{"user_id": 1, "extra_time": 30}, {"user_id": 2}],
+                "hide_final_grades": True,
+            },
+        )
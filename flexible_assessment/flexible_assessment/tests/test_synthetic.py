@@ -0,0 +1,100 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from flexible_assessment import synthetic
+from flexible_assessment.models import FlexAssessment, Roles, UserProfile
+from instructor import grader
+from instructor.canvas_api import FlexCanvas
+from instructor.gradebook import GradeBook
+
+
+class TestSynthetic(TestCase):
+    def test_create_course_has_valid_allocations(self):
+        course = synthetic.create_course(900, 200, 5, seed=1)
+        students = UserProfile.objects.filter(
+            usercourse__role=Roles.STUDENT, usercourse__course=course
+        )
+        assessments = list(course.assessment_set.all())
+
+        self.assertEqual(students.count(), 200)
+        self.assertEqual(sum(a.default for a in assessments), 100)
+        self.assertEqual(
+            FlexAssessment.objects.filter(assessment__course=course).count(), 1000
+        )
+        for assessment in assessments:
+            self.assertEqual(assessment.check_valid_flex(), set())
+        for student in students[:20]:
+            flexes = FlexAssessment.objects.filter(user=student).values_list(
+                "flex", flat=True
+            )
+            if None not in flexes:
+                self.assertEqual(sum(flexes), 100)
+
+    def test_build_groups_matches_assessments(self):
+        course = synthetic.create_course(901, 50, 3, seed=2)
+        groups, enrollments = synthetic.build_groups(course, seed=2)
+        gradebook = GradeBook.from_groups(groups, enrollments)
+        students = UserProfile.objects.filter(
+            usercourse__role=Roles.STUDENT, usercourse__course=course
+        )
+
+        self.assertEqual(len(enrollments), 50)
+        self.assertEqual(
+            sorted(groups), sorted(str(a.group) for a in course.assessment_set.all())
+        )
+        course_grades = grader.get_course_grades(gradebook, course, students)
+        self.assertEqual(len(course_grades), 50)
+
+    def test_graphql_payload_matches_groups(self):
+        course = synthetic.create_course(902, 30, 3, seed=3)
+        groups, enrollments = synthetic.build_groups(course, seed=3)
+
+        # The response is changed in place while it is parsed
+        def graphql(*args, **kwargs):
+            return synthetic.build_graphql_payload(course, seed=3)
+
+        canvas = FlexCanvas.__new__(FlexCanvas)
+        with patch.object(FlexCanvas, "graphql", side_effect=graphql):
+            regular = canvas.get_groups_and_enrollments(902)
+            flat = canvas.get_flat_groups_and_enrollments(902)
+
+        self.assertEqual(regular[1], enrollments)
+        self.assertEqual(flat[1], enrollments)
+        for group_id, group in groups.items():
+            self.assertEqual(
+                regular[0][group_id]["grade_list"]["grades"],
+                group["grade_list"]["grades"],
+            )
+            for (user_id, score), (flat_id, flat_score) in zip(
+                group["grade_list"]["grades"], flat[0][group_id]["grade_list"]["grades"]
+            ):
+                self.assertEqual(user_id, flat_id)
+                if score is None:
+                    self.assertIsNone(flat_score)
+                else:
+                    self.assertAlmostEqual(score, flat_score, delta=0.005)
+
+    def test_command_creates_courses(self):
+        call_command(
+            "create_synthetic_courses",
+            courses=2,
+            students=20,
+            first_course_id=910,
+            first_user_id=91000,
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(
+            UserProfile.objects.filter(usercourse__course_id=911).count(), 21
+        )
+        with self.assertRaises(CommandError):
+            call_command(
+                "create_synthetic_courses",
+                students=20,
+                first_course_id=910,
+                first_user_id=91000,
+                stdout=StringIO(),
+            )
@@ -1,19 +1,144 @@
+import heapq
+import random
 import time
 import requests
-from collections.abc import MutableMapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from canvasapi import Canvas
-from canvasapi.exceptions import CanvasException
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from flexible_assessment import canvas_session
+from flexible_assessment.canvas_graphql import PAGE_INFO, get_pages, get_path
 from oauth.oauth import get_oauth_token
-from decimal import Decimal, ROUND_HALF_UP
 
-
-def round_half_up(value, digits=2):
-    """Rounds a float to the specified number of digits using ROUND_HALF_UP"""
-    d = Decimal(str(value))  # Convert the float to a Decimal
-    return d.quantize(Decimal(10) ** -digits, rounding=ROUND_HALF_UP)
+from . import drop_rules, throttle
+from .gradebook import GradeBook
+
+# Page sizes for the assignment group queries, which are small enough that a
+# page of any connection stays well within Canvas response limits
+GROUP_PAGE_SIZE = 10
+ASSIGNMENT_PAGE_SIZE = 10
+PAGE_SIZE = 100
+# Assignment groups fetched at the same time for flat grading
+GROUP_WORKERS = 4
+# setOverrideScore mutations sent in one GraphQL document
+OVERRIDE_BATCH_SIZE = 50
+OVERRIDE_ATTEMPTS = 6
+# Seconds before the first retry, doubled for each later one up to a cap
+OVERRIDE_RETRY_DELAY = 1
+OVERRIDE_MAX_RETRY_DELAY = 30
+# Override requests in flight at first and at most, see throttle.py
+OVERRIDE_WORKERS = 2
+OVERRIDE_MAX_WORKERS = 8
+
+GRADE_FIELDS = """grades: nodes {
+                    current_score: currentScore
+                    enrollment {
+                        _id
+                        user {
+                            user_id: _id
+                            display_name: name
+                        }
+                    }
+                }"""
+
+SUBMISSION_FIELDS = """submissions: nodes {
+                    score
+                    user_id: userId
+                }"""
+
+ASSIGNMENT_FIELDS = f"""assignments: nodes {{
+                    _id
+                    max_score: pointsPossible
+                    name
+                    published   # to check for unpublished assignments to filter out
+                    gradingType # to check for assignments with gradingType = not_graded
+                    omitFromFinalGrade # to check for assignments that should not be factored into the final grade
+                    submission_list: submissionsConnection(first: $page_size) {{
+                        {SUBMISSION_FIELDS}
+                        {PAGE_INFO}
+                    }}
+                }}"""
+
+GROUPS_QUERY = f"""query AssignmentGroupQuery($course_id: ID, $first: Int, $after: String, $page_size: Int) {{
+    course(id: $course_id) {{
+        assignment_groups: assignmentGroupsConnection(first: $first, after: $after) {{
+            groups: nodes {{
+                group_id: _id
+                group_name: name
+                group_weight: groupWeight
+                grade_list: gradesConnection(first: $page_size) {{
+                    {GRADE_FIELDS}
+                    {PAGE_INFO}
+                }}
+            }}
+            {PAGE_INFO}
+        }}
+    }}
+}}"""
+
+# Assignments and grades are fetched separately for each group, see
+# FlexCanvas._get_flat_group
+FLAT_GROUPS_QUERY = f"""query FlatAssignmentGroupQuery($course_id: ID!, $first: Int, $after: String) {{
+    course(id: $course_id) {{
+        assignment_groups: assignmentGroupsConnection(first: $first, after: $after) {{
+            groups: nodes {{
+                rules {{
+                    dropHighest
+                    dropLowest
+                    neverDrop {{
+                        _id
+                    }}
+                }}
+                group_id: _id
+                group_name: name
+                group_weight: groupWeight
+            }}
+            {PAGE_INFO}
+        }}
+    }}
+}}"""
+
+GROUP_GRADES_QUERY = f"""query AssignmentGroupGradesQuery($group_id: ID!, $first: Int, $after: String) {{
+    assignment_group: assignmentGroup(id: $group_id) {{
+        grade_list: gradesConnection(first: $first, after: $after) {{
+            {GRADE_FIELDS}
+            {PAGE_INFO}
+        }}
+    }}
+}}"""
+
+GROUP_ASSIGNMENTS_QUERY = f"""query AssignmentGroupAssignmentsQuery($group_id: ID!, $first: Int, $after: String, $page_size: Int) {{
+    assignment_group: assignmentGroup(id: $group_id) {{
+        assignment_list: assignmentsConnection(first: $first, after: $after) {{
+            {ASSIGNMENT_FIELDS}
+            {PAGE_INFO}
+        }}
+    }}
+}}"""
+
+ASSIGNMENT_SUBMISSIONS_QUERY = f"""query AssignmentSubmissionsQuery($assignment_id: ID!, $first: Int, $after: String) {{
+    assignment(id: $assignment_id) {{
+        submission_list: submissionsConnection(first: $first, after: $after) {{
+            {SUBMISSION_FIELDS}
+            {PAGE_INFO}
+        }}
+    }}
+}}"""
+
+OVERRIDE_SCORES_QUERY = f"""query OverrideScoresQuery($course_id: ID!, $first: Int, $after: String) {{
+    course(id: $course_id) {{
+        enrollment_list: enrollmentsConnection(first: $first, after: $after) {{
+            enrollments: nodes {{
+                _id
+                grades {{
+                    override_score: overrideScore
+                }}
+            }}
+            {PAGE_INFO}
+        }}
+    }}
+}}"""
 
 
 class FlexCanvas(Canvas):
@@ -21,16 +146,19 @@ class FlexCanvas(Canvas):
     a Flexible Assessment context
     """
 
-    def __init__(self, request):
+    def __init__(self, request, access_token=None):
         """Creates FlexCanvas instance using Canvas OAuth
-        token of instructor using the application
+        token of instructor using the application, or access_token
+        outside of a request
         """
 
         base_url = settings.CANVAS_DOMAIN
-        access_token = get_oauth_token(request)
+        if access_token is None:
+            access_token = get_oauth_token(request)
         self.base_url = base_url
         self.access_token = access_token
         super().__init__(base_url, access_token)
+        canvas_session.use_session(self)
 
     def set_override_true(self, course_id):
         """Sets 'allow final grade override' in Canvas course
@@ -45,7 +173,7 @@ class FlexCanvas(Canvas):
         url = f"{self.base_url}/api/v1/courses/{course_id}/settings"
         headers = {"Authorization": f"Bearer {self.access_token}"}
 
-        response = requests.put(url, headers=headers, params=param)
+        response = canvas_session.get_session().put(url, headers=headers, params=param)
         response.raise_for_status()
 
         return response.json()
@@ -74,44 +202,33 @@ class FlexCanvas(Canvas):
 
         return query_response["data"]["course"]["allowFinalGradeOverride"]
 
-    def set_override(self, enrollment_id, override, incomplete, attempt=1):
-        """ "Sets final grade override for student with given enrollment ID
+    def get_gradebook(self, course_id, flat=False):
+        """Gets Canvas assignment group scores and student enrollments
+        as a GradeBook
 
         Parameters
         ----------
-        enrollment_id : str
-            Canvas enrollment ID for student in the course
-        override : float
-            Final grade override for the student
-        incomplete : list
-            Mutable datatype representing status of submitting final grade,
-            contains single element of bool type, True represents a grade
-            was not able to be submitted
-        attempt : int
-            Represents the current attempt of submitting a student grade
+        course_id : int
+            Canvas course ID
+        flat : bool
+            True to score each group by the average of its assignment
+            scores (see get_flat_groups_and_enrollments)
+
+        Returns
+        -------
+        GradeBook
+            Scores indexed by student and group, with enrollment IDs
         """
 
-        mutation = """mutation OverrideFinalScore($enrollment_id: ID!, $override: Float) {
-                    setOverrideScore(input: { enrollmentId: $enrollment_id,
-                                              overrideScore: $override }) {
-                        grades {
-                            overrideScore
-                            } } }"""
-        try:
-            if not incomplete[0]:
-                self.graphql(
-                    mutation,
-                    variables={"enrollment_id": enrollment_id, "override": override},
-                )
-        except CanvasException:
-            if attempt <= 5:
-                time.sleep(1)
-                self.set_override(enrollment_id, override, incomplete, attempt + 1)
-            else:
-                incomplete[0] = True
+        if flat:
+            groups, enrollments = self.get_flat_groups_and_enrollments(course_id)
+        else:
+            groups, enrollments = self.get_groups_and_enrollments(course_id)
 
-    def get_groups_and_enrollments(self, course_id):
-        """Gets Canvas assignment groups and student enrollment data
+        return GradeBook.from_groups(groups, enrollments)
+
+    def get_override_scores(self, course_id):
+        """Gets the final grade override of every enrollment in the course
 
         Parameters
         ----------
@@ -120,158 +237,231 @@ class FlexCanvas(Canvas):
 
         Returns
         -------
-        group_dict : dict
-            Contains assignment group and grades data
-        user_enrollment_dict : dict
-            Contains enrollment ID for each user
+        dict
+            Override score for each Canvas enrollment ID, None if the
+            enrollment has no override
         """
 
-        query = """query AssignmentGroupQuery($course_id: ID) {
-                    course(id: $course_id) {
-                        assignment_groups: assignmentGroupsConnection {
-                        groups: nodes {
-                            group_id: _id
-                            group_name: name
-                            group_weight: groupWeight
-                            grade_list: gradesConnection {
-                            grades: nodes {
-                                current_score: currentScore
-                                enrollment {
-                                user {
-                                    user_id: _id
-                                    display_name: name
-                                }
-                                _id
-            } } } } } } }"""
+        override_scores = {}
+        enrollment_pages = get_pages(
+            self,
+            OVERRIDE_SCORES_QUERY,
+            {"course_id": course_id, "first": PAGE_SIZE},
+            ("data", "course", "enrollment_list"),
+            "enrollments",
+        )
+        for enrollments in enrollment_pages:
+            for enrollment in enrollments:
+                grades = enrollment.get("grades") or {}
+                override_scores[enrollment["_id"]] = grades.get("override_score")
+
+        return override_scores
+
+    def set_overrides(self, overrides, batch_size=OVERRIDE_BATCH_SIZE, on_batch=None):
+        """Sets final grade overrides for many students, sending batches of
+        aliased setOverrideScore mutations in one GraphQL request each
+
+        Batches are sent from a pool that starts the next batch as soon as
+        a request finishes, with as many requests in flight as Canvas rate
+        limiting allows (see throttle.ConcurrencyLimit). Enrollments whose
+        mutation fails are sent again in a later batch, up to
+        OVERRIDE_ATTEMPTS attempts, after an exponential backoff with full
+        jitter (see _get_retry_delay).
 
-        query_response = self.graphql(query, variables={"course_id": course_id})
+        Parameters
+        ----------
+        overrides : dict
+            Final grade override for each Canvas enrollment ID
+        batch_size : int
+            Mutations per request
+        on_batch : Union[Callable, None]
+            Called after each request with the enrollment IDs it submitted
+            and a dict of the reason each enrollment that will not be tried
+            again failed, from the calling thread
 
-        query_flattened = self._flatten_dict(query_response)
-        groups = query_flattened.get("data.course.assignment_groups.groups", None)
-        if groups is None:
-            raise PermissionDenied
+        Returns
+        -------
+        failed : dict
+            Reason the override of each enrollment could not be set
+        stats : dict
+            Overrides submitted, requests sent, seconds taken, overrides
+            per second, peak requests in flight and throttled requests
+        """
 
-        group_dict = {}
-        user_enrollment_dict = {}
-        for group in groups:
-            id = group["group_id"]
-            group.pop("group_id", None)
-            group_dict[id] = group
-
-        for group_data in group_dict.values():
-            group_flattened = self._flatten_dict(group_data)
-            grades = group_flattened.get("grade_list.grades", None)
-            if grades is None:
-                raise PermissionDenied
-
-            updated_grades = []
-            for grade in grades:
-                grade_flattened = self._flatten_dict(grade)
-                user_id = grade_flattened.get("enrollment.user.user_id", None)
-                enrollment_id = grade_flattened.get("enrollment._id", None)
-                if user_id is None:
-                    raise PermissionDenied
+        start = time.perf_counter()
+        items = list(overrides.items())
+        # Batches to send as (time ready, order, batch, attempt)
+        pending = [
+            (start, i, items[i : i + batch_size], 1)
+            for i in range(0, len(items), batch_size)
+        ]
+        order = len(items)
+        limit = throttle.ConcurrencyLimit(
+            OVERRIDE_WORKERS, maximum=OVERRIDE_MAX_WORKERS
+        )
+        running = {}
+        request_count = 0
+        failed = {}
+
+        with ThreadPoolExecutor(max_workers=OVERRIDE_MAX_WORKERS) as executor:
+            while pending or running:
+                now = time.perf_counter()
+                while pending and pending[0][0] <= now and len(running) < limit.workers:
+                    _, _, batch, attempt = heapq.heappop(pending)
+                    future = executor.submit(self._set_override_batch, batch)
+                    running[future] = (batch, attempt)
+                    request_count += 1
+
+                if not running:
+                    time.sleep(pending[0][0] - now)
+                    continue
 
-                user_enrollment_dict[user_id] = enrollment_id
+                # Wakes up for a retry that becomes ready while others run
+                timeout = None
+                if pending and len(running) < limit.workers:
+                    timeout = max(pending[0][0] - now, 0)
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    batch, attempt = running.pop(future)
+                    batch_failed, response = future.result()
+                    if response is not None and throttle.is_throttled(response):
+                        limit.throttle()
+                    elif response is not None:
+                        limit.update(response.headers)
+
+                    retry = [pair for pair in batch if pair[0] in batch_failed]
+                    given_up = {}
+                    if retry and attempt < OVERRIDE_ATTEMPTS:
+                        order += 1
+                        ready = time.perf_counter() + _get_retry_delay(attempt)
+                        heapq.heappush(pending, (ready, order, retry, attempt + 1))
+                    else:
+                        given_up = {
+                            enrollment_id: batch_failed[enrollment_id]
+                            for enrollment_id, _ in retry
+                        }
+                        failed.update(given_up)
+
+                    if on_batch is not None:
+                        submitted = [
+                            enrollment_id
+                            for enrollment_id, _ in batch
+                            if enrollment_id not in batch_failed
+                        ]
+                        on_batch(submitted, given_up)
+
+        seconds = time.perf_counter() - start
+        submitted = len(items) - len(failed)
+        stats = {
+            "submitted": submitted,
+            "requests": request_count,
+            "seconds": seconds,
+            "per_second": submitted / seconds if seconds else 0,
+            "peak_workers": limit.peak,
+            "throttled": limit.throttled,
+        }
 
-                score = grade_flattened["current_score"]
-                updated_grades.append((user_id, score))
+        return failed, stats
 
-            group_data["grade_list"]["grades"] = updated_grades
+    def _set_override_batch(self, batch):
+        """Sends one request with a setOverrideScore mutation aliased o<i>
+        for each (enrollment ID, override) in batch
 
-        return group_dict, user_enrollment_dict
+        Returns
+        -------
+        failed : dict
+            Reason for each enrollment whose mutation returned errors or no
+            grades, for every enrollment in the batch if the request failed
+        response : requests.Response or None
+            Canvas response, None if it could not be reached
+        """
 
-    def calculate_user_scores(self, data, rules, user_drop_status):
-        user_scores = {}
+        declarations = []
+        fields = []
+        variables = {}
+        for i, (enrollment_id, override) in enumerate(batch):
+            declarations.append(f"$enrollment_id{i}: ID!, $override{i}: Float")
+            fields.append(
+                f"""o{i}: setOverrideScore(input: {{ enrollmentId: $enrollment_id{i},
+                                                 overrideScore: $override{i} }}) {{
+                        grades {{
+                            overrideScore
+                        }}
+                        errors {{
+                            message
+                        }}
+                    }}"""
+            )
+            variables[f"enrollment_id{i}"] = enrollment_id
+            variables[f"override{i}"] = override
 
-        for user_id, assignments in data.items():
-            # Create list of dictionaries (a tuple) out of nested dictionary
-            score_dict = {
-                list(assignment.keys())[0]: list(assignment.values())[0]
-                for assignment in assignments
-            }
+        mutation = "mutation OverrideFinalScores({}) {{\n{}\n}}".format(
+            ", ".join(declarations), "\n".join(fields)
+        )
 
-            # initialize user_drop_status for each user
-            user_drop_status[user_id] = 0
+        def fail_all(reason):
+            return {enrollment_id: reason for enrollment_id, _ in batch}
 
-            # Extracting scores that should never be dropped
-            if rules["neverDrop"]:
-                neverdrop = []
-                for aid in rules["neverDrop"]:
-                    neverdrop.append(aid["_id"])
-                never_drop_scores = {
-                    aid: score for aid, score in score_dict.items() if aid in neverdrop
-                }
-                # Extracting scores that can potentially be dropped
-                droppable_scores = {
-                    aid: score
-                    for aid, score in score_dict.items()
-                    if aid not in neverdrop
-                }
-            else:
-                never_drop_scores = {}
-                droppable_scores = {aid: score for aid, score in score_dict.items()}
+        try:
+            response = self._post_graphql(mutation, variables)
+        except requests.RequestException as e:
+            return fail_all("Could not reach Canvas: {}".format(e)), None
+        if throttle.is_throttled(response):
+            return fail_all("Canvas rate limit exceeded"), response
+        if response.status_code != 200:
+            reason = "Canvas responded with status {}".format(response.status_code)
+            return fail_all(reason), response
+        try:
+            response_data = response.json()
+        except ValueError:
+            return fail_all("Canvas response is not valid JSON"), response
+
+        data = response_data.get("data") or {}
+        # Errors raised while resolving a mutation have its alias as path
+        alias_errors = {
+            error["path"][0]: error.get("message", "")
+            for error in response_data.get("errors") or []
+            if error.get("path")
+        }
 
-            # Sorting droppable scores by score, descending order
-            sorted_droppable_scores = sorted(
-                droppable_scores.items(), key=lambda item: item[1]
-            )
+        failed = {}
+        for i, (enrollment_id, _) in enumerate(batch):
+            alias = f"o{i}"
+            result = data.get(alias)
+            if alias in alias_errors:
+                failed[enrollment_id] = alias_errors[alias]
+            elif result and result.get("errors"):
+                failed[enrollment_id] = "; ".join(
+                    error.get("message", "") for error in result["errors"]
+                )
+            elif not result or not result.get("grades"):
+                failed[enrollment_id] = "Canvas did not return the override"
 
-            # Design: if there are rules for dropping highest and lowest scores, only drop if it's possible to satisfy both rules
-            # Otherwise, if there is only one rule, drop only if you can satisfy it
-            if (
-                "dropHighest" in rules
-                and rules["dropHighest"]
-                and "dropLowest" in rules
-                and rules["dropLowest"]
-            ):
-                highest_drop_count = rules["dropHighest"]
-                lowest_drop_count = rules["dropLowest"]
-                if highest_drop_count + lowest_drop_count < len(
-                    sorted_droppable_scores
-                ):
-                    sorted_droppable_scores = sorted_droppable_scores[
-                        :-highest_drop_count
-                    ]
-                    user_drop_status[user_id] += highest_drop_count
-                    sorted_droppable_scores = sorted_droppable_scores[
-                        lowest_drop_count:
-                    ]
-                    user_drop_status[user_id] += lowest_drop_count
-            elif (
-                "dropHighest" in rules and rules["dropHighest"]
-            ):  # case where dropLowest not found or equals null
-                highest_drop_count = rules["dropHighest"]
-                if highest_drop_count < len(sorted_droppable_scores):
-                    sorted_droppable_scores = sorted_droppable_scores[
-                        :-highest_drop_count
-                    ]
-                    user_drop_status[user_id] += highest_drop_count
-            elif "dropLowest" in rules and rules["dropLowest"]:
-                lowest_drop_count = rules["dropLowest"]
-                if lowest_drop_count < len(sorted_droppable_scores):
-                    sorted_droppable_scores = sorted_droppable_scores[
-                        lowest_drop_count:
-                    ]
-                    user_drop_status[user_id] += lowest_drop_count
-
-            # Combine the scores from neverDrop with the remaining droppable scores
-            final_scores = list(never_drop_scores.values()) + [
-                score for _, score in sorted_droppable_scores
-            ]
+        return failed, response
 
-            # Calculate total_score as the sum of all the undropped scores
-            total_score = sum(final_scores)
+    def _post_graphql(self, query, variables):
+        """Sends a GraphQL request, returning the response with its rate limit
+        headers that Canvas.graphql does not keep
 
-            # Store the computed total score for each user
-            user_scores[user_id] = total_score
+        Returns
+        -------
+        requests.Response
+        """
 
-        # print(user_scores)
-        return user_scores
+        url = f"{self.base_url}/api/graphql"
+        headers = {"Authorization": f"Bearer {self.access_token}"}
 
-    def get_flat_groups_and_enrollments(self, course_id):
+        return canvas_session.get_session().post(
+            url, headers=headers, json={"query": query, "variables": variables}
+        )
+
+    def get_groups_and_enrollments(self, course_id):
         """Gets Canvas assignment groups and student enrollment data
 
+        Groups and their grades are fetched a page at a time with cursors,
+        and each page is added to the result as it arrives.
+
         Parameters
         ----------
         course_id : int
@@ -285,103 +475,132 @@ class FlexCanvas(Canvas):
             Contains enrollment ID for each user
         """
 
-        query = """
-        query AssignmentGroupQuery($course_id: ID!) {
-        course(id: $course_id) {
-            assignment_groups: assignmentGroupsConnection {
-                groups: nodes {
-                    rules {
-                        dropHighest
-                        dropLowest
-                        neverDrop {
-                            _id
-                        }
-                    }
-                    group_id:_id
-                    group_name: name
-                    group_weight: groupWeight
-                    assignment_list: assignmentsConnection {
-                        assignments: nodes {
-                            _id
-                            max_score: pointsPossible
-                            name
-                            published   # to check for unpublished assignments to filter out
-                            gradingType # to check for assignments with gradingType = not_graded
-                            omitFromFinalGrade # to check for assignments that should not be factored into the final grade
-                            submission_list: submissionsConnection {
-                                submissions: nodes {
-                                    score
-                                    user_id: userId
-                                }
-                            }
-                        }
-                    }
-                    grade_list: gradesConnection {
-                        grades: nodes {
-                            current_score: currentScore
-                            enrollment {
-                                _id
-                                user {
-                                    user_id: _id
-                                    display_name: name
-                                }
-                            }
-                        }
-                    }
+        group_dict = {}
+        user_enrollment_dict = {}
+
+        group_pages = get_pages(
+            self,
+            GROUPS_QUERY,
+            {"course_id": course_id, "first": GROUP_PAGE_SIZE, "page_size": PAGE_SIZE},
+            ("data", "course", "assignment_groups"),
+            "groups",
+        )
+        for groups in group_pages:
+            for group in groups:
+                id = group["group_id"]
+
+                updated_grades = []
+                for grades in self._get_group_grade_pages(group):
+                    for grade in grades:
+                        user_id, enrollment_id, score = self._get_grade(grade)
+                        user_enrollment_dict[user_id] = enrollment_id
+                        updated_grades.append((user_id, score))
+
+                group_dict[id] = {
+                    "group_name": group.get("group_name"),
+                    "group_weight": group.get("group_weight"),
+                    "grade_list": {"grades": updated_grades},
                 }
-            }
-        }
-    }
+
+        return group_dict, user_enrollment_dict
+
+    def get_flat_groups_and_enrollments(self, course_id):
+        """Gets Canvas assignment groups and student enrollment data
+
+        Groups, assignments, submissions and grades are fetched a page at a
+        time with cursors. Submission scores are added to each student's
+        running total for the group as their page arrives.
+
+        Parameters
+        ----------
+        course_id : int
+            Canvas course ID
+
+        Returns
+        -------
+        group_dict : dict
+            Contains assignment group and grades data
+        user_enrollment_dict : dict
+            Contains enrollment ID for each user
         """
-        # Makes the API call
-        query_response = self.graphql(query, variables={"course_id": course_id})
-        query_flattened = self._flatten_dict(query_response)
-        groups = query_flattened.get("data.course.assignment_groups.groups", None)
-        if groups is None:
-            raise PermissionDenied
 
         group_dict = {}
         # This dict matches grades to enrollment ID, necessary for overriding grade
         user_enrollment_dict = {}
-        # Set group id key to group value
-        for group in groups:
-            id = group.pop("group_id", None)
-            group_dict[id] = group
-
-        # Iterate over each assignment group.
-        for group_data in group_dict.values():
-            # Collect special grading rules for each assignment group
-            rules = group_data.pop("rules")
-            # If rules = None you skip the extra processing
-            if all(rule is None for rule in rules.values()):
-                rules = None
-
-            group_flattened = self._flatten_dict(group_data)
-            # Get list of assignments for each group
-            assignments = group_flattened.pop("assignment_list.assignments", None)
-            if assignments is None:
-                raise PermissionDenied
-
-            # Have dictionary storing total assignments per user
-            user_total_assignments = {}
-
-            # Gets the grades for each assignment, will be editing this to accomodate a flat grading system
-            grades = group_flattened.get("grade_list.grades", [])
-            if grades is None:
-                raise PermissionDenied
-
-            user_scores = {}
-
-            # Add scores for each assignment to user_id, converts them into a percentage.
-            for assignment in assignments:
-                assignment_flattened = self._flatten_dict(assignment)
 
-                published = assignment_flattened.get("published", True)
-                grading_type = assignment_flattened.get("gradingType", None)
-                omit_from_final_grade = assignment_flattened.get(
-                    "omitFromFinalGrade", False
-                )
-                not_empty = assignment_flattened.get("submission_list.submissions")
+        group_pages = get_pages(
+            self,
+            FLAT_GROUPS_QUERY,
+            {"course_id": course_id, "first": GROUP_PAGE_SIZE},
+            ("data", "course", "assignment_groups"),
+            "groups",
+        )
+
+        # Groups are independent, so each is fetched and scored by its own
+        # worker as soon as its node arrives, then merged in Canvas order
+        with ThreadPoolExecutor(max_workers=GROUP_WORKERS) as executor:
+            futures = [
+                (group["group_id"], executor.submit(self._get_flat_group, group))
+                for groups in group_pages
+                for group in groups
+            ]
+            for id, future in futures:
+                group_dict[id], enrollments = future.result()
+                user_enrollment_dict.update(enrollments)
+
+        return group_dict, user_enrollment_dict
+
+    def _get_flat_group(self, group):
+        """Scores each student in an assignment group by the average of their
+        assignment scores, fetching the group's assignments, submissions and
+        grades
+
+        Parameters
+        ----------
+        group : dict
+            Assignment group node from FLAT_GROUPS_QUERY, pages of assignments
+            and grades already in the node are not fetched again
+
+        Returns
+        -------
+        group_data : dict
+            Contains group name, weight and (user ID, score) grades
+        user_enrollment_dict : dict
+            Contains enrollment ID for each user in the group
+        """
+
+        # Collect special grading rules for each assignment group
+        rules = group.get("rules")
+        # If rules = None you skip the extra processing
+        if rules is not None and all(rule is None for rule in rules.values()):
+            rules = None
+
+        # Have dictionary storing total assignments per user
+        user_total_assignments = {}
+        user_scores = {}
+        user_enrollment_dict = {}
+        # Scores the drop rules apply to
+        group_scores = drop_rules.GroupScores()
+
+        # Add scores for each assignment to user_id, converts them into a percentage.
+        assignment_pages = get_pages(
+            self,
+            GROUP_ASSIGNMENTS_QUERY,
+            {
+                "group_id": group["group_id"],
+                "first": ASSIGNMENT_PAGE_SIZE,
+                "page_size": PAGE_SIZE,
+            },
+            ("data", "assignment_group", "assignment_list"),
+            "assignments",
+            self._get_first_page(group, "assignment_list"),
+        )
+        for assignments in assignment_pages:
+            for assignment in assignments:
+                published = assignment.get("published", True)
+                grading_type = assignment.get("gradingType")
+                omit_from_final_grade = assignment.get("omitFromFinalGrade", False)
+                not_empty = get_path(assignment, ("submission_list", "submissions"))
                 if (
                     published is False
                     or grading_type == "not_graded"
@@ -390,89 +609,115 @@ class FlexCanvas(Canvas):
                 ):  # filter out unpublished assignments
                     continue
 
-                max_score = assignment_flattened.get("max_score", None)
-                submissions = assignment_flattened.get(
-                    "submission_list.submissions", None
-                )
+                max_score = assignment.get("max_score")
 
-                # If no submissions of max_score == 0, skip assignment and do not factor it into grade
-                if max_score == 0 or max_score is None or submissions is None:
+                # If max_score == 0, skip assignment and do not factor it into grade
+                if max_score == 0 or max_score is None:
                     continue
 
                 assignment_id = assignment["_id"]
 
-                for submission in submissions:
-                    score = submission["score"]
-                    user_id = submission["user_id"]
-                    if user_id is None:
-                        raise PermissionDenied
-                    if score is None:
-                        continue
-
-                    flat_score = score / max_score if max_score else 0
-                    if rules:
-                        if user_id not in user_scores:
-                            user_scores[user_id] = []
-                        user_scores[user_id].append({assignment_id: flat_score})
-                    else:
-                        user_scores[user_id] = user_scores.get(user_id, 0) + flat_score
-
-                    if user_id not in user_total_assignments:
-                        user_total_assignments[user_id] = 0
-                    user_total_assignments[user_id] += 1
-
-            # user_drop_status is a dictionary of user ids, and the number of dropped assignments for that user
-            user_drop_status = {}
-
-            # If no rules, skip extra processing
-            if rules:
-                user_scores = self.calculate_user_scores(
-                    user_scores, rules, user_drop_status
+                submission_pages = get_pages(
+                    self,
+                    ASSIGNMENT_SUBMISSIONS_QUERY,
+                    {"assignment_id": assignment_id, "first": PAGE_SIZE},
+                    ("data", "assignment", "submission_list"),
+                    "submissions",
+                    assignment["submission_list"],
                 )
-                user_total_assignments = {
-                    k: v - user_drop_status[k]
-                    for k, v in user_total_assignments.items()
-                }
+                for submissions in submission_pages:
+                    for submission in submissions:
+                        score = submission["score"]
+                        user_id = submission["user_id"]
+                        if user_id is None:
+                            raise PermissionDenied
+                        if score is None:
+                            continue
+
+                        flat_score = score / max_score if max_score else 0
+                        if rules:
+                            group_scores.add(user_id, assignment_id, flat_score)
+                        else:
+                            user_scores[user_id] = (
+                                user_scores.get(user_id, 0) + flat_score
+                            )
+
+                        if user_id not in user_total_assignments:
+                            user_total_assignments[user_id] = 0
+                        user_total_assignments[user_id] += 1
+
+        # If no rules, skip extra processing
+        if rules:
+            user_scores, user_drop_status = group_scores.drop(rules)
+            user_total_assignments = {
+                k: v - user_drop_status[k] for k, v in user_total_assignments.items()
+            }
 
-            # Once group scores are calculated, update assignment grades
-            updated_grades = []
+        # Once group scores are calculated, update assignment grades
+        updated_grades = []
+        for grades in self._get_group_grade_pages(group):
             for grade in grades:
-                grade_flattened = self._flatten_dict(grade)
-                user_id = grade_flattened.get("enrollment.user.user_id", None)
-                enrollment_id = grade_flattened.get("enrollment._id", None)
-                if user_id is None:
-                    raise PermissionDenied
+                user_id, enrollment_id, score = self._get_grade(grade)
                 user_enrollment_dict[user_id] = enrollment_id
 
                 if user_id in user_scores:
                     # Calculate the average score and convert it to percentage
-                    flat_group_score = (
-                        # perhaps here, loop through all assignments and count number of assignments without submission
+                    score = (
                         (user_scores[user_id] / user_total_assignments[user_id]) * 100
                         if user_total_assignments[user_id]
                         else 0
                     )
-                    # updated_grades.append((user_id, round_half_up(flat_group_score, 3)))
-                    updated_grades.append((user_id, flat_group_score))
-                else:
-                    # Keep the original score if no submissions were found
-                    score = grade_flattened["current_score"]
-                    updated_grades.append((user_id, score))
-
-            group_data["grade_list"]["grades"] = updated_grades
-            group_data.pop(
-                "assignment_list", None
-            )  # Remove assignment list as requested
+                # Otherwise keep the original score if no submissions were found
+                updated_grades.append((user_id, score))
+
+        group_data = {
+            "group_name": group.get("group_name"),
+            "group_weight": group.get("group_weight"),
+            "grade_list": {"grades": updated_grades},
+        }
+
+        return group_data, user_enrollment_dict
+
+    def _get_group_grade_pages(self, group):
+        """Yields pages of grade nodes for an assignment group node, starting
+        with the page included in the node if there is one"""
+
+        return get_pages(
+            self,
+            GROUP_GRADES_QUERY,
+            {"group_id": group["group_id"], "first": PAGE_SIZE},
+            ("data", "assignment_group", "grade_list"),
+            "grades",
+            self._get_first_page(group, "grade_list"),
+        )
+
+    def _get_first_page(self, node, key):
+        """Returns the first page of the connection at key in node, None if
+        it was not queried so it is fetched, and an empty page if it is null
+        so get_pages raises PermissionDenied"""
+
+        if key not in node:
+            return None
+        return node[key] or {}
+
+    def _get_grade(self, grade):
+        """Returns user ID, enrollment ID and current score of a grade node"""
+
+        # Fields are read in place, without copying the node
+        enrollment = grade.get("enrollment")
+        user_id = get_path(enrollment, ("user", "user_id"))
+        enrollment_id = get_path(enrollment, ("_id",))
+        if user_id is None:
+            raise PermissionDenied
+
+        return user_id, enrollment_id, grade["current_score"]
 
-        return group_dict, user_enrollment_dict
 
-    def _flatten_dict_gen(self, d, parent_key, sep):
-        for k, v in d.items():
-            new_key = parent_key + sep + k if parent_key else k
-            if isinstance(v, MutableMapping):
-                yield from self._flatten_dict(v, new_key, sep=sep).items()
-            else:
-                yield new_key, v
+def _get_retry_delay(attempt):
+    """Returns seconds to wait before retrying after a failed attempt,
+    drawn uniformly up to OVERRIDE_RETRY_DELAY * 2**(attempt - 1), capped at
+    OVERRIDE_MAX_RETRY_DELAY, so retries of batches that failed together
+    are spread out"""
 
-    def _flatten_dict(self, d: MutableMapping, parent_key: str = "", sep: str = "."):
-        return dict(self._flatten_dict_gen(d, parent_key, sep))
+    ceiling = min(OVERRIDE_MAX_RETRY_DELAY, OVERRIDE_RETRY_DELAY * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
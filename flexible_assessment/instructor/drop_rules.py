@@ -0,0 +1,154 @@
+"""Canvas assignment group drop rules
+
+A group can drop each student's lowest and highest assignment scores,
+except those of its never drop assignments. A group's scores are held as a
+students x assignments array with NaN where a student has no score, and
+the rules are applied to every student at once, finding the scores to drop
+with np.argpartition instead of sorting each student's scores.
+
+Scores are dropped only if the student keeps at least one droppable score,
+i.e. dropLowest + dropHighest is less than their number of droppable
+scores, otherwise none are. The highest are dropped before the lowest, so
+with tied scores the same score is never dropped twice, and as tied scores
+are equal the total is the same whichever of them is dropped.
+"""
+
+import numpy as np
+
+
+class GroupScores:
+    """Assignment scores of an assignment group, added a submission at a
+    time and stored as parallel arrays of row, column and score
+
+    Attributes
+    ----------
+    user_ids : list
+        User IDs in row order
+    assignment_ids : list
+        Assignment IDs in column order
+    """
+
+    __slots__ = (
+        "user_ids",
+        "assignment_ids",
+        "_user_index",
+        "_assignment_index",
+        "_rows",
+        "_columns",
+        "_scores",
+    )
+
+    def __init__(self):
+        self.user_ids = []
+        self.assignment_ids = []
+        self._user_index = {}
+        self._assignment_index = {}
+        self._rows = []
+        self._columns = []
+        self._scores = []
+
+    def add(self, user_id, assignment_id, score):
+        """Adds a student's score for an assignment"""
+
+        row = self._user_index.get(user_id)
+        if row is None:
+            row = self._user_index[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        column = self._assignment_index.get(assignment_id)
+        if column is None:
+            column = self._assignment_index[assignment_id] = len(self.assignment_ids)
+            self.assignment_ids.append(assignment_id)
+
+        self._rows.append(row)
+        self._columns.append(column)
+        self._scores.append(score)
+
+    def to_array(self):
+        """Returns a students x assignments array of scores, NaN where a
+        student has no score"""
+
+        scores = np.full((len(self.user_ids), len(self.assignment_ids)), np.nan)
+        scores[self._rows, self._columns] = self._scores
+        return scores
+
+    def drop(self, rules):
+        """Applies drop rules to every student's scores
+
+        Parameters
+        ----------
+        rules : dict
+            Assignment group rules from Canvas
+
+        Returns
+        -------
+        totals : dict
+            Sum of the scores each user keeps
+        dropped : dict
+            Number of scores dropped for each user
+        """
+
+        totals, dropped = apply(self.to_array(), self.assignment_ids, rules)
+        return (
+            dict(zip(self.user_ids, totals.tolist())),
+            dict(zip(self.user_ids, dropped.tolist())),
+        )
+
+
+def apply(scores, assignment_ids, rules):
+    """Applies drop rules to a group's scores
+
+    Parameters
+    ----------
+    scores : np.ndarray
+        Students x assignments scores, NaN where a student has no score
+    assignment_ids : list
+        Assignment ID of each column
+    rules : dict
+        Assignment group rules from Canvas, with dropLowest and dropHighest
+        counts and neverDrop assignments, each of which may be None
+
+    Returns
+    -------
+    totals : np.ndarray
+        Sum of the scores each student keeps
+    dropped : np.ndarray
+        Number of scores dropped for each student
+    """
+
+    lowest = rules.get("dropLowest") or 0
+    highest = rules.get("dropHighest") or 0
+    never_drop = {assignment["_id"] for assignment in rules.get("neverDrop") or []}
+
+    scores = np.array(scores, dtype=float)
+    dropped = np.zeros(len(scores), dtype=int)
+    if not (lowest or highest):
+        return np.nansum(scores, axis=1), dropped
+
+    droppable = np.flatnonzero(
+        [assignment_id not in never_drop for assignment_id in assignment_ids]
+    )
+    counts = np.count_nonzero(~np.isnan(scores[:, droppable]), axis=1)
+    rows = np.flatnonzero(counts > lowest + highest)
+    if len(rows):
+        cells = np.ix_(rows, droppable)
+        candidates = scores[cells]
+        if highest:
+            _drop(candidates, highest, highest=True)
+        if lowest:
+            _drop(candidates, lowest, highest=False)
+        scores[cells] = candidates
+        dropped[rows] = lowest + highest
+
+    return np.nansum(scores, axis=1), dropped
+
+
+def _drop(scores, count, highest):
+    """Sets the count highest or lowest scores of each row to NaN in place,
+    every row must have more than count scores"""
+
+    filled = np.where(np.isnan(scores), -np.inf if highest else np.inf, scores)
+    if highest:
+        columns = np.argpartition(filled, -count, axis=1)[:, -count:]
+    else:
+        columns = np.argpartition(filled, count - 1, axis=1)[:, :count]
+    np.put_along_axis(scores, columns, np.nan, axis=1)
@@ -0,0 +1,153 @@
+from decimal import Decimal
+
+import numpy as np
+
+from flexible_assessment.models import FlexAssessment, Roles
+
+# Rows are filtered by user in the query only for small student lists
+USER_FILTER_LIMIT = 500
+
+
+class FlexMatrix:
+    """Students' flex allocations for every assessment in a course
+
+    All FlexAssessment rows for the course are loaded with one query into a
+    students x assessments array of hundredths, so the sum to 100 check is
+    exact. A flex allocation is valid when none of the student's flex
+    assessments are null and they sum to 100, as in grader.valid_flex.
+
+    Attributes
+    ----------
+    user_ids : list
+        Canvas user IDs as strings
+    assessment_ids : list
+        Assessment IDs in course order
+    """
+
+    __slots__ = (
+        "user_ids",
+        "assessment_ids",
+        "_user_index",
+        "_assessment_index",
+        "_flexes",
+        "_null",
+        "_valid",
+    )
+
+    def __init__(self, user_ids, assessment_ids, flexes, has_row):
+        self.user_ids = list(user_ids)
+        self.assessment_ids = list(assessment_ids)
+        self._user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self._assessment_index = {
+            assessment_id: i for i, assessment_id in enumerate(self.assessment_ids)
+        }
+        self._flexes = flexes
+        self._null = (has_row & np.isnan(flexes)).any(axis=1)
+        self._valid = ~self._null & (np.nansum(flexes, axis=1) == 10000)
+
+    @classmethod
+    def load(cls, course, students=None):
+        """Loads flex allocations for students in a course
+
+        Parameters
+        ----------
+        course : Course
+            Course object
+        students : Union[Iterable[UserProfile], None]
+            Students to include, all students in the course if None
+
+        Returns
+        -------
+        FlexMatrix
+        """
+
+        if students is None:
+            user_ids = course.usercourse_set.filter(role=Roles.STUDENT).values_list(
+                "user_id", flat=True
+            )
+        else:
+            user_ids = [student.user_id for student in students]
+        user_ids = [str(user_id) for user_id in user_ids]
+        assessment_ids = list(course.assessment_set.values_list("id", flat=True))
+
+        user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+        assessment_index = {
+            assessment_id: i for i, assessment_id in enumerate(assessment_ids)
+        }
+        flexes = np.full((len(user_ids), len(assessment_ids)), np.nan)
+        has_row = np.zeros(flexes.shape, dtype=bool)
+
+        rows = FlexAssessment.objects.filter(assessment__course=course)
+        if students is not None and len(user_ids) <= USER_FILTER_LIMIT:
+            rows = rows.filter(user_id__in=user_ids)
+        rows = rows.values_list("user_id", "assessment_id", "flex")
+        for user_id, assessment_id, flex in rows:
+            row = user_index.get(str(user_id))
+            column = assessment_index.get(assessment_id)
+            if row is None or column is None:
+                continue
+            has_row[row, column] = True
+            if flex is not None:
+                flexes[row, column] = int(flex * 100)
+
+        return cls(user_ids, assessment_ids, flexes, has_row)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def get_flex(self, user_id, assessment_id):
+        """Gets student flex allocation for assessment, None if not set"""
+
+        row = self._user_index.get(str(user_id))
+        column = self._assessment_index.get(assessment_id)
+        if row is None or column is None:
+            return None
+
+        flex = self._flexes[row, column]
+        return None if np.isnan(flex) else Decimal(int(flex)).scaleb(-2)
+
+    def has_null(self, user_id):
+        """True if any of the student's flex assessments are null"""
+
+        return bool(self._null[self._user_index[str(user_id)]])
+
+    def is_valid(self, user_id):
+        """True if the student's flex allocations are set and sum to 100"""
+
+        row = self._user_index.get(str(user_id))
+        return row is not None and bool(self._valid[row])
+
+    def get_valid(self, user_ids):
+        """Gets validity flag array for the given students"""
+
+        return np.array([self.is_valid(user_id) for user_id in user_ids], dtype=bool)
+
+    def get_valid_count(self):
+        return int(self._valid.sum())
+
+    def get_flexes(self, user_ids, assessment_ids, fill_value=0):
+        """Gets students x assessments flex array in hundredths, fill_value
+        where flex is null or the student or assessment is not in the matrix
+        """
+
+        rows = np.array(
+            [self._user_index.get(str(user_id), -1) for user_id in user_ids],
+            dtype=np.intp,
+        )
+        columns = np.array(
+            [
+                self._assessment_index.get(assessment_id, -1)
+                for assessment_id in assessment_ids
+            ],
+            dtype=np.intp,
+        )
+
+        # Pad with a fill row and column so missing students and assessments index into it
+        padded = np.full(
+            (len(self.user_ids) + 1, len(self.assessment_ids) + 1),
+            fill_value,
+            dtype=float,
+        )
+        padded[:-1, :-1] = np.where(np.isnan(self._flexes), fill_value, self._flexes)
+
+        return padded[np.ix_(rows, columns)]
@@ -0,0 +1,140 @@
+"""Fixed-point grade arithmetic
+
+Grades are held as plain ints scaled by a power of ten, e.g. totals in
+thousandths and displayed grades in hundredths. Rounding is ROUND_HALF_UP
+(ties away from zero) done with integer division, matching
+Decimal.quantize(..., rounding=ROUND_HALF_UP) on Decimal(str(value)).
+"""
+
+import re
+from decimal import ROUND_HALF_UP, Decimal
+from fractions import Fraction
+
+# Default scale for scores and weights, in hundred-thousandths
+SCALE_DIGITS = 5
+SCALE = 10**SCALE_DIGITS
+
+_NUMBER = re.compile(r"([+-]?)(\d*)(?:\.(\d*))?(?:[eE]([+-]?\d+))?")
+
+
+def div_half_up(numerator, denominator):
+    """Divides ints, rounding ties away from zero"""
+
+    if denominator < 0:
+        numerator, denominator = -numerator, -denominator
+    if numerator < 0:
+        return -((-2 * numerator + denominator) // (2 * denominator))
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def to_fixed(value, digits=SCALE_DIGITS):
+    """Converts a number to an int scaled by 10**digits, rounding
+    Decimal(str(value)) half up
+
+    Raises ValueError if value is not a finite number
+    """
+
+    if isinstance(value, int):
+        return value * 10**digits
+
+    match = _NUMBER.fullmatch(str(value).strip())
+    if match is None or not (match.group(2) or match.group(3)):
+        raise ValueError("Not a finite number: {!r}".format(value))
+
+    sign, whole, fraction, exponent = match.groups()
+    fraction = fraction or ""
+    mantissa = int((whole or "") + fraction or "0")
+    shift = int(exponent or 0) - len(fraction) + digits
+    if sign == "-":
+        mantissa = -mantissa
+
+    if shift >= 0:
+        return mantissa * 10**shift
+    return div_half_up(mantissa, 10**-shift)
+
+
+def to_decimal(fixed, digits=SCALE_DIGITS):
+    """Converts a scaled int to a Decimal with exactly digits places"""
+
+    sign = 1 if fixed < 0 else 0
+    return Decimal((sign, tuple(int(d) for d in str(abs(fixed))), -digits))
+
+
+def round_fixed(fixed, digits, to_digits):
+    """Rounds an int scaled by 10**digits to one scaled by 10**to_digits"""
+
+    if to_digits >= digits:
+        return fixed * 10 ** (to_digits - digits)
+    return div_half_up(fixed, 10 ** (digits - to_digits))
+
+
+def format_fixed(fixed, digits):
+    """Formats a scaled int as it would print as a Decimal, e.g. 8801 with
+    2 digits is '88.01'"""
+
+    return str(to_decimal(fixed, digits))
+
+
+def round_half_up(value, digits=2):
+    """Rounds a number to the specified number of digits using
+    ROUND_HALF_UP, returning a Decimal or None if value is None"""
+
+    if value is None:
+        return None
+
+    try:
+        fixed = to_fixed(value, digits)
+    except ValueError:
+        # NaN and infinity behave as Decimal does
+        d = Decimal(str(value))
+        return d.quantize(Decimal(10) ** -digits, rounding=ROUND_HALF_UP)
+
+    if fixed == 0 and str(value).lstrip().startswith("-"):
+        # Keep the sign of negative values that round to zero, as Decimal does
+        return Decimal((1, (0,), -digits))
+    return to_decimal(fixed, digits)
+
+
+def exact_weighted_total(scores, weights):
+    """Weighted total of scores as an exact Fraction, skipping scores that
+    are None or NaN
+
+    Floats are taken at their exact binary value, as Decimal(float) does,
+    so only int arithmetic is used.
+    """
+
+    overall = 0
+    total_weight = 0
+    for score, weight in zip(scores, weights):
+        if score is None or score != score:
+            continue
+        weight = Fraction(weight)
+        overall += Fraction(score) * weight
+        total_weight += weight
+
+    if total_weight == 0:
+        return Fraction(0)
+    return overall / total_weight
+
+
+def round_fraction(value, digits):
+    """Rounds a Fraction half up to an int scaled by 10**digits"""
+
+    return div_half_up(value.numerator * 10**digits, value.denominator)
+
+
+def weighted_total(scores, weights, digits=3):
+    """Weighted total of scores rounded half up to an int scaled by
+    10**digits, see exact_weighted_total"""
+
+    return round_fraction(exact_weighted_total(scores, weights), digits)
+
+
+def mean_fixed(values):
+    """Mean of scaled ints rounded half up to the same scale, 0 if there
+    are no values"""
+
+    values = list(values)
+    if not values:
+        return 0
+    return div_half_up(sum(values), len(values))
@@ -0,0 +1,209 @@
+from decimal import Decimal
+
+import numpy as np
+from django.db import IntegrityError, models, transaction
+from flexible_assessment.models import Course, GradeSnapshot, StudentGrade
+
+from . import grade_math, grader
+from .flex_matrix import FlexMatrix
+
+
+def get_course_grades(gradebook, course, students, flex_matrix=None):
+    """Gets course grades from the course grade snapshot if the Canvas
+    gradebook, course flex_version and students are unchanged, otherwise
+    calculates them and saves them as the new snapshot
+
+    Parameters
+    ----------
+    gradebook : GradeBook
+        Assignment group scores retrieved from Canvas API
+    course : Course
+        Course object, loaded before the grades are calculated
+    students : QuerySet
+        Students in the course to calculate grades for
+    flex_matrix : Union[FlexMatrix, None]
+        Flex allocations for the students, loaded if needed and None
+
+    Returns
+    -------
+    CourseGrades
+        Totals for each student and course averages
+    """
+
+    students = list(students)
+    user_ids = sorted(str(student.user_id) for student in students)
+    gradebook_hash = gradebook.get_hash()
+
+    snapshot = GradeSnapshot.objects.filter(course=course).first()
+    if (
+        snapshot is not None
+        and snapshot.gradebook_hash == gradebook_hash
+        and snapshot.flex_version == course.flex_version
+    ):
+        rows = list(
+            snapshot.studentgrade_set.values_list("user_id", "override", "default")
+        )
+        if sorted(str(user_id) for user_id, _, _ in rows) == user_ids:
+            return grader.CourseGrades(
+                [str(user_id) for user_id, _, _ in rows],
+                [_to_fixed(override) for _, override, _ in rows],
+                [_to_fixed(default) for _, _, default in rows],
+                [Decimal(average) for average in snapshot.averages],
+            )
+
+    totals = grader.calculate_course_totals(gradebook, course, students, flex_matrix)
+
+    try:
+        _save_snapshot(course, gradebook_hash, totals)
+    except IntegrityError:
+        # Another request saved a snapshot for the course at the same time
+        pass
+
+    return grader.CourseGrades(
+        totals["user_ids"], totals["overrides"], totals["defaults"], totals["averages"]
+    )
+
+
+def update_student_grades(course_id, user_id):
+    """Updates a student's totals in the course grade snapshot after their
+    flex allocations change
+
+    Only the student's override total is recalculated from the assessment
+    scores stored in their row, and the course averages are adjusted from
+    the stored column sums. The snapshot is deleted instead if it is out of
+    date or an average cannot be rounded exactly from the sums.
+
+    Parameters
+    ----------
+    course_id : int
+        Course the flex allocations belong to
+    user_id : int
+        Student whose flex allocations changed
+    """
+
+    with transaction.atomic():
+        Course.objects.filter(pk=course_id).update(
+            flex_version=models.F("flex_version") + 1
+        )
+        snapshot = (
+            GradeSnapshot.objects.select_for_update()
+            .filter(course_id=course_id)
+            .select_related("course")
+            .first()
+        )
+        if snapshot is None:
+            return
+
+        course = snapshot.course
+        student_grade = (
+            snapshot.studentgrade_set.filter(user_id=user_id)
+            .select_related("user")
+            .first()
+        )
+        # Snapshot missed an earlier change or does not include the student
+        if snapshot.flex_version != course.flex_version - 1 or student_grade is None:
+            snapshot.delete()
+            return
+
+        flex_matrix = FlexMatrix.load(course, [student_grade.user])
+        assessment_ids = flex_matrix.assessment_ids
+        if [str(assessment_id) for assessment_id in assessment_ids] != (
+            snapshot.assessment_ids
+        ):
+            snapshot.delete()
+            return
+
+        override_total, override = grader.get_student_override(
+            student_grade.scores,
+            flex_matrix.get_flexes([user_id], assessment_ids)[0],
+            flex_matrix.is_valid(user_id),
+        )
+
+        old_columns = _get_columns(
+            student_grade.override_total, student_grade.default_total
+        )
+        new_columns = _get_columns(override_total, student_grade.default_total)
+        sums = [
+            column_sum - old + new
+            for column_sum, old, new in zip(
+                [snapshot.override_sum, snapshot.default_sum, snapshot.difference_sum],
+                old_columns,
+                new_columns,
+            )
+        ]
+        count = snapshot.studentgrade_set.count()
+        averages = grader.get_averages_from_sums(sums, count)
+        if averages is None:
+            snapshot.delete()
+            return
+
+        student_grade.override_total = override_total
+        student_grade.override = _to_decimal(override)
+        student_grade.save(update_fields=["override_total", "override"])
+
+        snapshot.override_sum, snapshot.default_sum, snapshot.difference_sum = sums
+        snapshot.averages = [str(average) for average in averages]
+        snapshot.flex_version = course.flex_version
+        snapshot.save()
+
+
+def _get_columns(override_total, default_total):
+    """Gets a student's contribution to the override, default and
+    difference column sums"""
+
+    if override_total is None:
+        return [default_total, default_total, 0]
+
+    return [override_total, default_total, override_total - default_total]
+
+
+def _to_fixed(total):
+    """Converts a saved total to an int in thousandths"""
+
+    return None if total is None else grade_math.to_fixed(total, 3)
+
+
+def _to_decimal(total):
+    """Converts a total in thousandths to a Decimal to save"""
+
+    return None if total is None else grade_math.to_decimal(total, 3)
+
+
+def _save_snapshot(course, gradebook_hash, totals):
+    """Replaces the course grade snapshot with the calculated totals"""
+
+    with transaction.atomic():
+        GradeSnapshot.objects.filter(course=course).delete()
+        override_sum, default_sum, difference_sum = totals["sums"]
+        snapshot = GradeSnapshot.objects.create(
+            course=course,
+            gradebook_hash=gradebook_hash,
+            flex_version=course.flex_version,
+            assessment_ids=[
+                str(assessment_id) for assessment_id in totals["assessment_ids"]
+            ],
+            override_sum=override_sum,
+            default_sum=default_sum,
+            difference_sum=difference_sum,
+            averages=[str(average) for average in totals["averages"]],
+        )
+
+        override_totals = totals["override_totals"].tolist()
+        default_totals = totals["default_totals"].tolist()
+        student_grades = []
+        for i, user_id in enumerate(totals["user_ids"]):
+            scores = totals["assessment_scores"][i]
+            student_grades.append(
+                StudentGrade(
+                    snapshot=snapshot,
+                    user_id=user_id,
+                    scores=[
+                        None if np.isnan(score) else score for score in scores.tolist()
+                    ],
+                    default_total=default_totals[i],
+                    override_total=override_totals[i] if totals["valid"][i] else None,
+                    default=_to_decimal(totals["defaults"][i]),
+                    override=_to_decimal(totals["overrides"][i]),
+                )
+            )
+        StudentGrade.objects.bulk_create(student_grades, batch_size=1000)
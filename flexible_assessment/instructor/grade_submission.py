@@ -0,0 +1,377 @@
+"""Final grade submissions to Canvas, run in the background
+
+Submitting the final grades of a large course can outlast the proxy
+timeout, so the final grades page queues a GradeSubmission and returns.
+The run_grade_submissions worker claims queued submissions and runs them,
+recording each student's override as an EnrollmentSubmission whose status
+and error are updated as Canvas accepts or rejects it. The page polls
+get_progress until the submission is done. A failed submission can be
+retried, sending only the overrides that failed again. A submission still
+running after RUNNING_TIMEOUT, e.g. because its worker was restarted, is
+failed by the next claim so the course can submit again.
+"""
+
+import logging
+from datetime import timedelta
+
+from canvasapi.exceptions import CanvasException
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from flexible_assessment import models
+from oauth.oauth import get_user_oauth_token
+
+from . import grade_math, grade_snapshot, gradebook_cache
+from .canvas_api import FlexCanvas
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = [models.JobStatus.QUEUED, models.JobStatus.RUNNING]
+# Failed students listed in progress
+MAX_FAILURES = 20
+# Longest a submission can run before it is assumed to have stopped
+RUNNING_TIMEOUT = timedelta(hours=1)
+
+
+def enqueue(course, user, flat, hide_totals, redirect_uri, retry_of=None):
+    """Queues a final grade submission for the course, unless one is
+    already queued or running
+
+    Parameters
+    ----------
+    course : Course
+    user : UserProfile
+        Instructor submitting the grades
+    flat : bool
+        True if assignment groups are scored with flat grading
+    hide_totals : bool
+        Canvas 'Hide totals in student grades summary' setting to apply
+        once all grades are submitted
+    redirect_uri : str
+        Canvas OAuth callback URI, see oauth.get_redirect_uri
+    retry_of : Union[GradeSubmission, None]
+        Submission whose failed overrides are sent again, None to submit
+        every final grade
+
+    Returns
+    -------
+    submission : GradeSubmission
+        Queued submission, or the one already queued or running
+    created : bool
+        True if the submission was queued by this call
+    """
+
+    with transaction.atomic():
+        # Locking the course keeps submissions sent at the same time, e.g.
+        # by a double click, from both being queued
+        models.Course.objects.select_for_update().get(pk=course.pk)
+        active = models.GradeSubmission.objects.filter(
+            course=course, status__in=ACTIVE_STATUSES
+        ).first()
+        if active is not None:
+            return active, False
+
+        submission = models.GradeSubmission.objects.create(
+            course=course,
+            user=user,
+            flat=flat,
+            hide_totals=hide_totals,
+            redirect_uri=redirect_uri,
+            retry_of=retry_of,
+        )
+
+    return submission, True
+
+
+def claim():
+    """Marks the oldest queued submission as running, after failing
+    submissions that have been running longer than RUNNING_TIMEOUT
+
+    Returns
+    -------
+    GradeSubmission or None
+        Claimed submission, None if no submission is queued
+    """
+
+    stopped = models.GradeSubmission.objects.filter(
+        status=models.JobStatus.RUNNING,
+        started__lt=timezone.now() - RUNNING_TIMEOUT,
+    )
+    for submission in stopped:
+        fail(submission, "Stopped before all final grades were submitted.")
+
+    with transaction.atomic():
+        submission = (
+            models.GradeSubmission.objects.select_for_update(skip_locked=True)
+            .filter(status=models.JobStatus.QUEUED)
+            .order_by("created")
+            .first()
+        )
+        if submission is None:
+            return None
+
+        submission.status = models.JobStatus.RUNNING
+        submission.started = timezone.now()
+        submission.save(update_fields=["status", "started"])
+
+    return submission
+
+
+def run(submission, canvas=None):
+    """Submits the final grades of a claimed submission to Canvas
+
+    Parameters
+    ----------
+    submission : GradeSubmission
+    canvas : Union[FlexCanvas, None]
+        Canvas API, created with the submitting instructor's token if None
+    """
+
+    log_extra = {
+        "course": str(submission.course),
+        "user": submission.user.display_name,
+    }
+
+    try:
+        if canvas is None:
+            access_token = get_user_oauth_token(
+                submission.user, submission.redirect_uri
+            )
+            canvas = FlexCanvas(None, access_token=access_token)
+        failed = _submit(submission, canvas, log_extra)
+        if not failed:
+            canvas.get_course(submission.course_id).update_settings(
+                hide_final_grades=submission.hide_totals
+            )
+    except Exception as e:
+        logger.exception("Error in submitting final grades", extra=log_extra)
+        fail(submission, str(e))
+        return
+
+    if failed:
+        logger.info("Error in submitting final grades", extra=log_extra)
+        fail(submission, "Could not submit {} final grades.".format(failed))
+        return
+
+    logger.info("Completed final grades submission to Canvas", extra=log_extra)
+    _finish(submission, models.JobStatus.DONE)
+
+
+def fail(submission, error):
+    """Marks a submission failed, along with its enrollments that were not
+    sent, so a retry sends them"""
+
+    _set_failed(
+        submission,
+        {
+            enrollment_id: "Not submitted before the submission stopped."
+            for enrollment_id in submission.enrollments.filter(
+                status=models.EnrollmentStatus.PENDING
+            ).values_list("enrollment_id", flat=True)
+        },
+    )
+    _finish(submission, models.JobStatus.FAILED, error)
+
+
+def get_progress(submission):
+    """Returns the state of a submission and its counts of students by
+    status, for the final grades page to poll
+
+    Returns
+    -------
+    dict
+        Contains id, status, error, total, the count of each enrollment
+        status and up to MAX_FAILURES failed students with their errors
+    """
+
+    counts = dict(
+        submission.enrollments.values_list("status")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    progress = {
+        "id": submission.id,
+        "status": submission.status,
+        "error": submission.error,
+        "total": sum(counts.values()),
+    }
+    for status in models.EnrollmentStatus.values:
+        progress[status] = counts.get(status, 0)
+
+    failures = submission.enrollments.filter(
+        status=models.EnrollmentStatus.FAILED
+    ).values_list("user__display_name", "error")[:MAX_FAILURES]
+    progress["failures"] = [
+        {"student": name, "error": error} for name, error in failures
+    ]
+
+    return progress
+
+
+def _submit(submission, canvas, log_extra):
+    """Records the override of each student, skips those Canvas already
+    has and sends the others
+
+    Returns
+    -------
+    int
+        Number of overrides that could not be submitted
+    """
+
+    course = submission.course
+    if submission.retry_of_id is None:
+        rows = _get_course_overrides(submission, canvas)
+    else:
+        rows = _get_failed_overrides(submission)
+    models.EnrollmentSubmission.objects.bulk_create(rows)
+    overrides = {row.enrollment_id: float(row.override) for row in rows}
+    student_names = {row.enrollment_id: row.user.display_name for row in rows}
+
+    # Overrides Canvas already has are not sent again
+    try:
+        current = canvas.get_override_scores(course.id)
+    except (CanvasException, PermissionDenied):
+        logger.info(
+            "Could not get current final grades from Canvas, submitting all",
+            extra=log_extra,
+        )
+        current = {}
+    unchanged = {
+        enrollment_id
+        for enrollment_id, override in overrides.items()
+        if _is_same_score(current.get(enrollment_id), override)
+    }
+    _set_status(submission, unchanged, models.EnrollmentStatus.SKIPPED)
+    changed = {
+        enrollment_id: override
+        for enrollment_id, override in overrides.items()
+        if enrollment_id not in unchanged
+    }
+
+    def on_batch(submitted, failed):
+        _set_status(submission, submitted, models.EnrollmentStatus.SUBMITTED)
+        _set_failed(submission, failed)
+        for enrollment_id in submitted:
+            logger.info(
+                "Submitted %s final grade to Canvas",
+                student_names[enrollment_id],
+                extra=log_extra,
+            )
+        for enrollment_id, error in failed.items():
+            logger.info(
+                "Could not submit %s final grade to Canvas: %s",
+                student_names[enrollment_id],
+                error,
+                extra=log_extra,
+            )
+
+    failed, stats = canvas.set_overrides(changed, on_batch=on_batch)
+
+    logger.info(
+        "Submitted %s final grades to Canvas in %.1fs, skipped %s unchanged "
+        "(%.1f per second, %s requests, up to %s at once, throttled %s times)",
+        stats["submitted"],
+        stats["seconds"],
+        len(unchanged),
+        stats["per_second"],
+        stats["requests"],
+        stats["peak_workers"],
+        stats["throttled"],
+        extra=log_extra,
+    )
+
+    return len(failed)
+
+
+def _get_course_overrides(submission, canvas):
+    """Returns unsaved EnrollmentSubmission rows with the final grade of
+    every student in the Canvas gradebook"""
+
+    course = submission.course
+    gradebook = gradebook_cache.get_gradebook(canvas, course.id, flat=submission.flat)
+    enrollments = gradebook.get_enrollments()
+
+    students = models.UserProfile.objects.filter(pk__in=list(enrollments.keys()))
+    students = {str(student.user_id): student for student in students}
+    course_grades = grade_snapshot.get_course_grades(
+        gradebook, course, students.values()
+    )
+
+    rows = []
+    for student_id, enrollment_id in enrollments.items():
+        student = students.get(str(student_id))
+        if not student:
+            continue
+        override, default = course_grades.get_fixed_totals(student)
+        override = override or default
+
+        # Override is in thousandths, Canvas gets it rounded to hundredths
+        hundredths = grade_math.round_fixed(override, 3, 2)
+        rows.append(
+            models.EnrollmentSubmission(
+                submission=submission,
+                user=student,
+                enrollment_id=enrollment_id,
+                override=grade_math.to_decimal(hundredths, 2),
+            )
+        )
+
+    return rows
+
+
+def _get_failed_overrides(submission):
+    """Returns unsaved EnrollmentSubmission rows with the overrides that
+    failed in the submission being retried"""
+
+    failed = submission.retry_of.enrollments.filter(
+        status=models.EnrollmentStatus.FAILED
+    ).select_related("user")
+
+    return [
+        models.EnrollmentSubmission(
+            submission=submission,
+            user=row.user,
+            enrollment_id=row.enrollment_id,
+            override=row.override,
+        )
+        for row in failed
+    ]
+
+
+def _set_failed(submission, failed):
+    """Marks enrollments failed with the reason each failed"""
+
+    by_error = {}
+    for enrollment_id, error in failed.items():
+        by_error.setdefault(error, []).append(enrollment_id)
+    for error, enrollment_ids in by_error.items():
+        submission.enrollments.filter(enrollment_id__in=enrollment_ids).update(
+            status=models.EnrollmentStatus.FAILED, error=error
+        )
+
+
+def _set_status(submission, enrollment_ids, status):
+    if enrollment_ids:
+        submission.enrollments.filter(enrollment_id__in=enrollment_ids).update(
+            status=status
+        )
+
+
+def _finish(submission, status, error=""):
+    submission.status = status
+    submission.error = error
+    submission.finished = timezone.now()
+    submission.save(update_fields=["status", "error", "finished"])
+
+
+def _is_same_score(current, override):
+    """Checks if a Canvas override score is the override about to be
+    submitted, compared in hundredths"""
+
+    if current is None:
+        return False
+    try:
+        return grade_math.to_fixed(current, 2) == grade_math.to_fixed(override, 2)
+    except ValueError:
+        return False
@@ -0,0 +1,192 @@
+import hashlib
+import json
+
+import numpy as np
+
+
+class GradeBook:
+    """Canvas assignment group scores indexed by student and group
+
+    Scores are stored in a single students x groups array, with NaN where a
+    student has no score in a group, so lookups by student and group take
+    constant time. Each student's Canvas enrollment ID is stored once
+    alongside their row.
+
+    Attributes
+    ----------
+    group_ids : list
+        Canvas assignment group IDs as strings, in Canvas order
+    user_ids : list
+        Canvas user IDs as strings, in the order they were first seen
+    """
+
+    __slots__ = (
+        "group_ids",
+        "user_ids",
+        "_group_index",
+        "_user_index",
+        "_group_names",
+        "_group_weights",
+        "_enrollment_ids",
+        "_scores",
+    )
+
+    def __init__(
+        self, group_ids, group_names, group_weights, user_ids, enrollment_ids, scores
+    ):
+        self.group_ids = list(group_ids)
+        self.user_ids = list(user_ids)
+        self._group_index = {group_id: i for i, group_id in enumerate(self.group_ids)}
+        self._user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self._group_names = list(group_names)
+        self._group_weights = list(group_weights)
+        self._enrollment_ids = list(enrollment_ids)
+        self._scores = np.asarray(scores, dtype=float).reshape(
+            len(self.user_ids), len(self.group_ids)
+        )
+
+    @classmethod
+    def from_groups(cls, groups, enrollments=None):
+        """Builds GradeBook from assignment groups and enrollments
+        returned by FlexCanvas.get_groups_and_enrollments
+
+        Parameters
+        ----------
+        groups : dict
+            Contains assignment group and grades data
+        enrollments : dict
+            Contains enrollment ID for each user
+
+        Returns
+        -------
+        GradeBook
+        """
+
+        enrollments = enrollments or {}
+        group_ids = [str(group_id) for group_id in groups.keys()]
+        user_index = {}
+        cells = []
+
+        for column, group in enumerate(groups.values()):
+            seen = set()
+            for user_id, score in group["grade_list"]["grades"]:
+                user_id = str(user_id)
+                # Only the first grade for a student in a group is used
+                if user_id in seen:
+                    continue
+                seen.add(user_id)
+                row = user_index.setdefault(user_id, len(user_index))
+                if score is not None:
+                    cells.append((row, column, score))
+
+        for user_id in enrollments:
+            user_index.setdefault(str(user_id), len(user_index))
+
+        scores = np.full((len(user_index), len(group_ids)), np.nan)
+        if cells:
+            rows, columns, values = zip(*cells)
+            scores[list(rows), list(columns)] = values
+
+        user_ids = list(user_index.keys())
+        enrollment_ids = [enrollments.get(user_id) for user_id in user_ids]
+
+        return cls(
+            group_ids,
+            [group.get("group_name") for group in groups.values()],
+            [group["group_weight"] for group in groups.values()],
+            user_ids,
+            enrollment_ids,
+            scores,
+        )
+
+    def __contains__(self, group_id):
+        return str(group_id) in self._group_index
+
+    def get_score(self, group_id, user_id):
+        """Gets student score in assignment group, None if there is no score
+
+        Raises KeyError if the assignment group is not in the gradebook
+        """
+
+        column = self._group_index[str(group_id)]
+        row = self._user_index.get(str(user_id))
+        if row is None:
+            return None
+
+        score = self._scores[row, column]
+        return None if np.isnan(score) else float(score)
+
+    def get_student_scores(self, user_id):
+        """Gets (score, group weight) for each group a student has a score in,
+        in group order"""
+
+        row = self._user_index.get(str(user_id))
+        if row is None:
+            return []
+
+        return [
+            (score, weight)
+            for score, weight in zip(self._scores[row].tolist(), self._group_weights)
+            if not np.isnan(score)
+        ]
+
+    def get_group_weight(self, group_id):
+        return self._group_weights[self._group_index[str(group_id)]]
+
+    def get_group_name(self, group_id):
+        return self._group_names[self._group_index[str(group_id)]]
+
+    def get_enrollment_id(self, user_id):
+        row = self._user_index.get(str(user_id))
+        return None if row is None else self._enrollment_ids[row]
+
+    def get_enrollments(self):
+        """Returns dict of user ID to enrollment ID for enrolled students"""
+
+        return {
+            user_id: enrollment_id
+            for user_id, enrollment_id in zip(self.user_ids, self._enrollment_ids)
+            if enrollment_id is not None
+        }
+
+    def get_group_weights(self):
+        return np.array(self._group_weights, dtype=float)
+
+    def get_hash(self):
+        """Gets SHA-256 hash of the groups, weights, enrollments and scores"""
+
+        digest = hashlib.sha256()
+        header = [
+            self.group_ids,
+            self._group_weights,
+            self.user_ids,
+            self._enrollment_ids,
+        ]
+        digest.update(json.dumps(header, default=str).encode())
+        digest.update(np.ascontiguousarray(self._scores).tobytes())
+
+        return digest.hexdigest()
+
+    def get_scores(self, user_ids, group_ids=None):
+        """Gets students x groups score array for the given students and
+        groups, NaN where there is no score or the student or group is
+        not in the gradebook
+        """
+
+        if group_ids is None:
+            group_ids = self.group_ids
+
+        rows = np.array(
+            [self._user_index.get(str(user_id), -1) for user_id in user_ids],
+            dtype=np.intp,
+        )
+        columns = np.array(
+            [self._group_index.get(str(group_id), -1) for group_id in group_ids],
+            dtype=np.intp,
+        )
+
+        # Pad with a NaN row and column so missing students and groups index into it
+        padded = np.full((len(self.user_ids) + 1, len(self.group_ids) + 1), np.nan)
+        padded[:-1, :-1] = self._scores
+
+        return padded[np.ix_(rows, columns)]
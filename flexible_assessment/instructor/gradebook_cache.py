@@ -0,0 +1,93 @@
+"""Canvas gradebook cache shared by every worker
+
+Gradebooks are kept in the "canvas" cache, a database cache by default so
+all gunicorn workers see the same entries, for CANVAS_CACHE_TTL seconds.
+Keys hold the course, the query type (regular or flat grading) and the
+course's cache version. Invalidating a course bumps its version, so every
+cached gradebook of the course is missed at once and left to expire.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+
+CACHE_ALIAS = "canvas"
+GRADEBOOK_KEY = "gradebook:{course_id}:{query}:{version}"
+VERSION_KEY = "gradebook_version:{course_id}"
+HITS_KEY = "gradebook_hits"
+MISSES_KEY = "gradebook_misses"
+
+
+def get_gradebook(canvas, course_id, flat=False, refresh=False):
+    """Gets the course gradebook from the cache, fetching it from Canvas
+    if it is not cached
+
+    Parameters
+    ----------
+    canvas : FlexCanvas
+        Canvas API used on a miss
+    course_id : int
+        Canvas course ID
+    flat : bool
+        True for flat grading, see FlexCanvas.get_gradebook
+    refresh : bool
+        True to invalidate the course's cached gradebooks first
+
+    Returns
+    -------
+    GradeBook
+    """
+
+    cache = caches[CACHE_ALIAS]
+    if refresh:
+        invalidate(course_id)
+
+    key = _get_key(cache, course_id, flat)
+    gradebook = cache.get(key)
+    if gradebook is not None:
+        _increment(cache, HITS_KEY)
+        return gradebook
+
+    _increment(cache, MISSES_KEY)
+    gradebook = canvas.get_gradebook(course_id, flat=flat)
+    cache.set(key, gradebook, settings.CANVAS_CACHE_TTL)
+
+    return gradebook
+
+
+def invalidate(course_id):
+    """Invalidates every cached gradebook of a course, e.g. after its
+    assignment group weights change on Canvas"""
+
+    _increment(caches[CACHE_ALIAS], VERSION_KEY.format(course_id=course_id))
+
+
+def get_stats():
+    """Returns cache hits and misses across all workers
+
+    Returns
+    -------
+    dict
+        Contains hits and misses counts
+    """
+
+    cache = caches[CACHE_ALIAS]
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {"hits": counts.get(HITS_KEY, 0), "misses": counts.get(MISSES_KEY, 0)}
+
+
+def _get_key(cache, course_id, flat):
+    version = cache.get(VERSION_KEY.format(course_id=course_id), 0)
+    return GRADEBOOK_KEY.format(
+        course_id=course_id, query="flat" if flat else "groups", version=version
+    )
+
+
+def _increment(cache, key):
+    """Increments a counter that never expires, starting it at 0
+
+    cache.incr is not used since it resets the timeout to CANVAS_CACHE_TTL.
+    Concurrent increments may be lost, which only undercounts stats and
+    still changes the version.
+    """
+
+    cache.set(key, cache.get(key, 0) + 1, timeout=None)
@@ -1,33 +1,25 @@
 from flexible_assessment.models import UserProfile, Roles
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal
 
+import numpy as np
 
-def round_half_up(value, digits=2):
-    if value is None:
-        return None
-    """Rounds a float to the specified number of digits using ROUND_HALF_UP"""
-    d = Decimal(str(value))  # Convert to Decimal
-    return d.quantize(Decimal(10) ** -digits, rounding=ROUND_HALF_UP)
+from . import grade_math
+from .flex_matrix import FlexMatrix
+from .grade_math import round_half_up
 
+# Float totals this close to a rounding tie (in units of the last kept digit)
+# are recomputed exactly so results match ROUND_HALF_UP
+TIE_TOLERANCE = 1e-6
 
-from decimal import Decimal
 
-
-def get_default_total(groups, student):
+def get_default_total(gradebook, student):
     """Calculates default total grade for student using assignment groups"""
-    student_id = student.user_id
-    student_id_str = str(student_id)
     scores = []
     weights = []
 
-    for assessment in groups.values():
-        grades = assessment["grade_list"]["grades"]
-        for curr_id, score in grades:
-            if student_id_str == curr_id:
-                if score is not None:
-                    scores.append(Decimal(score))
-                    weights.append(Decimal(assessment["group_weight"]))
-                break
+    for score, weight in gradebook.get_student_scores(student.user_id):
+        scores.append(Decimal(score))
+        weights.append(Decimal(weight))
 
     # Convert weights to Decimal to avoid type mismatch
     score_weight = zip(scores, weights)
@@ -85,16 +77,14 @@ def get_default_total(groups, student):
 #     return round(overall, 2)
 
 
-def valid_flex(student, course):
-    null_flex_assessments = student.flexassessment_set.filter(
-        assessment__course=course, flex__isnull=True
-    )
-    flex_assessments_with_flex = student.flexassessment_set.filter(
-        assessment__course=course, flex__isnull=False
-    )
-    flex_sum = sum([fa.flex for fa in flex_assessments_with_flex])
+def valid_flex(student, course, flex_matrix=None):
+    """Checks that none of the student's flex allocations are null
+    and that they sum to 100"""
+
+    if flex_matrix is None:
+        flex_matrix = FlexMatrix.load(course, [student])
 
-    return (not null_flex_assessments) and (flex_sum == 100)
+    return flex_matrix.is_valid(student.user_id)
 
 
 # def get_override_total(groups, student, course):
@@ -143,9 +133,12 @@ def valid_flex(student, course):
 #     return round(overall, 2)
 
 
-def get_override_total(groups, student, course):
+def get_override_total(gradebook, student, course, flex_matrix=None):
     """Calculates override grade for student using assignment groups and flex allocations"""
-    if not valid_flex(student, course):
+    if flex_matrix is None:
+        flex_matrix = FlexMatrix.load(course, [student])
+
+    if not valid_flex(student, course, flex_matrix):
         return None
 
     scores = []
@@ -154,10 +147,10 @@ def get_override_total(groups, student, course):
 
     for assessment in assessments:
         # Ensure that flex is a Decimal for consistent precision
-        flex = Decimal(assessment.flexassessment_set.filter(user=student).first().flex)
-        score = get_score(groups, assessment.group, student)
+        flex = flex_matrix.get_flex(student.user_id, assessment.id)
+        score = get_score(gradebook, assessment.group, student)
 
-        if score is not None:
+        if score is not None and flex is not None:
             scores.append(Decimal(score))  # Ensure score is Decimal
             flex_set.append(flex)  # Use Decimal directly
 
@@ -175,8 +168,6 @@ def get_override_total(groups, student, course):
     else:
         overall = Decimal(0)
 
-    print(f"printing before the rounding {overall}")
-
     # return float(overall)
 
     return overall
@@ -184,14 +175,14 @@ def get_override_total(groups, student, course):
     # return overall
 
 
-def get_averages(groups, course):
+def get_averages(gradebook, course):
     """Calculates the average override grade, default grade,
     and difference for all students in a course
 
     Parameters
     ----------
-    groups : dict
-        Assignment groups retrieved from Canvas API
+    gradebook : GradeBook
+        Assignment group scores retrieved from Canvas API
     course : Course
         Course object
 
@@ -206,50 +197,486 @@ def get_averages(groups, course):
         usercourse__role=Roles.STUDENT, usercourse__course=course
     )
 
+    return get_course_grades(gradebook, course, students).averages
+
+
+class CourseGrades:
+    """Override and default totals for every student in a course
+
+    Totals are rounded to 3 decimal places with ROUND_HALF_UP, matching
+    round_half_up applied to get_override_total and get_default_total.
+
+    Attributes
+    ----------
+    averages : list
+        Average override grade, average default grade and average
+        difference, as returned by get_averages
+    """
+
+    def __init__(self, user_ids, overrides, defaults, averages):
+        """Totals are ints in thousandths, see grade_math"""
+
+        self._totals = dict(zip(user_ids, zip(overrides, defaults)))
+        self.averages = averages
+
+    def __contains__(self, student):
+        return str(student.user_id) in self._totals
+
+    def __len__(self):
+        return len(self._totals)
+
+    def get_totals(self, student):
+        """Gets override and default total for student
+
+        Returns
+        -------
+        override : Union[Decimal, None]
+            Override total, None if student does not have
+            a valid flex allocation
+        default : Decimal
+            Default total
+        """
+
+        override, default = self._totals[str(student.user_id)]
+        if override is not None:
+            override = grade_math.to_decimal(override, 3)
+        return override, grade_math.to_decimal(default, 3)
+
+    def get_fixed_totals(self, student):
+        """Gets override and default total for student as ints in
+        thousandths, as in get_totals"""
+
+        return self._totals[str(student.user_id)]
+
+
+def get_course_grades(gradebook, course, students, flex_matrix=None):
+    """Calculates override totals, default totals and averages for all
+    students at once using score, weight and flex matrices
+
+    Parameters
+    ----------
+    gradebook : GradeBook
+        Assignment group scores retrieved from Canvas API
+    course : Course
+        Course object
+    students : QuerySet
+        Students in the course to calculate grades for
+    flex_matrix : Union[FlexMatrix, None]
+        Flex allocations for the students, loaded if None
+
+    Returns
+    -------
+    CourseGrades
+        Totals for each student and course averages
+    """
+
+    totals = calculate_course_totals(gradebook, course, students, flex_matrix)
+
+    return CourseGrades(
+        totals["user_ids"], totals["overrides"], totals["defaults"], totals["averages"]
+    )
+
+
+def calculate_course_totals(gradebook, course, students, flex_matrix=None):
+    """Calculates course grades as in get_course_grades, also returning the
+    arrays they were calculated from
+
+    Returns
+    -------
+    totals : dict
+        Contains user_ids, assessment_ids, assessment_scores (students x
+        assessments), valid flags, unrounded default_totals and
+        override_totals, defaults and overrides rounded to ints in
+        thousandths, the sums of the
+        override, default and difference columns averaged by get_averages,
+        and averages
+    """
+
+    students = list(students)
+    user_ids = [str(student.user_id) for student in students]
+    assessments = list(course.assessment_set.all())
+
+    scores = gradebook.get_scores(user_ids)
+    group_weights = np.broadcast_to(gradebook.get_group_weights(), scores.shape)
+    default_totals = _weighted_totals(scores, group_weights)
+
+    if flex_matrix is None:
+        flex_matrix = FlexMatrix.load(course, students)
+    # Flex allocations are in hundredths
+    flexes = flex_matrix.get_flexes(
+        user_ids, [assessment.id for assessment in assessments]
+    )
+    valid = flex_matrix.get_valid(user_ids)
+    assessment_scores = gradebook.get_scores(
+        user_ids, [assessment.group for assessment in assessments]
+    )
+    override_totals = _weighted_totals(
+        assessment_scores, np.where(valid[:, np.newaxis], flexes, 0) / 100
+    )
+    defaults = _round_totals(
+        default_totals,
+        lambda row: _exact_total(scores[row], group_weights[row]),
+    )
+    overrides = _round_totals(
+        override_totals,
+        lambda row: _exact_total(assessment_scores[row], flexes[row]),
+        valid,
+    )
+    override_totals = np.where(valid, override_totals, np.nan)
+
+    columns = [
+        np.where(valid, override_totals, default_totals),
+        default_totals,
+        np.where(valid, override_totals - default_totals, 0),
+    ]
+    sums = [float(column.sum()) for column in columns]
+    averages = get_averages_from_sums(sums, len(user_ids))
+    if averages is None:
+        averages = _get_exact_course_averages(
+            scores, group_weights, assessment_scores, flexes, valid
+        )
+
+    return {
+        "user_ids": user_ids,
+        "assessment_ids": [assessment.id for assessment in assessments],
+        "assessment_scores": assessment_scores,
+        "valid": valid,
+        "default_totals": default_totals,
+        "override_totals": override_totals,
+        "defaults": defaults,
+        "overrides": overrides,
+        "sums": sums,
+        "averages": averages,
+    }
+
+
+def get_student_override(assessment_scores, flexes, valid):
+    """Calculates one student's override total from their assessment scores
+    and flex allocations, as in calculate_course_totals
+
+    Parameters
+    ----------
+    assessment_scores : list
+        Student's score for each assessment, None where there is no score
+    flexes : list
+        Student's flex allocation for each assessment in hundredths
+    valid : bool
+        Whether the student has a valid flex allocation
+
+    Returns
+    -------
+    override_total : Union[float, None]
+        Unrounded override total, None if flex allocation is not valid
+    override : Union[int, None]
+        Override total rounded to thousandths
+    """
+
+    if not valid:
+        return None, None
+
+    scores = np.array(
+        [[np.nan if score is None else score for score in assessment_scores]],
+        dtype=float,
+    )
+    flexes = np.array([flexes], dtype=float)
+    totals = _weighted_totals(scores, flexes / 100)
+    override = _round_totals(
+        totals, lambda row: _exact_total(scores[row], flexes[row])
+    )[0]
+
+    return float(totals[0]), override
+
+
+def get_averages_from_sums(sums, count):
+    """Rounds averages from the sums of the override, default and difference
+    columns, None if an average is too close to a tie to round from floats"""
+
+    if count == 0:
+        return [0, 0, 0]
+
+    means = np.array(sums) / count
+    if _near_tie(means, 2).any():
+        return None
+
+    return [
+        grade_math.to_decimal(int(value), 2) for value in np.floor(means * 100 + 0.5)
+    ]
+
+
+class OptimalGrades:
+    """Best legal flex allocation and resulting override total for every
+    student in a course, and how far each student's grade is from it
+
+    Attributes
+    ----------
+    assessment_ids : list
+        Assessment IDs in the order of get_flexes
+    averages : list
+        Average optimal total and average distance from optimal
+    """
+
+    def __init__(self, user_ids, assessment_ids, flexes, totals, distances):
+        """Totals are ints in thousandths and distances ints in hundredths"""
+
+        self.assessment_ids = list(assessment_ids)
+        self._index = {user_id: i for i, user_id in enumerate(user_ids)}
+        self._flexes = flexes
+        self._totals = totals
+        self._distances = distances
+
+        count = len(totals)
+        if count:
+            self.averages = [
+                grade_math.to_decimal(
+                    grade_math.div_half_up(sum(totals), count * 10), 2
+                ),
+                grade_math.to_decimal(grade_math.mean_fixed(distances), 2),
+            ]
+        else:
+            self.averages = [0, 0]
+
+    def __contains__(self, student):
+        return str(student.user_id) in self._index
+
+    def get_flexes(self, student):
+        """Gets the student's optimal flex allocation for each assessment"""
+
+        row = self._flexes[self._index[str(student.user_id)]]
+        return [grade_math.to_decimal(int(flex), 2) for flex in row]
+
+    def get_totals(self, student):
+        """Gets optimal total and distance from optimal for student
+
+        Returns
+        -------
+        optimal : Decimal
+            Override total with the optimal allocation, rounded to 3
+            decimal places
+        distance : Decimal
+            Optimal total minus the student's final total, both rounded
+            to 2 decimal places
+        """
+
+        row = self._index[str(student.user_id)]
+        return (
+            grade_math.to_decimal(self._totals[row], 3),
+            grade_math.to_decimal(self._distances[row], 2),
+        )
+
+    def get_fixed_totals(self, student):
+        """Gets optimal total in thousandths and distance from optimal in
+        hundredths for student, as in get_totals"""
+
+        row = self._index[str(student.user_id)]
+        return self._totals[row], self._distances[row]
+
+
+def get_optimal_grades(gradebook, course, students, course_grades):
+    """Calculates each student's grade maximizing flex allocation within
+    the assessment min and max bounds, and its distance from the grade
+    their own choice gives
+
+    Parameters
+    ----------
+    gradebook : GradeBook
+        Assignment group scores retrieved from Canvas API
+    course : Course
+        Course object
+    students : QuerySet
+        Students in the course
+    course_grades : CourseGrades
+        Totals for the students, the override total is used for students
+        with a valid flex allocation and the default total otherwise
+
+    Returns
+    -------
+    OptimalGrades
+    """
+
+    students = list(students)
+    user_ids = [str(student.user_id) for student in students]
+    assessments = list(course.assessment_set.all())
+
+    assessment_scores = gradebook.get_scores(
+        user_ids, [assessment.group for assessment in assessments]
+    )
+    # Bounds are in hundredths so the allocation sums to exactly 100
+    mins = np.array([int(assessment.min * 100) for assessment in assessments])
+    maxs = np.array([int(assessment.max * 100) for assessment in assessments])
+    flexes = get_optimal_flexes(assessment_scores, mins, maxs)
+
+    totals = _round_totals(
+        _weighted_totals(assessment_scores, flexes / 100),
+        lambda row: _exact_total(assessment_scores[row], flexes[row]),
+    )
+
+    distances = []
+    for student, total in zip(students, totals):
+        override, default = course_grades.get_fixed_totals(student)
+        final = override if override is not None else default
+        distances.append(
+            grade_math.round_fixed(total, 3, 2) - grade_math.round_fixed(final, 3, 2)
+        )
+
+    return OptimalGrades(
+        user_ids,
+        [assessment.id for assessment in assessments],
+        flexes,
+        totals,
+        distances,
+    )
+
+
+def get_optimal_flexes(assessment_scores, mins, maxs):
+    """Finds the flex allocation maximizing each student's override total
+
+    Every assessment starts at its minimum and the remaining allocation is
+    filled greedily, each assessment up to its maximum. The override total
+    only weighs assessments with a score, so it is the ratio of weighted
+    scores to scored weight. The best allocation fills the student's
+    highest scores while they are above the running average, then the
+    assessments without a score, then the remaining scores from the
+    highest. Every number of leading scores is tried and the best total
+    kept. The bounds are assumed to allow a sum of 100, as the assessment
+    form checks.
+
+    Parameters
+    ----------
+    assessment_scores : np.ndarray
+        Students x assessments scores, NaN where there is no score
+    mins, maxs : np.ndarray
+        Assessment bounds in hundredths
+
+    Returns
+    -------
+    flexes : np.ndarray
+        Students x assessments allocations in hundredths
+    """
+
+    has_score = ~np.isnan(assessment_scores)
+    priority = np.where(has_score, assessment_scores, -np.inf)
+    # Stable sort keeps course order between equal scores
+    rank = np.argsort(
+        np.argsort(-priority, axis=1, kind="stable"), axis=1, kind="stable"
+    )
+    count = assessment_scores.shape[1]
+
+    best_flexes = best_totals = None
+    # From filling every score first, so ties keep the plain greedy allocation
+    for leading in range(has_score.sum(axis=1).max(initial=0), -1, -1):
+        key = np.where(
+            has_score, np.where(rank < leading, rank, 2 * count + rank), count + rank
+        )
+        flexes = _fill_flexes(np.argsort(key, axis=1, kind="stable"), mins, maxs)
+        totals = _weighted_totals(assessment_scores, flexes / 100)
+        if best_flexes is None:
+            best_flexes, best_totals = flexes, totals
+            continue
+
+        better = totals > best_totals + 1e-9
+        best_flexes = np.where(better[:, np.newaxis], flexes, best_flexes)
+        best_totals = np.where(better, totals, best_totals)
+
+    return best_flexes
+
+
+def _fill_flexes(order, mins, maxs):
+    """Fills each student's allocation above the minimums in the given order"""
+
+    capacity = np.broadcast_to(maxs - mins, order.shape)
+    sorted_capacity = np.take_along_axis(capacity, order, axis=1)
+    filled_before = np.cumsum(sorted_capacity, axis=1) - sorted_capacity
+    sorted_extra = np.clip(10000 - mins.sum() - filled_before, 0, sorted_capacity)
+
+    extra = np.empty_like(sorted_extra)
+    np.put_along_axis(extra, order, sorted_extra, axis=1)
+
+    return mins + extra
+
+
+def _weighted_totals(scores, weights):
+    """Vectorized weighted totals, skipping missing scores"""
+
+    has_score = ~np.isnan(scores)
+    weights = np.where(has_score, weights, 0)
+    overall = (np.where(has_score, scores, 0) * weights).sum(axis=1) / 100
+    total_weight = weights.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total_weight != 0, overall / total_weight * 100, 0.0)
+
+
+def _exact_total(scores, weights):
+    """Exact weighted total for one student's row of scores and weights,
+    rounded half up to thousandths"""
+
+    return grade_math.weighted_total(scores.tolist(), np.asarray(weights).tolist(), 3)
+
+
+def _near_tie(values, digits):
+    scaled = values * 10**digits
+    return np.abs(scaled - np.floor(scaled) - 0.5) < TIE_TOLERANCE
+
+
+def _round_totals(totals, exact_total, mask=None):
+    """Rounds float totals half up to ints in thousandths, using the exact
+    calculation for rows too close to a tie to trust the float"""
+
+    near_tie = _near_tie(totals, 3)
+    thousandths = np.floor(totals * 1000 + 0.5).astype(np.int64)
+
+    rounded = []
+    for row, value in enumerate(thousandths.tolist()):
+        if mask is not None and not mask[row]:
+            rounded.append(None)
+        elif near_tie[row]:
+            rounded.append(exact_total(row))
+        else:
+            rounded.append(value)
+
+    return rounded
+
+
+def _get_exact_course_averages(scores, group_weights, assessment_scores, flexes, valid):
+    """Exact averages used when a float average is too close to a tie"""
+
     overrides = []
     defaults = []
     diffs = []
 
-    for student in students:
-        default_total = get_default_total(groups, student)
+    for row in range(len(scores)):
+        default_total = grade_math.exact_weighted_total(
+            scores[row].tolist(), group_weights[row].tolist()
+        )
         defaults.append(default_total)
 
-        override = get_override_total(groups, student, course)
-        if override is not None:
+        if valid[row]:
+            override = grade_math.exact_weighted_total(
+                assessment_scores[row].tolist(), flexes[row].tolist()
+            )
             overrides.append(override)
             diffs.append(override - default_total)
         else:
             overrides.append(default_total)
             diffs.append(0)
 
-    averages = []
-    for curr_list in [overrides, defaults, diffs]:
-        averages.append(
-            round_half_up(sum(curr_list) / len(curr_list), 2)
-            if len(curr_list) != 0
-            else 0
+    return [
+        grade_math.to_decimal(
+            grade_math.round_fraction(sum(curr_list) / len(curr_list), 2), 2
         )
-
-    return averages
+        for curr_list in [overrides, defaults, diffs]
+    ]
 
 
-def get_group_weight(groups, id):
+def get_group_weight(gradebook, id):
     """Gets Canvas assignment group weight"""
 
     try:
-        return round(groups[str(id)]["group_weight"], 2)
+        return round(gradebook.get_group_weight(id), 2)
     except Exception:
         return ""
 
 
-def get_score(groups, group_id, student):
+def get_score(gradebook, group_id, student):
     """Gets student score in assignment group"""
 
-    student_id = student.user_id
-    group_id_str = str(group_id)
-    student_id_str = str(student_id)
-    grades = groups[group_id_str]["grade_list"]["grades"]
-    for curr_id, score in grades:
-        if student_id_str == curr_id:
-            return score
-    return None
+    return gradebook.get_score(group_id, student.user_id)
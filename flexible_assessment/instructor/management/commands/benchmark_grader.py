@@ -0,0 +1,317 @@
+"""Benchmarks reading Canvas grade responses and grade calculation over
+synthetic courses
+
+Runs against a throwaway test database so the configured database is never
+touched. Results are written as JSON so runs from different commits can be
+compared, e.g.
+
+    python manage.py benchmark_grader --sizes 50 2000 --output before.json
+
+With --fake-canvas, grades are also fetched and final grades submitted
+over HTTP through a local fake Canvas (see flexible_assessment/fake_canvas.py)
+with --canvas-latency seconds added to each response.
+"""
+
+import itertools
+
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from flexible_assessment import fake_canvas, synthetic
+from flexible_assessment.models import Course, Roles, UserProfile
+from instructor import grader, simulator, writer
+from instructor.canvas_api import FlexCanvas
+from instructor.flex_matrix import FlexMatrix
+from instructor.gradebook import GradeBook
+
+DEFAULT_SIZES = [50, 500, 2000, 10000]
+DEFAULT_ASSESSMENTS = [4, 10]
+
+
+class Command(BaseCommand):
+    help = (
+        "Records wall time, peak memory and SQL query counts of grade "
+        "calculation over synthetic courses"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=DEFAULT_SIZES,
+            help="Numbers of students per course",
+        )
+        parser.add_argument(
+            "--assessments",
+            nargs="+",
+            type=int,
+            default=DEFAULT_ASSESSMENTS,
+            help="Numbers of assessments per course",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Runs per benchmark, the fastest is recorded",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", help="JSON file for results, printed if not given"
+        )
+        parser.add_argument(
+            "--fake-canvas",
+            action="store_true",
+            help="Also benchmark Canvas requests against a local fake Canvas",
+        )
+        parser.add_argument(
+            "--canvas-latency",
+            type=float,
+            default=0.02,
+            help="Seconds the fake Canvas adds to each response",
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        canvas_server = None
+        if options["fake_canvas"]:
+            canvas_server = fake_canvas.FakeCanvasServer(
+                ("127.0.0.1", 0),
+                fake_canvas.CanvasState(),
+                latency=options["canvas_latency"],
+            )
+            canvas_server.start()
+        try:
+            results = []
+            course_id = 1
+            for assessment_count in options["assessments"]:
+                for student_count in options["sizes"]:
+                    results += self.run_course(
+                        course_id,
+                        student_count,
+                        assessment_count,
+                        options["repeat"],
+                        options["seed"],
+                        canvas_server,
+                    )
+                    course_id += 1
+        finally:
+            if canvas_server is not None:
+                canvas_server.stop()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            "commit": _get_commit(),
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "results": results,
+        }
+        output = json.dumps(report, indent=2)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+            self.stdout.write("Results written to {}".format(options["output"]))
+        else:
+            self.stdout.write(output)
+
+    def run_course(
+        self,
+        course_id,
+        student_count,
+        assessment_count,
+        repeat,
+        seed,
+        canvas_server=None,
+    ):
+        """Creates a course and runs every benchmark against it, including
+        requests to canvas_server if given"""
+
+        course = synthetic.create_course(
+            course_id, student_count, assessment_count, seed=seed
+        )
+        Course.objects.filter(pk=course_id).update(close=datetime.now(timezone.utc))
+        groups, enrollments = synthetic.build_groups(course, seed=seed)
+        payload = synthetic.build_graphql_payload(course, seed=seed)
+        flex_canvas = FlexCanvas(None, access_token="benchmark")
+        gradebook = GradeBook.from_groups(groups, enrollments)
+        students = list(
+            UserProfile.objects.filter(
+                usercourse__role=Roles.STUDENT, usercourse__course=course
+            )
+        )
+
+        client = Client()
+        client.force_login(
+            UserProfile.objects.get(
+                usercourse__role=Roles.TEACHER, usercourse__course=course
+            )
+        )
+        session = client.session
+        session["display_name"] = "Benchmark"
+        session.save()
+        url = reverse("instructor:final_grades", args=[course_id])
+
+        def default_total():
+            for student in students:
+                grader.get_default_total(gradebook, student)
+
+        def override_total():
+            flex_matrix = FlexMatrix.load(course, students)
+            for student in students:
+                grader.get_override_total(gradebook, student, course, flex_matrix)
+
+        def final_grade_list_cold():
+            # Recalculate grades instead of reading the saved grade snapshot
+            course.bump_flex_version()
+            final_grade_list_warm()
+
+        def final_grade_list_warm():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(
+                    "Final grade list returned {}".format(response.status_code)
+                )
+
+        def parse_groups():
+            with patch.object(flex_canvas, "graphql", return_value=payload):
+                flex_canvas.get_groups_and_enrollments(course_id)
+
+        def parse_flat_groups():
+            with patch.object(flex_canvas, "graphql", return_value=payload):
+                flex_canvas.get_flat_groups_and_enrollments(course_id)
+
+        benchmarks = [
+            ("parse_groups", parse_groups),
+            ("parse_flat_groups", parse_flat_groups),
+            ("get_default_total", default_total),
+            ("get_override_total", override_total),
+            ("get_averages", lambda: grader.get_averages(gradebook, course)),
+            ("grades_csv", lambda: writer.grades_csv(course, students, gradebook)),
+            ("final_grade_list_cold", final_grade_list_cold),
+            ("final_grade_list_warm", final_grade_list_warm),
+            (
+                "simulate_course",
+                lambda: simulator.simulate_course(
+                    gradebook,
+                    course,
+                    students,
+                    [{}] * simulator.MAX_CONFIGURATIONS,
+                ),
+            ),
+        ]
+        if canvas_server is not None:
+            benchmarks += self.get_canvas_benchmarks(
+                canvas_server, course, payload, enrollments
+            )
+
+        results = []
+        with patch("instructor.views.FlexCanvas") as canvas:
+            canvas.return_value.get_gradebook.return_value = gradebook
+            for name, benchmark in benchmarks:
+                result = {
+                    "benchmark": name,
+                    "students": student_count,
+                    "assessments": assessment_count,
+                }
+                result.update(_measure(benchmark, repeat))
+                results.append(result)
+                self.stderr.write(
+                    "{benchmark} students={students} assessments={assessments}: "
+                    "{wall_time:.4f}s {peak_memory} bytes {queries} queries".format(
+                        **result
+                    )
+                )
+
+        return results
+
+    def get_canvas_benchmarks(self, canvas_server, course, payload, enrollments):
+        """Returns benchmarks fetching the course's grades from the fake
+        Canvas and submitting an override for every student"""
+
+        with canvas_server.state.lock:
+            canvas_server.state.add_synthetic_course(
+                course, payload=payload, quiz_count=0, new_quiz_count=0
+            )
+        overrides = {enrollment_id: 75.0 for enrollment_id in enrollments.values()}
+        # Each run has its own access token so starts with a full rate limit
+        tokens = ("benchmark-{}".format(i) for i in itertools.count())
+
+        def get_canvas():
+            with override_settings(CANVAS_DOMAIN=canvas_server.url):
+                return FlexCanvas(None, access_token=next(tokens))
+
+        return [
+            (
+                "canvas_get_groups",
+                lambda: get_canvas().get_groups_and_enrollments(course.id),
+            ),
+            (
+                "canvas_get_flat_groups",
+                lambda: get_canvas().get_flat_groups_and_enrollments(course.id),
+            ),
+            ("canvas_set_overrides", lambda: get_canvas().set_overrides(overrides)),
+        ]
+
+
+def _measure(benchmark, repeat):
+    """Runs benchmark repeat times for the fastest wall time and its query
+    count, then once more under tracemalloc for peak memory, which is
+    measured separately since tracing slows everything down"""
+
+    wall_time = None
+    queries = None
+    for _ in range(max(repeat, 1)):
+        counter = _QueryCounter()
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            benchmark()
+            elapsed = time.perf_counter() - start
+        if wall_time is None or elapsed < wall_time:
+            wall_time = elapsed
+            queries = counter.count
+
+    tracemalloc.start()
+    try:
+        benchmark()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"wall_time": wall_time, "peak_memory": peak_memory, "queries": queries}
+
+
+class _QueryCounter:
+    """Database execute wrapper counting queries, unlike
+    CaptureQueriesContext it is not limited to the last 9000"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,56 @@
+"""Runs final grade submissions queued from the final grades page, e.g.
+
+    python manage.py run_grade_submissions
+
+keeps running and checks for queued submissions every few seconds, while
+
+    python manage.py run_grade_submissions --once
+
+runs the submissions queued so far and exits, e.g. from cron.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from instructor import grade_submission
+
+
+class Command(BaseCommand):
+    help = "Submits queued final grades to Canvas"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no submission is queued",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait before checking the queue again",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            submission = grade_submission.claim()
+            if submission is None:
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+                continue
+
+            self.stdout.write(
+                "Submitting final grades of course {}".format(submission.course_id)
+            )
+            try:
+                grade_submission.run(submission)
+            except Exception as e:
+                # The worker keeps running other courses' submissions
+                grade_submission.fail(submission, str(e))
+            submission.refresh_from_db()
+            self.stdout.write(
+                "Final grades of course {} {}".format(
+                    submission.course_id, submission.status
+                )
+            )
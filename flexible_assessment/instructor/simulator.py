@@ -0,0 +1,272 @@
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+
+from . import grade_math, grader
+from .flex_matrix import FlexMatrix
+
+# Lower edges of the final grade distribution bins, the last bin is open ended
+GRADE_BINS = [0, 10, 20, 30, 40, 50, 60, 70, 80, 90]
+MAX_CONFIGURATIONS = 100
+ALLOCATION_FIELDS = ("default", "min", "max")
+
+
+def simulate_course(gradebook, course, students, configurations, flex_matrix=None):
+    """Evaluates candidate assessment default, min and max configurations
+    against the course gradebook and flex allocations
+
+    Students with flex allocations outside a configuration's ranges would
+    be reset by InstructorAssessmentView, so their final grade falls back
+    to the default total weighted by the configuration defaults.
+
+    Parameters
+    ----------
+    gradebook : GradeBook
+        Assignment group scores retrieved from Canvas API
+    course : Course
+        Course object
+    students : QuerySet
+        Students in the course
+    configurations : list
+        Each configuration is a dict of assessment ID to a dict with any of
+        default, min and max, assessments not included keep their values
+    flex_matrix : Union[FlexMatrix, None]
+        Flex allocations for the students, loaded if None
+
+    Returns
+    -------
+    results : dict
+        Contains bins, the current configuration summary and a summary for
+        each configuration, see _summarize
+
+    Raises
+    ------
+    ValueError
+        If a configuration is not a valid set of assessment allocations
+    """
+
+    students = list(students)
+    assessments = list(course.assessment_set.all())
+    defaults, mins, maxs = get_configuration_arrays(assessments, configurations)
+
+    if flex_matrix is None:
+        flex_matrix = FlexMatrix.load(course, students)
+    totals = grader.calculate_course_totals(gradebook, course, students, flex_matrix)
+    flexes = flex_matrix.get_flexes(
+        totals["user_ids"], totals["assessment_ids"], fill_value=np.nan
+    )
+
+    grades, default_totals, conflicts = simulate_grades(
+        totals["assessment_scores"],
+        flexes,
+        totals["override_totals"],
+        totals["valid"],
+        defaults,
+        mins,
+        maxs,
+    )
+
+    # First configuration is the current one
+    summaries = _summarize(grades, default_totals, conflicts)
+
+    return {
+        "bins": GRADE_BINS,
+        "current": summaries[0],
+        "results": summaries[1:],
+    }
+
+
+def get_configuration_arrays(assessments, configurations):
+    """Builds default, min and max arrays for the current assessments
+    followed by each configuration
+
+    Parameters
+    ----------
+    assessments : list
+        Course assessments, in the order of the array columns
+    configurations : list
+        Configurations as described in simulate_course
+
+    Returns
+    -------
+    defaults, mins, maxs : np.ndarray
+        (configurations + 1) x assessments arrays in percent
+    """
+
+    if not isinstance(configurations, list) or not configurations:
+        raise ValueError("At least one configuration is required.")
+    if len(configurations) > MAX_CONFIGURATIONS:
+        raise ValueError(
+            "At most {} configurations can be simulated.".format(MAX_CONFIGURATIONS)
+        )
+
+    current = {
+        str(assessment.id): {
+            "default": assessment.default,
+            "min": assessment.min,
+            "max": assessment.max,
+        }
+        for assessment in assessments
+    }
+
+    rows = [current]
+    for index, configuration in enumerate(configurations, start=1):
+        if not isinstance(configuration, dict):
+            raise ValueError("Configuration {} is not an object.".format(index))
+        unknown = set(configuration) - set(current)
+        if unknown:
+            raise ValueError("Configuration {} has unknown assessments.".format(index))
+
+        row = {}
+        for assessment_id, allocations in current.items():
+            changes = configuration.get(assessment_id, {})
+            if not isinstance(changes, dict):
+                raise ValueError("Configuration {} is not valid.".format(index))
+            row[assessment_id] = {
+                field: _to_decimal(changes.get(field, allocations[field]), index)
+                for field in ALLOCATION_FIELDS
+            }
+        _validate_configuration(row, index)
+        rows.append(row)
+
+    arrays = [
+        np.array(
+            [[float(row[str(a.id)][field]) for a in assessments] for row in rows],
+            dtype=float,
+        ).reshape(len(rows), len(assessments))
+        for field in ALLOCATION_FIELDS
+    ]
+
+    return tuple(arrays)
+
+
+def simulate_grades(
+    assessment_scores, flexes, override_totals, valid, defaults, mins, maxs
+):
+    """Calculates final grades for every student under every configuration
+    in one vectorized pass
+
+    Parameters
+    ----------
+    assessment_scores : np.ndarray
+        Students x assessments scores, NaN where there is no score
+    flexes : np.ndarray
+        Students x assessments flex allocations in hundredths, NaN where null
+    override_totals : np.ndarray
+        Unrounded override total for each student, NaN if not valid
+    valid : np.ndarray
+        Whether each student has a valid flex allocation
+    defaults, mins, maxs : np.ndarray
+        Configurations x assessments allocations in percent
+
+    Returns
+    -------
+    grades : np.ndarray
+        Configurations x students final grades
+    default_totals : np.ndarray
+        Configurations x students totals weighted by configuration defaults
+    conflicts : np.ndarray
+        Configurations x students, True where a flex allocation is out of
+        range, as in Assessment.check_valid_flex
+    """
+
+    has_score = ~np.isnan(assessment_scores)
+    scores = np.where(has_score, assessment_scores, 0)
+
+    overall = defaults @ scores.T / 100
+    total_weight = defaults @ has_score.T.astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        default_totals = np.where(total_weight != 0, overall / total_weight * 100, 0.0)
+
+    # Comparisons with NaN are False, so null flex allocations never conflict.
+    # Bounds are compared in whole hundredths, as percents like 33.34 are not
+    # exact as floats and 33.34 * 100 is 3333.9999999999995
+    flexes = flexes[np.newaxis, :, :]
+    conflicts = (
+        (flexes < np.rint(mins * 100)[:, np.newaxis, :])
+        | (flexes > np.rint(maxs * 100)[:, np.newaxis, :])
+    ).any(axis=2)
+
+    keeps_override = valid[np.newaxis, :] & ~conflicts
+    grades = np.where(keeps_override, override_totals[np.newaxis, :], default_totals)
+
+    return grades, default_totals, conflicts
+
+
+def _summarize(grades, default_totals, conflicts):
+    """Summarizes each configuration's simulated grades against the first
+
+    Each summary contains averages (override, default and difference as in
+    grader.get_averages), distribution (final grade counts for GRADE_BINS),
+    conflicts, new_conflicts (conflicting students who do not conflict
+    with the first configuration) and changed (students whose final grade
+    changes by at least 0.01)
+    """
+
+    count = grades.shape[1]
+    bins = np.searchsorted(GRADE_BINS[1:], grades, side="right")
+    offsets = np.arange(len(grades))[:, np.newaxis] * len(GRADE_BINS)
+    distributions = np.bincount(
+        (bins + offsets).ravel(), minlength=len(grades) * len(GRADE_BINS)
+    ).reshape(len(grades), len(GRADE_BINS))
+
+    if count:
+        averages = np.stack(
+            [
+                grades.mean(axis=1),
+                default_totals.mean(axis=1),
+                (grades - default_totals).mean(axis=1),
+            ],
+            axis=1,
+        )
+    else:
+        averages = np.zeros((len(grades), 3))
+
+    new_conflicts = (conflicts & ~conflicts[0]).sum(axis=1)
+    changed = (np.abs(grades - grades[0]) >= 0.005).sum(axis=1)
+
+    return [
+        {
+            "averages": [
+                float(grade_math.round_half_up(average, 2)) for average in averages[i]
+            ],
+            "distribution": distributions[i].tolist(),
+            "conflicts": int(conflicts[i].sum()),
+            "new_conflicts": int(new_conflicts[i]),
+            "changed": int(changed[i]),
+        }
+        for i in range(len(grades))
+    ]
+
+
+def _to_decimal(value, index):
+    try:
+        value = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise ValueError("Configuration {} has a non-numeric value.".format(index))
+    if not value.is_finite():
+        raise ValueError("Configuration {} has a non-numeric value.".format(index))
+    return value
+
+
+def _validate_configuration(row, index):
+    """Checks allocations as in the assessment formset"""
+
+    default_sum = sum(allocations["default"] for allocations in row.values())
+    if default_sum != 100:
+        raise ValueError(
+            "Configuration {}: default assessments should add up to 100%.".format(index)
+        )
+
+    for allocations in row.values():
+        if any(value < 0 or value > 100 for value in allocations.values()):
+            raise ValueError(
+                "Configuration {}: allocations must be within 0.0 and 100.0".format(
+                    index
+                )
+            )
+        if not allocations["min"] <= allocations["default"] <= allocations["max"]:
+            raise ValueError(
+                "Configuration {}: minimum, default and maximum "
+                "must be in increasing order".format(index)
+            )
@@ -1,8 +1,10 @@
 from django import template
-from flexible_assessment.models import Assessment, Roles
+from flexible_assessment.models import Assessment
 import json
 
-from .. import grader
+from .. import grade_math, grader
+from ..grade_math import round_half_up
+from ..flex_matrix import FlexMatrix
 
 register = template.Library()
 
@@ -24,6 +26,16 @@ def has_null_flex_assessment(flex_assessments, course):
     ).exists()
 
 
+@register.simple_tag()
+def get_flex(flex_matrix, student, assessment):
+    return flex_matrix.get_flex(student.user_id, assessment.id)
+
+
+@register.simple_tag()
+def has_null_flex(flex_matrix, student):
+    return flex_matrix.has_null(student.user_id)
+
+
 @register.filter
 def to_str(value):
     return str(value) + "%" if value is not None else None
@@ -31,22 +43,18 @@ def to_str(value):
 
 @register.simple_tag()
 def get_response_rate(course):
-    user_courses = course.usercourse_set.filter(role=Roles.STUDENT)
-    students = [user_course.user for user_course in user_courses]
-    valid_num = sum([grader.valid_flex(student, course) for student in students])
-    if len(students) > 0:
-        percentage = round(valid_num / len(students) * 100, 2)
+    flex_matrix = FlexMatrix.load(course)
+    valid_num = flex_matrix.get_valid_count()
+    if len(flex_matrix) > 0:
+        percentage = round(valid_num / len(flex_matrix) * 100, 2)
     else:
         percentage = 0
-    return valid_num, len(students), percentage
+    return valid_num, len(flex_matrix), percentage
 
 
 @register.simple_tag()
 def get_number_responses(course):
-    user_courses = course.usercourse_set.filter(role=Roles.STUDENT)
-    students = [user_course.user for user_course in user_courses]
-    valid_num = sum([grader.valid_flex(student, course) for student in students])
-    return valid_num
+    return FlexMatrix.load(course).get_valid_count()
 
 
 @register.simple_tag()
@@ -165,8 +173,8 @@ def get_flex_difference(course):
 
 
 @register.simple_tag()
-def get_score(groups, group_id, student):
-    score = grader.get_score(groups, group_id, student)
+def get_score(gradebook, group_id, student):
+    score = grader.get_score(gradebook, group_id, student)
     score = round_half_up(score, 2)
     return str(score) + "%" if score is not None else None
 
@@ -185,43 +193,30 @@ def get_score(groups, group_id, student):
 #     else:
 #         return ("used-default", default_str, default_str, "0.00%")
 
-from decimal import Decimal, ROUND_HALF_UP
-
-
-def round_half_up(value, digits=2):
-    if value is None:
-        return None
-    """Rounds a float to the specified number of digits using ROUND_HALF_UP"""
-    d = Decimal(str(value))  # Convert to Decimal
-    return d.quantize(Decimal(10) ** -digits, rounding=ROUND_HALF_UP)
-
 
 @register.simple_tag()
-def get_student_grades(groups, student, course):
-    # Get the default total, and ensure it's a Decimal
-    default = grader.get_default_total(groups, student)
-    default = round_half_up(default, 3)
-    default = round_half_up(default, 2)
-    default_str = str(default) + "%"
-
-    # Get the override total, and ensure it's a Decimal (or None)
-    override = grader.get_override_total(groups, student, course)
-    override = round_half_up(override, 3)
-    override = round_half_up(override, 2)
+def get_student_grades(course_grades, student):
+    # Totals are in thousandths, shown rounded to hundredths
+    override, default = course_grades.get_fixed_totals(student)
+    default = grade_math.round_fixed(default, 3, 2)
+    default_str = grade_math.format_fixed(default, 2) + "%"
 
     if override is not None:
-        override = Decimal(override)  # Convert override to Decimal if it's not already
-
-        # Calculate the difference and apply "round half up" rounding to 2 decimal places
-        diff = (override - default).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        override = grade_math.round_fixed(override, 3, 2)
+        diff = override - default
 
         # Determine whether to add a prefix based on the diff
         prefix = "+" if diff > 0 else ""
-        diff_str = prefix + str(diff) + "%"
+        diff_str = prefix + grade_math.format_fixed(diff, 2) + "%"
 
-        return ("overriden", str(override) + "%", str(default) + "%", diff_str)
+        return (
+            "overriden",
+            grade_math.format_fixed(override, 2) + "%",
+            default_str,
+            diff_str,
+        )
     else:
-        return ("used-default", str(default) + "%", str(default) + "%", "0.00%")
+        return ("used-default", default_str, default_str, "0.00%")
 
 
 @register.simple_tag()
@@ -236,13 +231,13 @@ def not_flexible(default_min_max):
 
 
 @register.simple_tag()
-def get_group_weight(groups, id):
-    return grader.get_group_weight(groups, id)
+def get_group_weight(gradebook, id):
+    return grader.get_group_weight(gradebook, id)
 
 
 @register.simple_tag()
-def get_group_weight_percentage(groups, id):
-    percentage = grader.get_group_weight(groups, id)
+def get_group_weight_percentage(gradebook, id):
+    percentage = grader.get_group_weight(gradebook, id)
     if percentage is not None:
         return f"{percentage:.2f}%"
     else:
@@ -250,8 +245,8 @@ def get_group_weight_percentage(groups, id):
 
 
 @register.simple_tag()
-def get_averages_str(groups, course):
-    averages = grader.get_averages(groups, course)
+def get_averages_str(course_grades):
+    averages = course_grades.averages
     overall_avg, default_avg, diff_avg = averages[0], averages[1], averages[2]
     overall_str = str(overall_avg) + "%"
     default_str = str(default_avg) + "%"
@@ -259,3 +254,19 @@ def get_averages_str(groups, course):
     prefix = "+" if diff_avg > 0 else ""
     diff_str = prefix + str(diff_avg) + "%"
     return (overall_str, default_str, diff_str)
+
+
+@register.simple_tag()
+def get_optimal_grades(optimal_grades, student):
+    optimal, distance = optimal_grades.get_fixed_totals(student)
+    optimal = grade_math.round_fixed(optimal, 3, 2)
+    return (
+        grade_math.format_fixed(optimal, 2) + "%",
+        grade_math.format_fixed(distance, 2) + "%",
+    )
+
+
+@register.simple_tag()
+def get_optimal_averages_str(optimal_grades):
+    optimal_avg, distance_avg = optimal_grades.averages
+    return (str(optimal_avg) + "%", str(distance_avg) + "%")
@@ -1,7 +1,98 @@
+import copy
+import threading
+import time
+
 from django.test import TestCase
 from unittest.mock import patch, MagicMock
+from instructor import canvas_api
 from instructor.canvas_api import FlexCanvas
 from django.core.exceptions import PermissionDenied
+from flexible_assessment import synthetic
+
+
+class PagedGraphQL:
+    """Serves a complete assignment group response a page of page_size
+    nodes at a time, as Canvas does for the cursor-paginated queries"""
+
+    def __init__(self, response, page_size):
+        self.groups = {
+            group["group_id"]: group
+            for group in response["data"]["course"]["assignment_groups"]["groups"]
+        }
+        self.assignments = {
+            assignment["_id"]: assignment
+            for group in self.groups.values()
+            for assignment in group.get("assignment_list", {}).get("assignments", [])
+        }
+        self.page_size = page_size
+        self.queries = []
+
+    def page(self, connection, nodes_key, after=None):
+        start = int(after or 0)
+        end = start + self.page_size
+        nodes = connection[nodes_key]
+        return {
+            nodes_key: nodes[start:end],
+            "page_info": {"has_next_page": end < len(nodes), "end_cursor": str(end)},
+        }
+
+    def assignment_page(self, group, after=None):
+        page = self.page(group["assignment_list"], "assignments", after)
+        page["assignments"] = [
+            dict(
+                assignment,
+                submission_list=self.page(assignment["submission_list"], "submissions"),
+            )
+            for assignment in page["assignments"]
+        ]
+        return page
+
+    def __call__(self, query, variables):
+        self.queries.append(query.split("(")[0].split()[-1])
+        after = variables.get("after")
+
+        if "AssignmentGroupGradesQuery" in query:
+            group = self.groups[variables["group_id"]]
+            data = {
+                "assignment_group": {
+                    "grade_list": self.page(group["grade_list"], "grades", after)
+                }
+            }
+        elif "AssignmentGroupAssignmentsQuery" in query:
+            group = self.groups[variables["group_id"]]
+            data = {
+                "assignment_group": {
+                    "assignment_list": self.assignment_page(group, after)
+                }
+            }
+        elif "AssignmentSubmissionsQuery" in query:
+            assignment = self.assignments[variables["assignment_id"]]
+            data = {
+                "assignment": {
+                    "submission_list": self.page(
+                        assignment["submission_list"], "submissions", after
+                    )
+                }
+            }
+        else:
+            page = self.page({"groups": list(self.groups.values())}, "groups", after)
+            groups = []
+            for group in page["groups"]:
+                # Only connections in the query are included
+                node = {
+                    key: value
+                    for key, value in group.items()
+                    if key not in ("grade_list", "assignment_list")
+                }
+                if "gradesConnection" in query:
+                    node["grade_list"] = self.page(group["grade_list"], "grades")
+                if "assignmentsConnection" in query:
+                    node["assignment_list"] = self.assignment_page(group)
+                groups.append(node)
+            page["groups"] = groups
+            data = {"course": {"assignment_groups": page}}
+
+        return copy.deepcopy({"data": data})
 
 
 # primarily testing the two functions that are used to get the groups and enrollments
@@ -2056,3 +2147,327 @@ class TestFlexCanvas(TestCase):
         self.assertEqual(
             round(group_dict["537054"]["grade_list"]["grades"][1][1], 2), 60
         )
+
+
+class TestFlexCanvasPagination(TestCase):
+    def setUp(self):
+        course = synthetic.create_course(950, 23, 3, seed=5)
+        self.payload = synthetic.build_graphql_payload(
+            course, seed=5, assignment_count=5
+        )
+        groups = self.payload["data"]["course"]["assignment_groups"]["groups"]
+        groups[0]["rules"] = {"dropHighest": None, "dropLowest": 1, "neverDrop": None}
+
+        with patch("instructor.canvas_api.get_oauth_token", return_value="token"):
+            self.canvas = FlexCanvas(MagicMock())
+
+    def fetch(self, method, graphql):
+        with patch.object(FlexCanvas, "graphql", side_effect=graphql):
+            return getattr(self.canvas, method)(950)
+
+    def test_paginated_fetch_matches_single_response(self):
+        for method in ("get_groups_and_enrollments", "get_flat_groups_and_enrollments"):
+            expected = self.fetch(
+                method, lambda *args, **kwargs: copy.deepcopy(self.payload)
+            )
+            paged = PagedGraphQL(self.payload, page_size=2)
+            actual = self.fetch(method, paged)
+
+            self.assertEqual(actual, expected)
+            self.assertGreater(len(paged.queries), 1)
+
+    def test_flat_fetch_follows_every_connection(self):
+        paged = PagedGraphQL(self.payload, page_size=2)
+        self.fetch("get_flat_groups_and_enrollments", paged)
+
+        self.assertEqual(paged.queries.count("FlatAssignmentGroupQuery"), 2)
+        # 23 grades in pages of 2
+        self.assertEqual(paged.queries.count("AssignmentGroupGradesQuery"), 3 * 12)
+        # 5 assignments in pages of 2
+        self.assertEqual(paged.queries.count("AssignmentGroupAssignmentsQuery"), 3 * 3)
+        # The first page of submissions comes with the assignment
+        self.assertEqual(paged.queries.count("AssignmentSubmissionsQuery"), 3 * 5 * 11)
+
+    def test_flat_fetch_runs_groups_concurrently(self):
+        paged = PagedGraphQL(self.payload, page_size=10)
+        lock = threading.Lock()
+        running = [0]
+        most_running = [0]
+
+        def graphql(query, variables):
+            with lock:
+                running[0] += 1
+                most_running[0] = max(most_running[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return paged(query, variables)
+
+        with patch("instructor.canvas_api.GROUP_WORKERS", 2):
+            actual = self.fetch("get_flat_groups_and_enrollments", graphql)
+        expected = self.fetch(
+            "get_flat_groups_and_enrollments",
+            lambda *args, **kwargs: copy.deepcopy(self.payload),
+        )
+
+        self.assertEqual(actual, expected)
+        self.assertEqual(list(actual[0]), list(expected[0]))
+        self.assertEqual(most_running[0], 2)
+
+    def test_missing_page_raises_permission_denied(self):
+        paged = PagedGraphQL(self.payload, page_size=2)
+
+        def graphql(query, variables):
+            response = paged(query, variables)
+            if "AssignmentGroupGradesQuery" in query:
+                response["data"]["assignment_group"] = None
+            return response
+
+        with self.assertRaises(PermissionDenied):
+            self.fetch("get_groups_and_enrollments", graphql)
+
+    def test_fetch_does_not_modify_response(self):
+        payload = copy.deepcopy(self.payload)
+        for method in ("get_groups_and_enrollments", "get_flat_groups_and_enrollments"):
+            self.fetch(method, lambda *args, **kwargs: payload)
+
+        self.assertEqual(payload, self.payload)
+
+    def test_get_grade_reads_node_fields(self):
+        grade = {
+            "enrollment": {"user": {"user_id": "7"}, "_id": "70"},
+            "current_score": 81.5,
+        }
+
+        self.assertEqual(self.canvas._get_grade(grade), ("7", "70", 81.5))
+
+    def test_get_grade_without_user_raises_permission_denied(self):
+        for enrollment in (None, {"user": None, "_id": "70"}, {"_id": "70"}):
+            with self.assertRaises(PermissionDenied):
+                self.canvas._get_grade(
+                    {"enrollment": enrollment, "current_score": 81.5}
+                )
+
+    def test_flat_fetch_skips_assignments_without_submissions(self):
+        groups = self.payload["data"]["course"]["assignment_groups"]["groups"]
+        expected = self.fetch(
+            "get_flat_groups_and_enrollments",
+            lambda *args, **kwargs: copy.deepcopy(self.payload),
+        )
+        groups[1]["assignment_list"]["assignments"].append(
+            {
+                "_id": "999",
+                "max_score": 10,
+                "submission_list": None,
+            }
+        )
+
+        actual = self.fetch(
+            "get_flat_groups_and_enrollments",
+            lambda *args, **kwargs: copy.deepcopy(self.payload),
+        )
+
+        self.assertEqual(actual, expected)
+
+
+class FakeResponse:
+    """requests.Response with the parts read by FlexCanvas._set_override_batch"""
+
+    def __init__(self, status_code=200, data=None, headers=None, text=""):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+        self.text = text
+
+    def json(self):
+        return self.data
+
+
+@patch("instructor.canvas_api.OVERRIDE_RETRY_DELAY", 0)
+class TestFlexCanvasOverrides(TestCase):
+    def setUp(self):
+        with patch("instructor.canvas_api.get_oauth_token", return_value="token"):
+            self.canvas = FlexCanvas(MagicMock())
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def respond(self, failing=(), top_level=(), status=200, headers=None):
+        """Returns a _post_graphql mock that answers each aliased mutation,
+        failing enrollments in failing with mutation errors and enrollments in
+        top_level with top-level errors, once each"""
+
+        failing = set(failing)
+        top_level = set(top_level)
+
+        def post_graphql(mutation, variables):
+            with self.lock:
+                self.requests.append(variables)
+                if status != 200:
+                    return FakeResponse(status, headers=headers, text="Server error")
+
+                data = {}
+                errors = []
+                for name, enrollment_id in variables.items():
+                    if not name.startswith("enrollment_id"):
+                        continue
+                    i = name[len("enrollment_id") :]
+                    alias = "o" + i
+                    if enrollment_id in failing:
+                        failing.discard(enrollment_id)
+                        data[alias] = {"grades": None, "errors": [{"message": "bad"}]}
+                    elif enrollment_id in top_level:
+                        top_level.discard(enrollment_id)
+                        data[alias] = None
+                        errors.append({"message": "not found", "path": [alias]})
+                    else:
+                        score = variables["override" + i]
+                        data[alias] = {
+                            "grades": {"overrideScore": score},
+                            "errors": None,
+                        }
+                response = {"data": data}
+                if errors:
+                    response["errors"] = errors
+                return FakeResponse(data=response, headers=headers)
+
+        return post_graphql
+
+    def set_overrides(self, overrides, post_graphql, **kwargs):
+        with patch.object(
+            FlexCanvas, "_post_graphql", side_effect=post_graphql
+        ) as post:
+            failed, stats = self.canvas.set_overrides(overrides, **kwargs)
+        self.post = post
+        return failed, stats
+
+    def sent(self, request):
+        return [v for k, v in request.items() if k.startswith("enrollment_id")]
+
+    def test_overrides_are_sent_in_batches(self):
+        overrides = {str(i): i / 2 for i in range(7)}
+        failed, stats = self.set_overrides(overrides, self.respond(), batch_size=3)
+
+        self.assertEqual(failed, {})
+        self.assertEqual(sorted(len(self.sent(r)) for r in self.requests), [1, 3, 3])
+        mutation = self.post.call_args_list[0][0][0]
+        self.assertIn("o2: setOverrideScore", mutation)
+        self.assertIn({"enrollment_id0": "6", "override0": 3.0}, self.requests)
+        self.assertEqual(stats["submitted"], 7)
+        self.assertEqual(stats["requests"], 3)
+
+    def test_only_failed_enrollments_are_retried(self):
+        overrides = {str(i): 80.0 for i in range(5)}
+        post_graphql = self.respond(failing=["1"], top_level=["3"])
+        failed, stats = self.set_overrides(overrides, post_graphql, batch_size=5)
+
+        self.assertEqual(failed, {})
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.sent(self.requests[1]), ["1", "3"])
+
+    def test_failed_requests_are_reported_after_attempts(self):
+        post_graphql = self.respond(status=500)
+        failed, stats = self.set_overrides({"1": 50.0, "2": 60.0}, post_graphql)
+
+        self.assertEqual(
+            failed,
+            {
+                "1": "Canvas responded with status 500",
+                "2": "Canvas responded with status 500",
+            },
+        )
+        self.assertEqual(len(self.requests), 6)
+        self.assertEqual(stats["submitted"], 0)
+
+    def test_concurrency_rises_with_remaining_quota(self):
+        headers = {"X-Rate-Limit-Remaining": "700", "X-Request-Cost": "1"}
+        overrides = {str(i): 70.0 for i in range(40)}
+        post_graphql = self.respond(headers=headers)
+        failed, stats = self.set_overrides(overrides, post_graphql, batch_size=1)
+
+        self.assertEqual(failed, {})
+        self.assertEqual(stats["peak_workers"], 8)
+
+    def test_throttled_batches_are_sent_again(self):
+        responses = [
+            FakeResponse(403, text="403 Forbidden (Rate Limit Exceeded)"),
+        ]
+        post_ok = self.respond()
+
+        def post_graphql(mutation, variables):
+            if responses:
+                with self.lock:
+                    self.requests.append(variables)
+                return responses.pop()
+            return post_ok(mutation, variables)
+
+        failed, stats = self.set_overrides({"1": 50.0}, post_graphql, batch_size=1)
+
+        self.assertEqual(failed, {})
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(stats["throttled"], 1)
+
+    def test_failure_reasons_are_kept_per_enrollment(self):
+        def post_graphql(mutation, variables):
+            with self.lock:
+                self.requests.append(variables)
+            data = {
+                "o0": {"grades": None, "errors": [{"message": "Not allowed"}]},
+                "o1": None,
+                "o2": {"grades": {"overrideScore": 70.0}, "errors": None},
+            }
+            errors = [{"message": "Enrollment not found", "path": ["o1"]}]
+            return FakeResponse(data={"data": data, "errors": errors})
+
+        batches = []
+        failed, stats = self.set_overrides(
+            {"1": 50.0, "2": 60.0, "3": 70.0},
+            post_graphql,
+            on_batch=lambda submitted, failed: batches.append((submitted, failed)),
+        )
+
+        expected = {"1": "Not allowed", "2": "Enrollment not found"}
+        self.assertEqual(failed, expected)
+        self.assertEqual(len(self.requests), 6)
+        self.assertEqual(batches[0], (["3"], {}))
+        self.assertEqual(batches[-1], ([], expected))
+        self.assertEqual(stats["submitted"], 1)
+
+    def test_retry_delay_backs_off_with_jitter(self):
+        # The class patches OVERRIDE_RETRY_DELAY to 0 for the other tests
+        with patch("instructor.canvas_api.OVERRIDE_RETRY_DELAY", 1), patch(
+            "instructor.canvas_api.OVERRIDE_MAX_RETRY_DELAY", 5
+        ):
+            with patch("instructor.canvas_api.random.uniform") as uniform:
+                for attempt in range(1, 6):
+                    canvas_api._get_retry_delay(attempt)
+            delays = [canvas_api._get_retry_delay(3) for _ in range(50)]
+
+        ceilings = [call[0] for call in uniform.call_args_list]
+        self.assertEqual(ceilings, [(0, 1), (0, 2), (0, 4), (0, 5), (0, 5)])
+        self.assertTrue(all(0 <= delay <= 4 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+
+class TestFlexCanvasOverrideScores(TestCase):
+    def test_override_scores_are_read_across_pages(self):
+        pages = [
+            {
+                "enrollments": [
+                    {"_id": "1", "grades": {"override_score": 81.5}},
+                    {"_id": "2", "grades": {"override_score": None}},
+                ],
+                "page_info": {"has_next_page": True, "end_cursor": "c1"},
+            },
+            {
+                "enrollments": [{"_id": "3", "grades": None}],
+                "page_info": {"has_next_page": False, "end_cursor": None},
+            },
+        ]
+        responses = [{"data": {"course": {"enrollment_list": p}}} for p in pages]
+
+        canvas = FlexCanvas.__new__(FlexCanvas)
+        with patch.object(FlexCanvas, "graphql", side_effect=responses) as graphql:
+            scores = canvas.get_override_scores(1)
+
+        self.assertEqual(scores, {"1": 81.5, "2": None, "3": None})
+        self.assertEqual(graphql.call_args_list[1][1]["variables"]["after"], "c1")
@@ -0,0 +1,161 @@
+import random
+
+import numpy as np
+from django.test import SimpleTestCase
+from instructor import drop_rules
+
+NAN = np.nan
+
+
+def rules(lowest=None, highest=None, never_drop=None):
+    return {
+        "dropLowest": lowest,
+        "dropHighest": highest,
+        "neverDrop": (
+            [{"_id": assignment_id} for assignment_id in never_drop]
+            if never_drop
+            else None
+        ),
+    }
+
+
+def sorted_drop(scores, assignment_ids, group_rules):
+    """Drops each student's scores by sorting them, one student at a time"""
+
+    lowest = group_rules["dropLowest"] or 0
+    highest = group_rules["dropHighest"] or 0
+    never_drop = {rule["_id"] for rule in group_rules["neverDrop"] or []}
+
+    totals = []
+    dropped = []
+    for row in scores:
+        kept = [
+            score
+            for assignment_id, score in zip(assignment_ids, row)
+            if not np.isnan(score) and assignment_id in never_drop
+        ]
+        droppable = sorted(
+            score
+            for assignment_id, score in zip(assignment_ids, row)
+            if not np.isnan(score) and assignment_id not in never_drop
+        )
+        count = 0
+        if (lowest or highest) and lowest + highest < len(droppable):
+            droppable = droppable[lowest : len(droppable) - highest]
+            count = lowest + highest
+        totals.append(sum(kept + droppable))
+        dropped.append(count)
+
+    return totals, dropped
+
+
+class TestDropRules(SimpleTestCase):
+    def assertDrops(self, scores, group_rules, totals, dropped):
+        actual_totals, actual_dropped = drop_rules.apply(
+            np.array(scores, dtype=float),
+            ["a{}".format(column) for column in range(len(scores[0]))],
+            group_rules,
+        )
+
+        np.testing.assert_allclose(actual_totals, totals)
+        self.assertEqual(actual_dropped.tolist(), dropped)
+
+    def test_drops_lowest_and_highest(self):
+        scores = [[0.5, 0.9, 0.7, 0.1], [0.2, 0.4, 0.6, 0.8]]
+
+        self.assertDrops(scores, rules(lowest=1), [2.1, 1.8], [1, 1])
+        self.assertDrops(scores, rules(highest=2), [0.6, 0.6], [2, 2])
+        self.assertDrops(scores, rules(lowest=1, highest=1), [1.2, 1.0], [2, 2])
+
+    def test_missing_scores_are_not_dropped(self):
+        scores = [[0.5, NAN, 0.7, 0.1], [NAN, NAN, 0.6, 0.8]]
+
+        self.assertDrops(scores, rules(lowest=1), [1.2, 0.8], [1, 1])
+        self.assertDrops(scores, rules(highest=1), [0.6, 0.6], [1, 1])
+
+    def test_drops_only_when_a_score_is_kept(self):
+        scores = [[0.5, 0.9, NAN], [0.2, 0.4, 0.6], [NAN, NAN, NAN]]
+
+        # Dropping 2 would leave the first student no score
+        self.assertDrops(scores, rules(lowest=2), [1.4, 0.6, 0], [0, 2, 0])
+        self.assertDrops(scores, rules(lowest=1, highest=1), [1.4, 0.4, 0], [0, 2, 0])
+        self.assertDrops(scores, rules(lowest=3), [1.4, 1.2, 0], [0, 0, 0])
+
+    def test_never_drop_scores_are_kept(self):
+        scores = [[0.1, 0.9, 0.5, 0.7, 0.3], [0.1, NAN, 0.5, NAN, NAN]]
+        group_rules = rules(lowest=1, highest=1, never_drop=["a0", "a1"])
+
+        # 0.1 and 0.9 are kept, the second student has one droppable score
+        self.assertDrops(scores, group_rules, [1.5, 0.6], [2, 0])
+        self.assertDrops(scores, rules(lowest=1, never_drop=["a0"]), [2.2, 0.6], [1, 0])
+
+    def test_tied_scores_are_dropped_once(self):
+        scores = [[0.5, 0.5, 0.5, 0.5], [0.3, 0.3, 0.8, 0.8], [0.6, 0.2, 0.2, 0.6]]
+
+        self.assertDrops(scores, rules(lowest=1, highest=2), [0.5, 0.3, 0.2], [3, 3, 3])
+        self.assertDrops(scores, rules(lowest=2), [1.0, 1.6, 1.2], [2, 2, 2])
+        self.assertDrops(scores, rules(highest=3), [0.5, 0.3, 0.2], [3, 3, 3])
+
+    def test_tied_scores_with_never_drop(self):
+        scores = [[0.4, 0.4, 0.4, 0.4], [0.4, 0.4, 0.4, NAN]]
+        group_rules = rules(lowest=1, highest=1, never_drop=["a0"])
+
+        self.assertDrops(scores, group_rules, [0.8, 1.2], [2, 0])
+        self.assertDrops(scores, rules(lowest=1, never_drop=["a0"]), [1.2, 0.8], [1, 1])
+
+    def test_matches_sorted_drops(self):
+        rng = random.Random(4)
+        assignment_ids = ["a{}".format(column) for column in range(8)]
+        scores = np.array(
+            [
+                [
+                    NAN if rng.random() < 0.2 else rng.choice([0, 0.25, 0.5, 1])
+                    for _ in assignment_ids
+                ]
+                for _ in range(200)
+            ]
+        )
+
+        for lowest in (None, 0, 1, 3):
+            for highest in (None, 0, 1, 2):
+                for never_drop in (None, ["a1"], ["a0", "a7", "missing"]):
+                    group_rules = rules(lowest, highest, never_drop)
+                    totals, dropped = drop_rules.apply(
+                        scores, assignment_ids, group_rules
+                    )
+                    expected_totals, expected_dropped = sorted_drop(
+                        scores, assignment_ids, group_rules
+                    )
+
+                    np.testing.assert_allclose(totals, expected_totals)
+                    self.assertEqual(dropped.tolist(), expected_dropped)
+
+    def test_apply_does_not_modify_scores(self):
+        scores = np.array([[0.2, 0.4, 0.6]])
+        drop_rules.apply(scores, ["a0", "a1", "a2"], rules(lowest=1, highest=1))
+
+        self.assertEqual(scores.tolist(), [[0.2, 0.4, 0.6]])
+
+
+class TestGroupScores(SimpleTestCase):
+    def test_scores_are_stored_by_user_and_assignment(self):
+        group_scores = drop_rules.GroupScores()
+        group_scores.add("1", "10", 0.5)
+        group_scores.add("2", "11", 0.9)
+        group_scores.add("1", "11", 0.7)
+
+        self.assertEqual(group_scores.user_ids, ["1", "2"])
+        self.assertEqual(group_scores.assignment_ids, ["10", "11"])
+        np.testing.assert_array_equal(group_scores.to_array(), [[0.5, 0.7], [NAN, 0.9]])
+
+    def test_drop_returns_totals_by_user(self):
+        group_scores = drop_rules.GroupScores()
+        for user_id, scores in (("1", [0.5, 0.9, 0.7]), ("2", [0.2, 0.4])):
+            for assignment_id, score in enumerate(scores):
+                group_scores.add(user_id, assignment_id, score)
+
+        totals, dropped = group_scores.drop(rules(lowest=1))
+
+        self.assertEqual(dropped, {"1": 1, "2": 1})
+        self.assertAlmostEqual(totals["1"], 1.6)
+        self.assertAlmostEqual(totals["2"], 0.4)
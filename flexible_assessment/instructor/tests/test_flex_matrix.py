@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+from django.test import TestCase
+from flexible_assessment.models import (
+    Assessment,
+    Course,
+    FlexAssessment,
+    Roles,
+    UserProfile,
+)
+from flexible_assessment.tests.test_data import DATA
+from instructor.flex_matrix import FlexMatrix
+
+
+class TestFlexMatrix(TestCase):
+    fixtures = DATA
+
+    def setUp(self):
+        self.course = Course.objects.get(pk=1)
+        self.students = list(
+            UserProfile.objects.filter(
+                usercourse__role=Roles.STUDENT, usercourse__course=self.course
+            )
+        )
+        self.assessments = list(Assessment.objects.filter(course=self.course))
+        FlexAssessment.objects.filter(assessment__course=self.course).delete()
+
+    def set_flexes(self, student, flexes):
+        FlexAssessment.objects.bulk_create(
+            [
+                FlexAssessment(user=student, assessment=assessment, flex=flex)
+                for assessment, flex in zip(self.assessments, flexes)
+            ]
+        )
+
+    def test_FlexMatrix_loads_with_single_query(self):
+        for student in self.students:
+            self.set_flexes(student, [25, 25, 25, 25])
+
+        # One query each for assessments and flex assessments
+        with self.assertNumQueries(2):
+            FlexMatrix.load(self.course, self.students)
+
+    def test_FlexMatrix_gets_flex(self):
+        self.set_flexes(self.students[0], [33.33, 33.33, 33.34, None])
+        flex_matrix = FlexMatrix.load(self.course, self.students)
+
+        user_id = self.students[0].user_id
+        self.assertEqual(
+            flex_matrix.get_flex(user_id, self.assessments[0].id), Decimal("33.33")
+        )
+        self.assertIsNone(flex_matrix.get_flex(user_id, self.assessments[3].id))
+        self.assertIsNone(
+            flex_matrix.get_flex(self.students[1].user_id, self.assessments[0].id)
+        )
+
+    def test_FlexMatrix_flags_null_and_valid_allocations(self):
+        self.set_flexes(self.students[0], [10, 20, 30, 40])
+        self.set_flexes(self.students[1], [10, 20, 70, None])
+        self.set_flexes(self.students[2], [50, 10, 20, 1])
+        self.set_flexes(self.students[3], [33.33, 33.33, 33.34, 0])
+        flex_matrix = FlexMatrix.load(self.course, self.students)
+
+        valid = [flex_matrix.is_valid(student.user_id) for student in self.students]
+        null = [flex_matrix.has_null(student.user_id) for student in self.students]
+
+        self.assertEqual(valid, [True, False, False, True])
+        self.assertEqual(null, [False, True, False, False])
+        self.assertEqual(flex_matrix.get_valid_count(), 2)
+
+    def test_FlexMatrix_loads_all_course_students_by_default(self):
+        flex_matrix = FlexMatrix.load(self.course)
+
+        self.assertEqual(
+            sorted(flex_matrix.user_ids),
+            sorted(str(student.user_id) for student in self.students),
+        )
+        self.assertEqual(flex_matrix.get_valid_count(), 0)
@@ -0,0 +1,128 @@
+import random
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.test import SimpleTestCase
+from instructor import grade_math
+
+
+def decimal_round_half_up(value, digits=2):
+    """Decimal implementation grade_math.round_half_up replaces"""
+
+    if value is None:
+        return None
+    d = Decimal(str(value))
+    return d.quantize(Decimal(10) ** -digits, rounding=ROUND_HALF_UP)
+
+
+def decimal_weighted_total(scores, weights):
+    """Decimal implementation of grader.get_default_total"""
+
+    score_weight = [
+        (Decimal(score), Decimal(weight))
+        for score, weight in zip(scores, weights)
+        if score is not None
+    ]
+    overall = Decimal(0)
+    for score, weight in score_weight:
+        overall += score * weight / Decimal(100)
+
+    total_weight = sum(weight for _, weight in score_weight)
+    return overall / total_weight * Decimal(100) if total_weight != 0 else Decimal(0)
+
+
+class TestGradeMath(SimpleTestCase):
+    def random_values(self, count):
+        rng = random.Random(8)
+        values = []
+        for _ in range(count):
+            values.append(rng.uniform(-200, 200))
+            values.append(round(rng.uniform(0, 100), 3))
+            values.append(rng.randint(0, 100000) / 1000)
+            values.append(rng.random() * 10 ** rng.randint(-8, 8))
+        return values
+
+    def test_round_half_up_matches_decimal(self):
+        values = [
+            0,
+            0.0,
+            -0.0,
+            2.675,
+            0.125,
+            -0.125,
+            1e-7,
+            1.5e20,
+            -2.345,
+            Decimal("1.2E+3"),
+            Decimal("-0.0005"),
+            Decimal("88.0005"),
+            "3.14159",
+            -7,
+            None,
+        ] + self.random_values(5000)
+
+        for value in values:
+            for digits in (0, 2, 3, 5):
+                expected = decimal_round_half_up(value, digits)
+                actual = grade_math.round_half_up(value, digits)
+                self.assertEqual(str(actual), str(expected), (value, digits))
+
+    def test_round_half_up_non_finite_matches_decimal(self):
+        self.assertTrue(grade_math.round_half_up(float("nan"), 2).is_nan())
+
+    def test_ties_round_away_from_zero(self):
+        self.assertEqual(grade_math.div_half_up(5, 10), 1)
+        self.assertEqual(grade_math.div_half_up(-5, 10), -1)
+        self.assertEqual(grade_math.div_half_up(4, 10), 0)
+        self.assertEqual(grade_math.div_half_up(15, -10), -2)
+        self.assertEqual(grade_math.round_fixed(88005, 3, 2), 8801)
+        self.assertEqual(grade_math.round_fixed(-88005, 3, 2), -8801)
+        self.assertEqual(grade_math.round_fixed(8801, 2, 3), 88010)
+
+    def test_round_fixed_matches_double_rounding(self):
+        for value in self.random_values(2000):
+            thousandths = grade_math.to_fixed(value, 3)
+            expected = decimal_round_half_up(decimal_round_half_up(value, 3), 2)
+            actual = grade_math.round_fixed(thousandths, 3, 2)
+            self.assertEqual(grade_math.to_decimal(actual, 2), expected, value)
+
+    def test_to_fixed_and_format(self):
+        self.assertEqual(grade_math.to_fixed(33.333335), 3333334)
+        self.assertEqual(grade_math.to_fixed("1e-5"), 1)
+        self.assertEqual(grade_math.to_fixed(Decimal("12.5"), 2), 1250)
+        self.assertEqual(grade_math.format_fixed(8801, 2), "88.01")
+        self.assertEqual(grade_math.format_fixed(-150, 2), "-1.50")
+        self.assertEqual(grade_math.format_fixed(5, 3), "0.005")
+        with self.assertRaises(ValueError):
+            grade_math.to_fixed("abc")
+
+    def test_weighted_total_matches_decimal(self):
+        rng = random.Random(3)
+        for _ in range(3000):
+            count = rng.randint(1, 6)
+            scores = [
+                rng.choice(
+                    [
+                        None,
+                        rng.randint(0, 10000) / 100,
+                        rng.uniform(0, 120),
+                        100 / rng.randint(1, 9),
+                    ]
+                )
+                for _ in range(count)
+            ]
+            weights = [
+                rng.choice([0, 12.5, 25, 100 / 3, rng.randint(0, 100)])
+                for _ in range(count)
+            ]
+
+            expected = decimal_round_half_up(decimal_weighted_total(scores, weights), 3)
+            actual = grade_math.weighted_total(scores, weights, 3)
+            self.assertEqual(grade_math.to_decimal(actual, 3), expected)
+
+    def test_weighted_total_rounds_exact_ties_up(self):
+        # 0.0005 and 10.0005 are not exact in binary, 0.5 and 2.5 are
+        self.assertEqual(grade_math.weighted_total([0.0005], [100], 3), 1)
+        self.assertEqual(grade_math.weighted_total([2.5], [100], 0), 3)
+        self.assertEqual(grade_math.weighted_total([1, 2], [50, 50], 0), 2)
+        self.assertEqual(grade_math.weighted_total([None, 50], [50, 50], 3), 50000)
+        self.assertEqual(grade_math.weighted_total([None], [100], 3), 0)
@@ -0,0 +1,186 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from flexible_assessment.models import (
+    Assessment,
+    Course,
+    FlexAssessment,
+    GradeSnapshot,
+    Roles,
+    StudentGrade,
+    UserProfile,
+)
+from flexible_assessment.tests.test_data import DATA
+from instructor import grade_snapshot, grader
+from instructor.gradebook import GradeBook
+
+
+class TestGradeSnapshot(TestCase):
+    fixtures = DATA
+
+    def setUp(self):
+        self.course = Course.objects.get(pk=1)
+        self.students = UserProfile.objects.filter(
+            usercourse__role=Roles.STUDENT, usercourse__course=self.course
+        )
+        self.gradebook = self.build_gradebook([70, 80, 90, 100])
+
+    def build_gradebook(self, scores):
+        groups = {
+            str(index + 1): {
+                "group_weight": 25,
+                "grade_list": {
+                    "grades": [
+                        (str(student.user_id), score) for student in self.students
+                    ]
+                },
+            }
+            for index, score in enumerate(scores)
+        }
+        return GradeBook.from_groups(groups)
+
+    def get_course_grades(self, gradebook=None):
+        # Reload course so flex_version is current, as in a new request
+        course = Course.objects.get(pk=self.course.pk)
+        return grade_snapshot.get_course_grades(
+            gradebook or self.gradebook, course, self.students
+        )
+
+    def assertSameGrades(self, first, second):
+        for student in self.students:
+            self.assertEqual(first.get_totals(student), second.get_totals(student))
+        self.assertEqual(first.averages, second.averages)
+
+    def set_flexes(self, student, flexes):
+        flex_assessments = FlexAssessment.objects.filter(
+            user=student, assessment__course=self.course
+        ).order_by("assessment__group")
+        for flex_assessment, flex in zip(flex_assessments, flexes):
+            flex_assessment.flex = flex
+            flex_assessment.save()
+
+    def test_snapshot_reused_when_unchanged(self):
+        first = self.get_course_grades()
+
+        with patch.object(
+            grader, "calculate_course_totals", wraps=grader.calculate_course_totals
+        ) as calculate_course_totals:
+            second = self.get_course_grades()
+
+        calculate_course_totals.assert_not_called()
+        self.assertSameGrades(first, second)
+
+    def test_snapshot_recomputed_when_gradebook_changes(self):
+        self.get_course_grades()
+        gradebook = self.build_gradebook([70, 80, 90, 50])
+
+        with patch.object(
+            grader, "calculate_course_totals", wraps=grader.calculate_course_totals
+        ) as calculate_course_totals:
+            course_grades = self.get_course_grades(gradebook)
+
+        calculate_course_totals.assert_called_once()
+        _, default = course_grades.get_totals(self.students[0])
+        self.assertEqual(default, grader.round_half_up(72.5, 3))
+
+    def test_flex_change_updates_only_that_student(self):
+        self.get_course_grades()
+        version = Course.objects.get(pk=self.course.pk).flex_version
+        student = self.students[0]
+        others = dict(
+            StudentGrade.objects.exclude(user=student).values_list(
+                "user_id", "override"
+            )
+        )
+
+        with patch.object(
+            grader, "get_student_override", wraps=grader.get_student_override
+        ) as get_student_override:
+            self.set_flexes(student, [10, 30, 30, 30])
+
+        # Each of the 4 saves recalculates only the changed student
+        self.assertEqual(get_student_override.call_count, 4)
+        snapshot = GradeSnapshot.objects.get(course=self.course)
+        self.assertEqual(snapshot.flex_version, version + 4)
+        self.assertEqual(
+            dict(
+                StudentGrade.objects.exclude(user=student).values_list(
+                    "user_id", "override"
+                )
+            ),
+            others,
+        )
+
+        with patch.object(
+            grader, "calculate_course_totals", wraps=grader.calculate_course_totals
+        ) as calculate_course_totals:
+            course_grades = self.get_course_grades()
+
+        calculate_course_totals.assert_not_called()
+        override, _ = course_grades.get_totals(student)
+        self.assertEqual(override, grader.round_half_up(88, 3))
+
+    def test_flex_change_matches_full_recompute(self):
+        self.get_course_grades()
+        self.set_flexes(self.students[0], [10, 30, 30, 30])
+        self.set_flexes(self.students[1], [30, 10, 30, 30])
+        self.set_flexes(self.students[2], [30, 30, None, 30])
+
+        course_grades = self.get_course_grades()
+        course = Course.objects.get(pk=self.course.pk)
+        expected = grader.get_course_grades(self.gradebook, course, self.students)
+
+        self.assertSameGrades(course_grades, expected)
+
+    def test_flex_change_query_count_independent_of_class_size(self):
+        self.get_course_grades()
+        flex_assessment = FlexAssessment.objects.filter(
+            user=self.students[0], assessment__course=self.course
+        ).first()
+
+        with CaptureQueriesContext(connection) as small:
+            flex_assessment.flex = 40
+            flex_assessment.save()
+
+        StudentGrade.objects.bulk_create(
+            [
+                StudentGrade(
+                    snapshot=GradeSnapshot.objects.get(course=self.course),
+                    user=UserProfile.objects.create(
+                        login_id="extra{}".format(i),
+                        user_id=9000 + i,
+                        display_name="Extra {}".format(i),
+                    ),
+                    default_total=50,
+                    default=50,
+                )
+                for i in range(50)
+            ]
+        )
+
+        with CaptureQueriesContext(connection) as large:
+            flex_assessment.flex = 25
+            flex_assessment.save()
+
+        self.assertTrue(GradeSnapshot.objects.filter(course=self.course).exists())
+        self.assertEqual(len(small), len(large))
+
+    def test_assessment_change_invalidates_snapshot(self):
+        self.get_course_grades()
+
+        assessment = Assessment.objects.filter(course=self.course).first()
+        assessment.max = 90
+        assessment.save()
+
+        self.assertFalse(GradeSnapshot.objects.filter(course=self.course).exists())
+
+    def test_reset_students_invalidates_snapshot(self):
+        self.get_course_grades()
+        version = Course.objects.get(pk=self.course.pk).flex_version
+
+        self.course.reset_all_students()
+
+        self.assertFalse(GradeSnapshot.objects.filter(course=self.course).exists())
+        self.assertGreater(Course.objects.get(pk=self.course.pk).flex_version, version)
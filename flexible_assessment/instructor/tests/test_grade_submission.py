@@ -0,0 +1,227 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from flexible_assessment.models import (
+    Course,
+    EnrollmentStatus,
+    GradeSubmission,
+    JobStatus,
+    UserProfile,
+)
+from flexible_assessment.tests.test_data import DATA
+from instructor import grade_submission
+
+import flexible_assessment.tests.mock_classes as mock_classes
+
+
+class TestGradeSubmission(TestCase):
+    fixtures = DATA
+
+    def setUp(self):
+        self.course = Course.objects.get(pk=1)
+        self.user = UserProfile.objects.get(login_id="test_instructor1")
+        self.canvas = mock_classes.MockFlexCanvas()
+        groups, _ = self.canvas.get_groups_and_enrollments(1)
+        enrollments = {user_id: "e" + user_id for user_id in ["1", "2", "3", "4"]}
+        self.canvas.get_groups_and_enrollments = lambda course_id: (
+            groups,
+            enrollments,
+        )
+
+    def enqueue(self):
+        submission, _ = grade_submission.enqueue(
+            self.course, self.user, False, True, "https://flex.test/oauth/callback"
+        )
+        return submission
+
+    def test_enqueue_keeps_one_active_submission(self):
+        first = self.enqueue()
+        second, created = grade_submission.enqueue(
+            self.course, self.user, False, True, ""
+        )
+
+        self.assertFalse(created)
+        self.assertEqual(second, first)
+
+        grade_submission.claim()
+        grade_submission.run(first, self.canvas)
+        self.assertNotEqual(self.enqueue(), first)
+
+    def test_claim_takes_oldest_queued_submission(self):
+        first = self.enqueue()
+        other = Course.objects.exclude(pk=1).first()
+        grade_submission.enqueue(other, self.user, False, True, "")
+
+        claimed = grade_submission.claim()
+
+        self.assertEqual(claimed, first)
+        self.assertEqual(claimed.status, JobStatus.RUNNING)
+        self.assertIsNotNone(claimed.started)
+        self.assertNotEqual(grade_submission.claim(), first)
+        self.assertIsNone(grade_submission.claim())
+
+    def test_run_records_each_enrollment(self):
+        submission = self.enqueue()
+        grade_submission.run(grade_submission.claim(), self.canvas)
+
+        submission.refresh_from_db()
+        progress = grade_submission.get_progress(submission)
+        self.assertEqual(submission.status, JobStatus.DONE)
+        self.assertEqual(progress["status"], "done")
+        self.assertGreater(progress["total"], 0)
+        self.assertEqual(progress["submitted"], progress["total"])
+        for enrollment in submission.enrollments.all():
+            self.assertEqual(
+                float(enrollment.override),
+                self.canvas.overrides[enrollment.enrollment_id],
+            )
+
+    def test_run_skips_grades_canvas_has(self):
+        self.enqueue()
+        grade_submission.run(grade_submission.claim(), self.canvas)
+        changed = next(iter(self.canvas.overrides))
+        self.canvas.overrides[changed] += 1
+
+        with patch.object(
+            self.canvas, "set_overrides", wraps=self.canvas.set_overrides
+        ) as set_overrides:
+            submission = self.enqueue()
+            grade_submission.run(grade_submission.claim(), self.canvas)
+
+        self.assertEqual(list(set_overrides.call_args[0][0]), [changed])
+        progress = grade_submission.get_progress(submission)
+        self.assertEqual(progress["submitted"], 1)
+        self.assertEqual(progress["skipped"], progress["total"] - 1)
+
+    def fail_first(self, overrides, on_batch=None):
+        failed = {enrollment_id: "Not allowed" for enrollment_id in list(overrides)[:1]}
+        on_batch(list(overrides)[1:], failed)
+        return failed, {
+            "submitted": len(overrides) - 1,
+            "requests": 1,
+            "seconds": 1,
+            "per_second": 1,
+            "peak_workers": 1,
+            "throttled": 0,
+        }
+
+    def test_run_reports_failed_enrollments(self):
+        submission = self.enqueue()
+        with patch.object(self.canvas, "set_overrides", side_effect=self.fail_first):
+            grade_submission.run(grade_submission.claim(), self.canvas)
+
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, JobStatus.FAILED)
+        self.assertEqual(submission.error, "Could not submit 1 final grades.")
+        failed = submission.enrollments.get(status=EnrollmentStatus.FAILED)
+        self.assertEqual(failed.error, "Not allowed")
+        progress = grade_submission.get_progress(submission)
+        self.assertEqual(
+            progress["failures"],
+            [{"student": failed.user.display_name, "error": "Not allowed"}],
+        )
+
+    def test_retry_sends_only_failed_overrides(self):
+        first = self.enqueue()
+        with patch.object(self.canvas, "set_overrides", side_effect=self.fail_first):
+            grade_submission.run(grade_submission.claim(), self.canvas)
+        failed = first.enrollments.get(status=EnrollmentStatus.FAILED)
+
+        retry, _ = grade_submission.enqueue(
+            self.course, self.user, False, True, "", retry_of=first
+        )
+        with patch.object(
+            self.canvas, "set_overrides", wraps=self.canvas.set_overrides
+        ) as set_overrides:
+            grade_submission.run(grade_submission.claim(), self.canvas)
+
+        retry.refresh_from_db()
+        self.assertEqual(retry.status, JobStatus.DONE)
+        self.assertEqual(
+            set_overrides.call_args[0][0],
+            {failed.enrollment_id: float(failed.override)},
+        )
+        self.assertEqual(grade_submission.get_progress(retry)["submitted"], 1)
+
+    def test_run_fails_on_canvas_errors(self):
+        submission = self.enqueue()
+        with patch.object(
+            self.canvas, "get_gradebook", side_effect=RuntimeError("Canvas is down")
+        ):
+            grade_submission.run(grade_submission.claim(), self.canvas)
+
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, JobStatus.FAILED)
+        self.assertEqual(submission.error, "Canvas is down")
+        self.assertIsNotNone(submission.finished)
+
+    def test_run_fails_on_settings_errors(self):
+        submission = self.enqueue()
+        course = self.canvas.get_course(1)
+        with patch.object(self.canvas, "get_course", return_value=course), patch.object(
+            course, "update_settings", side_effect=RuntimeError("Canvas is down")
+        ):
+            grade_submission.run(grade_submission.claim(), self.canvas)
+
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, JobStatus.FAILED)
+        self.assertEqual(submission.error, "Canvas is down")
+
+    def test_claim_fails_stopped_submissions(self):
+        stopped = self.enqueue()
+        grade_submission.claim()
+        stopped.enrollments.create(user=self.user, enrollment_id="e1", override="80.00")
+        GradeSubmission.objects.filter(pk=stopped.pk).update(
+            started=timezone.now() - grade_submission.RUNNING_TIMEOUT - timedelta(1)
+        )
+
+        self.assertIsNone(grade_submission.claim())
+
+        stopped.refresh_from_db()
+        self.assertEqual(stopped.status, JobStatus.FAILED)
+        self.assertEqual(stopped.enrollments.get().status, EnrollmentStatus.FAILED)
+        # The course can submit again, and a retry sends the pending grade
+        _, created = grade_submission.enqueue(
+            self.course, self.user, False, True, "", retry_of=stopped
+        )
+        self.assertTrue(created)
+
+    def test_running_submission_is_not_failed_early(self):
+        running = self.enqueue()
+        grade_submission.claim()
+
+        grade_submission.claim()
+
+        running.refresh_from_db()
+        self.assertEqual(running.status, JobStatus.RUNNING)
+
+    @patch("instructor.grade_submission.run", side_effect=RuntimeError("Crashed"))
+    def test_command_fails_submissions_that_raise(self, run):
+        first = self.enqueue()
+        other = Course.objects.exclude(pk=1).first()
+        second, _ = grade_submission.enqueue(other, self.user, False, True, "")
+
+        call_command("run_grade_submissions", once=True, stdout=StringIO())
+
+        self.assertEqual(run.call_count, 2)
+        for submission in (first, second):
+            submission.refresh_from_db()
+            self.assertEqual(submission.status, JobStatus.FAILED)
+            self.assertEqual(submission.error, "Crashed")
+
+    @patch("instructor.grade_submission.FlexCanvas")
+    @patch("instructor.grade_submission.get_user_oauth_token", return_value="token")
+    def test_command_runs_queued_submissions(self, get_token, flex_canvas):
+        flex_canvas.return_value = self.canvas
+        submission = self.enqueue()
+
+        call_command("run_grade_submissions", once=True, stdout=StringIO())
+
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, JobStatus.DONE)
+        get_token.assert_called_once_with(self.user, "https://flex.test/oauth/callback")
+        flex_canvas.assert_called_once_with(None, access_token="token")
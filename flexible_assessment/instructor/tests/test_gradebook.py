@@ -0,0 +1,67 @@
+import math
+
+from django.test import SimpleTestCase
+from instructor.gradebook import GradeBook
+
+
+class TestGradeBook(SimpleTestCase):
+    def build_gradebook(self):
+        groups = {
+            "10": {
+                "group_name": "Quizzes",
+                "group_weight": 40,
+                "grade_list": {"grades": [("1", 80.5), ("2", None), ("1", 20)]},
+            },
+            "20": {
+                "group_name": "Final",
+                "group_weight": 60.0,
+                "grade_list": {"grades": [("2", 70), ("3", 90)]},
+            },
+        }
+        enrollments = {"1": "100", "2": "200", "3": "300"}
+        return GradeBook.from_groups(groups, enrollments)
+
+    def test_GradeBook_gets_scores_by_group_and_student(self):
+        gradebook = self.build_gradebook()
+
+        self.assertEqual(gradebook.get_score("10", "1"), 80.5)
+        self.assertEqual(gradebook.get_score(20, 3), 90)
+        self.assertIsNone(gradebook.get_score("10", "2"))
+        self.assertIsNone(gradebook.get_score("10", "3"))
+        self.assertIsNone(gradebook.get_score("10", "4"))
+        with self.assertRaises(KeyError):
+            gradebook.get_score("30", "1")
+
+    def test_GradeBook_uses_first_grade_for_student_in_group(self):
+        gradebook = self.build_gradebook()
+
+        self.assertEqual(gradebook.get_score("10", "1"), 80.5)
+
+    def test_GradeBook_stores_group_data_and_enrollments(self):
+        gradebook = self.build_gradebook()
+
+        self.assertEqual(gradebook.group_ids, ["10", "20"])
+        self.assertEqual(gradebook.get_group_name("20"), "Final")
+        self.assertEqual(gradebook.get_group_weight("10"), 40)
+        self.assertEqual(gradebook.get_enrollment_id(2), "200")
+        self.assertEqual(
+            gradebook.get_enrollments(), {"1": "100", "2": "200", "3": "300"}
+        )
+
+    def test_GradeBook_gets_student_scores_with_weights(self):
+        gradebook = self.build_gradebook()
+
+        self.assertEqual(gradebook.get_student_scores("1"), [(80.5, 40)])
+        self.assertEqual(gradebook.get_student_scores("2"), [(70, 60.0)])
+        self.assertEqual(gradebook.get_student_scores("4"), [])
+
+    def test_GradeBook_score_array_pads_missing_students_and_groups(self):
+        gradebook = self.build_gradebook()
+
+        scores = gradebook.get_scores(["3", "4", "1"], ["20", None, "10"])
+
+        self.assertEqual(scores.shape, (3, 3))
+        self.assertEqual(scores[0, 0], 90)
+        self.assertEqual(scores[2, 2], 80.5)
+        self.assertTrue(all(math.isnan(score) for score in scores[1]))
+        self.assertTrue(all(math.isnan(score) for score in scores[:, 1]))
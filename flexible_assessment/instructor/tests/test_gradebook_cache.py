@@ -0,0 +1,81 @@
+from unittest.mock import patch
+
+from django.test import Client, TestCase
+from django.urls import reverse
+from flexible_assessment.models import UserProfile
+from flexible_assessment.tests.test_data import DATA
+from instructor import gradebook_cache
+
+import flexible_assessment.tests.mock_classes as mock_classes
+
+
+class TestGradebookCache(TestCase):
+    fixtures = DATA
+
+    def setUp(self):
+        self.canvas = mock_classes.MockFlexCanvas()
+        patcher = patch.object(
+            self.canvas, "get_gradebook", wraps=self.canvas.get_gradebook
+        )
+        self.get_gradebook = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_second_get_is_a_hit(self):
+        first = gradebook_cache.get_gradebook(self.canvas, 1)
+        second = gradebook_cache.get_gradebook(self.canvas, 1)
+
+        self.assertEqual(self.get_gradebook.call_count, 1)
+        self.assertEqual(second.user_ids, first.user_ids)
+        self.assertEqual(gradebook_cache.get_stats(), {"hits": 1, "misses": 1})
+
+    def test_courses_and_query_types_are_cached_separately(self):
+        gradebook_cache.get_gradebook(self.canvas, 1)
+        gradebook_cache.get_gradebook(self.canvas, 1, flat=True)
+        gradebook_cache.get_gradebook(self.canvas, 2)
+
+        self.assertEqual(self.get_gradebook.call_count, 3)
+
+    def test_refresh_and_invalidate_fetch_from_canvas(self):
+        gradebook_cache.get_gradebook(self.canvas, 1)
+        gradebook_cache.get_gradebook(self.canvas, 1, flat=True)
+        gradebook_cache.get_gradebook(self.canvas, 1, refresh=True)
+        self.assertEqual(self.get_gradebook.call_count, 3)
+
+        gradebook_cache.invalidate(1)
+        gradebook_cache.get_gradebook(self.canvas, 1, flat=True)
+        self.assertEqual(self.get_gradebook.call_count, 4)
+
+    def test_entries_expire_after_ttl(self):
+        with self.settings(CANVAS_CACHE_TTL=0):
+            gradebook_cache.get_gradebook(self.canvas, 1)
+            gradebook_cache.get_gradebook(self.canvas, 1)
+
+        self.assertEqual(self.get_gradebook.call_count, 2)
+
+
+class TestGradebookCacheViews(TestCase):
+    fixtures = DATA
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(UserProfile.objects.get(login_id="test_instructor1"))
+
+    @mock_classes.use_mock_canvas()
+    def test_final_grades_and_export_fetch_once(self, mocked_flex_canvas_instance):
+        course_id = 1
+        self.client.get(reverse("instructor:instructor_home", args=[course_id]))
+
+        with patch.object(
+            mocked_flex_canvas_instance,
+            "get_gradebook",
+            wraps=mocked_flex_canvas_instance.get_gradebook,
+        ) as get_gradebook:
+            self.client.get(reverse("instructor:final_grades", args=[course_id]))
+            self.client.get(reverse("instructor:final_grades", args=[course_id]))
+            self.client.get(reverse("instructor:final_grades_export", args=[course_id]))
+            self.assertEqual(get_gradebook.call_count, 1)
+
+            self.client.get(
+                reverse("instructor:final_grades", args=[course_id]) + "?refresh=true"
+            )
+            self.assertEqual(get_gradebook.call_count, 2)
@@ -1,8 +1,10 @@
+import numpy as np
 from django.test import TestCase
 from flexible_assessment.models import UserProfile
 from instructor import grader
 from flexible_assessment.models import Roles, FlexAssessment, Assessment, Course
 from flexible_assessment.tests.mock_classes import *
+from instructor.gradebook import GradeBook
 
 from unittest.mock import patch
 from flexible_assessment.tests.test_data import DATA
@@ -13,7 +15,8 @@ class TestGrader(TestCase):
 
     def build_group_dict(self, student_ids, all_grades, weights):
         """
-        Helper function to quickly return the groups dictionary grader.py uses
+        Helper function to quickly return the GradeBook grader.py uses, built
+        from a groups dictionary
 
         Assumes:
         Assignment Group indexes start from 1
@@ -27,7 +30,7 @@ class TestGrader(TestCase):
         weights: 1d array of weights to be applied for each assignment group
 
         Returns:
-        dict - Example: {'1': {'group_weight': 25, 'grade_list': {'grades': [('1', 50), ('2', 25), ('3', 30), ('4', 50)]}},
+        GradeBook - Built from dict, example: {'1': {'group_weight': 25, 'grade_list': {'grades': [('1', 50), ('2', 25), ('3', 30), ('4', 50)]}},
                 '2': {'group_weight': 25, 'grade_list': {'grades': [('1', 50), ('2', 25), ('3', 30), ('4', 50)]}},
                 '3': {'group_weight': 25, 'grade_list': {'grades': [('1', 50), ('2', 25), ('3', 30), ('4', 50)]}},
                 '4': {'group_weight': 25, 'grade_list': {'grades': [('1', 50), ('2', 25), ('3', 30), ('4', 50)]}}}
@@ -48,7 +51,7 @@ class TestGrader(TestCase):
             group.group_weight = weights[index]
             group_dict[str(index + 1)] = group.asdict()
 
-        return group_dict
+        return GradeBook.from_groups(group_dict)
 
     def bulk_create_flexes_for_student(self, student, assessments, flexes):
         """
@@ -287,3 +290,170 @@ class TestGrader(TestCase):
         self.assertEqual(grader.get_score(groups_dict, 2, students[1]), 36.7)
         self.assertEqual(grader.get_score(groups_dict, 3, students[2]), 100)
         self.assertEqual(grader.get_score(groups_dict, 4, students[3]), 66.67)
+
+    def test_Grader_course_grades_match_per_student_totals(self):
+        course_id = 1
+        course = Course.objects.filter(id=course_id).first()
+        students = UserProfile.objects.filter(
+            usercourse__role=Roles.STUDENT, usercourse__course__id=course_id
+        )
+        student_ids = [str(student.user_id) for student in students]
+
+        groups_dict = self.build_group_dict(
+            student_ids,
+            [
+                [70, 25.5, 100 / 3, 200 / 3],
+                [80, 36.7, 50.4534, None],
+                [90, 75, 100, 200 / 3],
+                [100, 0, 1.112, 200 / 3],
+            ],
+            weights=[12.5, 37.5, 30, 20],
+        )
+
+        assessments = Assessment.objects.filter(course_id=course_id)
+        for student in students:
+            flexes = student.flexassessment_set.filter(assessment__course=course_id)
+            flexes.delete()  # Delete the predefined flexes in the fixtures
+
+        self.bulk_create_flexes_for_student(
+            students[0], assessments, [33.33, 33.33, 33.34, 0]
+        )
+        self.bulk_create_flexes_for_student(
+            students[1], assessments, [100, None, None, None]
+        )
+        self.bulk_create_flexes_for_student(students[2], assessments, [60, 20, 10, 10])
+        self.bulk_create_flexes_for_student(students[3], assessments, [50, 10, 20, 1])
+
+        course_grades = grader.get_course_grades(groups_dict, course, students)
+
+        expected_totals = ([], [], [])
+        for student in students:
+            override, default = course_grades.get_totals(student)
+            expected_override = grader.get_override_total(groups_dict, student, course)
+            expected_default = grader.get_default_total(groups_dict, student)
+
+            self.assertEqual(default, grader.round_half_up(expected_default, 3))
+            if expected_override is None:
+                self.assertIsNone(override)
+                expected_override = expected_default
+            else:
+                self.assertEqual(override, grader.round_half_up(expected_override, 3))
+
+            expected_totals[0].append(expected_override)
+            expected_totals[1].append(expected_default)
+            expected_totals[2].append(expected_override - expected_default)
+
+        # Averaged from the unrounded per-student totals
+        self.assertEqual(
+            course_grades.averages,
+            [
+                grader.round_half_up(sum(totals) / len(totals), 2)
+                for totals in expected_totals
+            ],
+        )
+
+    def test_Grader_course_grades_round_ties_half_up(self):
+        course_id = 1
+        course = Course.objects.filter(id=course_id).first()
+        students = UserProfile.objects.filter(
+            usercourse__role=Roles.STUDENT, usercourse__course__id=course_id
+        )
+        student_ids = [str(student.user_id) for student in students]
+
+        # 0.0005 and 0.0015 are exact ties at 3 decimal places
+        groups_dict = self.build_group_dict(
+            student_ids,
+            [[0.001, 0.003, 10.0005, 20.0015]],
+            weights=[100],
+        )
+
+        course_grades = grader.get_course_grades(groups_dict, course, students)
+
+        for student in students:
+            _, default = course_grades.get_totals(student)
+            expected_default = grader.get_default_total(groups_dict, student)
+            self.assertEqual(default, grader.round_half_up(expected_default, 3))
+
+    def test_Grader_optimal_flexes_fill_highest_scores_first(self):
+        scores = np.array(
+            [[70, 80, 90, 100], [90, 90, 50, 50], [np.nan, 80, 60, 70]], dtype=float
+        )
+        mins = np.array([1000, 1000, 1000, 1000])
+        maxs = np.array([3000, 3000, 3000, 3000])
+
+        flexes = grader.get_optimal_flexes(scores, mins, maxs)
+
+        np.testing.assert_array_equal(
+            flexes,
+            [
+                [1000, 3000, 3000, 3000],
+                [3000, 3000, 3000, 1000],
+                [3000, 3000, 1000, 3000],
+            ],
+        )
+
+    def test_Grader_optimal_flexes_fill_unscored_before_low_scores(self):
+        scores = np.array([[90, 50, np.nan]], dtype=float)
+        mins = np.array([0, 0, 0])
+        maxs = np.array([4000, 6000, 6000])
+
+        flexes = grader.get_optimal_flexes(scores, mins, maxs)
+
+        # 40 on the 90 and 60 on the unscored assessment leaves a total of 90
+        np.testing.assert_array_equal(flexes, [[4000, 0, 6000]])
+        np.testing.assert_array_equal(
+            grader._weighted_totals(scores, flexes / 100), [90]
+        )
+
+    def test_Grader_optimal_grades_beat_allowed_allocations(self):
+        course_id = 1
+        course = Course.objects.filter(id=course_id).first()
+        students = UserProfile.objects.filter(
+            usercourse__role=Roles.STUDENT, usercourse__course__id=course_id
+        )
+        student_ids = [str(student.user_id) for student in students]
+        gradebook = self.build_group_dict(
+            student_ids,
+            [
+                [70, 25.5, 100 / 3, 90],
+                [80, 36.7, 50.4534, 10],
+                [90, 75, 100, 95],
+                [100, 0, 1.112, 90],
+            ],
+            weights=[20, 30, 25, 25],
+        )
+
+        course_grades = grader.get_course_grades(gradebook, course, students)
+        optimal_grades = grader.get_optimal_grades(
+            gradebook, course, students, course_grades
+        )
+
+        # Every allocation in steps of 5 within the fixture bounds of 10 to 30
+        steps = range(10, 31, 5)
+        allocations = [
+            (a, b, c, 100 - a - b - c)
+            for a in steps
+            for b in steps
+            for c in steps
+            if 10 <= 100 - a - b - c <= 30
+        ]
+        scores = gradebook.get_scores(student_ids, ["1", "2", "3", "4"])
+
+        for row, student in enumerate(students):
+            optimal, distance = optimal_grades.get_totals(student)
+            best = max(
+                np.dot(scores[row], allocation) / 100 for allocation in allocations
+            )
+            self.assertGreaterEqual(optimal, grader.round_half_up(best, 3))
+            self.assertEqual(sum(optimal_grades.get_flexes(student)), 100)
+
+            override, default = course_grades.get_totals(student)
+            final = override if override is not None else default
+            self.assertEqual(
+                distance,
+                grader.round_half_up(optimal, 2) - grader.round_half_up(final, 2),
+            )
+
+        # Scores of 70, 80, 90 and 100 are best weighted 10, 30, 30, 30
+        optimal, _ = optimal_grades.get_totals(students[0])
+        self.assertEqual(optimal, grader.round_half_up(88, 3))
@@ -0,0 +1,169 @@
+import numpy as np
+from django.test import TestCase
+from flexible_assessment.models import (
+    Assessment,
+    Course,
+    FlexAssessment,
+    Roles,
+    UserProfile,
+)
+from flexible_assessment.tests.test_data import DATA
+from instructor import grader, simulator
+from instructor.gradebook import GradeBook
+
+
+class TestSimulator(TestCase):
+    fixtures = DATA
+
+    def setUp(self):
+        self.course = Course.objects.get(pk=1)
+        self.students = UserProfile.objects.filter(
+            usercourse__role=Roles.STUDENT, usercourse__course=self.course
+        )
+        self.assessments = list(Assessment.objects.filter(course=self.course))
+        groups = {
+            str(assessment.group): {
+                "group_weight": assessment.default,
+                "grade_list": {
+                    "grades": [
+                        (str(student.user_id), 60 + 10 * index)
+                        for student in self.students
+                    ]
+                },
+            }
+            for index, assessment in enumerate(self.assessments)
+        }
+        self.gradebook = GradeBook.from_groups(groups)
+
+    def set_flexes(self, student, flexes):
+        for assessment, flex in zip(self.assessments, flexes):
+            FlexAssessment.objects.filter(user=student, assessment=assessment).update(
+                flex=flex
+            )
+
+    def configuration(self, allocations):
+        return {
+            str(assessment.id): dict(zip(("default", "min", "max"), values))
+            for assessment, values in zip(self.assessments, allocations)
+        }
+
+    def test_simulate_grades_uses_defaults_for_conflicts(self):
+        scores = np.array([[80.0, 60.0], [50.0, np.nan]])
+        flexes = np.array([[7000.0, 3000.0], [np.nan, np.nan]])
+        override_totals = np.array([74.0, np.nan])
+        valid = np.array([True, False])
+        defaults = np.array([[50.0, 50.0], [40.0, 60.0]])
+        mins = np.array([[0.0, 0.0], [40.0, 40.0]])
+        maxs = np.array([[100.0, 100.0], [60.0, 60.0]])
+
+        grades, default_totals, conflicts = simulator.simulate_grades(
+            scores, flexes, override_totals, valid, defaults, mins, maxs
+        )
+
+        np.testing.assert_allclose(default_totals, [[70, 50], [68, 50]])
+        np.testing.assert_array_equal(conflicts, [[False, False], [True, False]])
+        np.testing.assert_allclose(grades, [[74, 50], [68, 50]])
+
+    def test_current_configuration_matches_course_grades(self):
+        results = simulator.simulate_course(
+            self.gradebook, self.course, self.students, [{}]
+        )
+        course_grades = grader.get_course_grades(
+            self.gradebook, self.course, self.students
+        )
+
+        self.assertEqual(
+            results["current"]["averages"],
+            [float(grader.round_half_up(a, 2)) for a in course_grades.averages],
+        )
+        self.assertEqual(results["results"][0], results["current"])
+        self.assertEqual(sum(results["current"]["distribution"]), len(self.students))
+
+    def test_new_conflicts_match_check_valid_flex(self):
+        self.set_flexes(self.students[0], [10, 30, 30, 30])
+        self.set_flexes(self.students[1], [30, 10, 30, 30])
+        configuration = self.configuration(
+            [(20, 15, 30), (30, 15, 30), (25, 10, 30), (25, 10, 30)]
+        )
+
+        results = simulator.simulate_course(
+            self.gradebook, self.course, self.students, [configuration]
+        )
+
+        for assessment, values in zip(self.assessments, configuration.values()):
+            assessment.min = values["min"]
+            assessment.max = values["max"]
+            assessment.save()
+        conflicts = set()
+        for assessment in self.assessments:
+            conflicts |= assessment.check_valid_flex()
+
+        self.assertEqual(results["results"][0]["new_conflicts"], len(conflicts))
+        self.assertEqual(len(conflicts), 2)
+
+    def test_invalid_configurations_raise_error(self):
+        invalid = [
+            [],
+            [{"not-an-assessment": {"default": 10}}],
+            [self.configuration([(30,), (30,), (25,), (25,)])],
+            [self.configuration([(20, 25, 30), (30,), (25,), (25,)])],
+            [self.configuration([("a",), (30,), (25,), (25,)])],
+        ]
+
+        for configurations in invalid:
+            with self.assertRaises(ValueError):
+                simulator.simulate_course(
+                    self.gradebook, self.course, self.students, configurations
+                )
+
+    def test_flexes_at_bounds_do_not_conflict(self):
+        scores = np.array([[80.0, 60.0, 70.0]])
+        flexes = np.array([[3333.0, 3333.0, 3334.0]])
+        bounds = np.array([[33.33, 33.33, 33.34]])
+
+        _, _, conflicts = simulator.simulate_grades(
+            scores,
+            flexes,
+            np.array([70.0]),
+            np.array([True]),
+            bounds,
+            bounds,
+            bounds,
+        )
+
+        np.testing.assert_array_equal(conflicts, [[False]])
+
+    def test_simulate_grades_many_configurations(self):
+        rng = np.random.default_rng(0)
+        students, assessments, configurations = 500, 8, 20
+        scores = rng.uniform(0, 100, (students, assessments))
+        scores[rng.random(scores.shape) < 0.05] = np.nan
+        flexes = np.round(rng.uniform(0, 2500, (students, assessments)))
+        flexes[rng.random(students) < 0.1] = np.nan
+        override_totals = rng.uniform(0, 100, students)
+        valid = ~np.isnan(flexes).any(axis=1)
+        defaults = np.full((configurations, assessments), 100 / assessments)
+        mins = np.round(rng.uniform(0, 12.5, (configurations, assessments)), 2)
+        maxs = np.round(rng.uniform(12.5, 100, (configurations, assessments)), 2)
+
+        grades, default_totals, conflicts = simulator.simulate_grades(
+            scores, flexes, override_totals, valid, defaults, mins, maxs
+        )
+
+        self.assertEqual(grades.shape, (configurations, students))
+        self.assertTrue(conflicts.any())
+        # Every configuration is simulated as if it were the only one
+        for index in range(configurations):
+            row = slice(index, index + 1)
+            expected = simulator.simulate_grades(
+                scores,
+                flexes,
+                override_totals,
+                valid,
+                defaults[row],
+                mins[row],
+                maxs[row],
+            )
+            np.testing.assert_allclose(grades[row], expected[0])
+            np.testing.assert_allclose(default_totals[row], expected[1])
+            np.testing.assert_array_equal(conflicts[row], expected[2])
@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+from instructor import throttle
+
+
+class TestConcurrencyLimit(SimpleTestCase):
+    def test_limit_rises_while_quota_is_left(self):
+        limit = throttle.ConcurrencyLimit(initial=2, maximum=4)
+        for _ in range(5):
+            limit.update({"X-Rate-Limit-Remaining": "700", "X-Request-Cost": "2.5"})
+
+        self.assertEqual(limit.workers, 4)
+        self.assertEqual(limit.peak, 4)
+
+    def test_limit_falls_to_affordable_requests(self):
+        limit = throttle.ConcurrencyLimit(initial=8, maximum=8)
+        # (300 - 100) // (50 + 50) requests can be paid for
+        limit.update({"X-Rate-Limit-Remaining": "300", "X-Request-Cost": "50"})
+        self.assertEqual(limit.workers, 2)
+
+        limit.update({"X-Rate-Limit-Remaining": "20.5", "X-Request-Cost": "1"})
+        self.assertEqual(limit.workers, 1)
+        self.assertEqual(limit.peak, 8)
+
+    def test_missing_headers_leave_limit(self):
+        limit = throttle.ConcurrencyLimit(initial=3)
+        limit.update({})
+        limit.update({"X-Rate-Limit-Remaining": "unknown"})
+
+        self.assertEqual(limit.workers, 3)
+
+    def test_throttle_halves_limit(self):
+        limit = throttle.ConcurrencyLimit(initial=6)
+        limit.throttle()
+        self.assertEqual(limit.workers, 3)
+        limit.throttle()
+        limit.throttle()
+
+        self.assertEqual(limit.workers, 1)
+        self.assertEqual(limit.throttled, 3)
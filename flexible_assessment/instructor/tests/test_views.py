@@ -1,7 +1,20 @@
 from django.test import TestCase, Client, tag
 from django.urls import reverse
 from django.template.response import TemplateResponse
-from flexible_assessment.models import Assessment, UserProfile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from flexible_assessment.models import (
+    Assessment,
+    Course,
+    EnrollmentStatus,
+    EnrollmentSubmission,
+    GradeSubmission,
+    JobStatus,
+    Roles,
+    UserComment,
+    UserCourse,
+    UserProfile,
+)
 from instructor.forms import *
 from instructor.views import *
 from flexible_assessment.tests.test_data import DATA
@@ -445,3 +458,137 @@ class TestViews(TestCase):
 
         self.assertContains(response, "Student", count=1)
         self.assertContains(response, "Comment", count=1)
+
+    def add_students_to_course(self, course_id, count, first_user_id=1000):
+        course = Course.objects.get(pk=course_id)
+        for user_id in range(first_user_id, first_user_id + count):
+            student = UserProfile.objects.create_user(
+                user_id, f"student{user_id}", f"Student {user_id}"
+            )
+            UserCourse.objects.create(user=student, course=course, role=Roles.STUDENT)
+            UserComment.objects.create(user=student, course=course)
+
+    def count_queries(self, url):
+        # Read the gradebook from the cache, which is kept in the database
+        self.client.get(url)
+        # Recalculate grades instead of reading the saved grade snapshot
+        Course.objects.get(pk=1).bump_flex_version()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    @mock_classes.use_mock_canvas()
+    def test_FinalGradeListView_query_count_does_not_grow_with_roster(
+        self, mocked_flex_canvas_instance
+    ):
+        course_id = 1
+        url = reverse("instructor:final_grades", args=[course_id])
+        self.client.get(reverse("instructor:instructor_home", args=[course_id]))
+
+        queries = self.count_queries(url)
+        self.add_students_to_course(course_id, 10)
+
+        self.assertEqual(self.count_queries(url), queries)
+
+    @mock_classes.use_mock_canvas()
+    def test_FinalGradeListView_csv_query_count_does_not_grow_with_roster(
+        self, mocked_flex_canvas_instance
+    ):
+        course_id = 1
+        url = reverse("instructor:final_grades_export", args=[course_id])
+        self.client.get(reverse("instructor:instructor_home", args=[course_id]))
+
+        queries = self.count_queries(url)
+        self.add_students_to_course(course_id, 10)
+
+        self.assertEqual(self.count_queries(url), queries)
+
+    @mock_classes.use_mock_canvas()
+    def test_WeightSimulatorView_returns_results(self, mocked_flex_canvas_instance):
+        course_id = 1
+        self.client.get(reverse("instructor:instructor_home", args=[course_id]))
+        assessment = Assessment.objects.filter(course_id=course_id).first()
+
+        response = self.client.post(
+            reverse("instructor:simulate_weights", args=[course_id]),
+            data=json.dumps(
+                {"configurations": [{}, {str(assessment.id): {"max": 25}}]}
+            ),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual(len(results["results"]), 2)
+        self.assertEqual(len(results["current"]["averages"]), 3)
+
+    @mock_classes.use_mock_canvas()
+    def test_WeightSimulatorView_rejects_invalid_configuration(
+        self, mocked_flex_canvas_instance
+    ):
+        course_id = 1
+        self.client.get(reverse("instructor:instructor_home", args=[course_id]))
+        assessment = Assessment.objects.filter(course_id=course_id).first()
+
+        response = self.client.post(
+            reverse("instructor:simulate_weights", args=[course_id]),
+            data=json.dumps({"configurations": [{str(assessment.id): {"min": 50}}]}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+
+    @mock_classes.use_mock_canvas()
+    def test_FinalGradeListView_submit_queues_submission(
+        self, mocked_flex_canvas_instance
+    ):
+        course_id = 1
+        self.client.get(reverse("instructor:instructor_home", args=[course_id]))
+        progress_url = reverse("instructor:final_grades_progress", args=[course_id])
+        self.assertEqual(self.client.get(progress_url).status_code, 404)
+
+        response = self.client.post(
+            reverse("instructor:final_grades_submit", args=[course_id]),
+            data={"release_total": "on"},
+        )
+        self.client.post(reverse("instructor:final_grades_submit", args=[course_id]))
+
+        self.assertRedirects(
+            response,
+            reverse("instructor:final_grades", args=[course_id]),
+            fetch_redirect_response=False,
+        )
+        submission = GradeSubmission.objects.get(course_id=course_id)
+        self.assertFalse(submission.hide_totals)
+        self.assertEqual(self.client.get(progress_url).json()["status"], "queued")
+        response = self.client.get(reverse("instructor:final_grades", args=[course_id]))
+        self.assertEqual(response.context["submission"]["status"], "queued")
+
+    @mock_classes.use_mock_canvas()
+    def test_FinalGradeListView_retry_queues_failed_grades(
+        self, mocked_flex_canvas_instance
+    ):
+        course_id = 1
+        self.client.get(reverse("instructor:instructor_home", args=[course_id]))
+        retry_url = reverse("instructor:final_grades_retry", args=[course_id])
+
+        self.client.post(retry_url)
+        self.assertFalse(GradeSubmission.objects.exists())
+
+        failed = GradeSubmission.objects.create(
+            course_id=course_id, user=self.user, status=JobStatus.FAILED
+        )
+        EnrollmentSubmission.objects.create(
+            submission=failed,
+            user=UserProfile.objects.get(pk=1),
+            enrollment_id="e1",
+            override=80,
+            status=EnrollmentStatus.FAILED,
+            error="Not allowed",
+        )
+        self.client.post(retry_url)
+
+        retry = GradeSubmission.objects.get(retry_of=failed)
+        self.assertEqual(retry.status, JobStatus.QUEUED)
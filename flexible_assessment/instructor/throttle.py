@@ -0,0 +1,101 @@
+"""Concurrency limit that follows Canvas API rate limiting
+
+Canvas gives each access token a bucket of quota that requests drain and
+that refills over time. Every response reports the quota left in
+X-Rate-Limit-Remaining and what the request cost in X-Request-Cost, and
+Canvas charges PREFLIGHT_COST up front for each request in flight. Once
+the bucket is empty, requests fail with 403 Forbidden (Rate Limit Exceeded).
+
+ConcurrencyLimit raises the number of requests in flight by one while the
+remaining quota can pay for another request, lowers it to what the quota
+can pay for when it cannot, and halves it when a request is throttled.
+"""
+
+PREFLIGHT_COST = 50
+# Quota kept free for other requests made with the same token
+RESERVED_QUOTA = 100
+REMAINING_HEADER = "X-Rate-Limit-Remaining"
+COST_HEADER = "X-Request-Cost"
+
+
+class ConcurrencyLimit:
+    """Number of requests allowed in flight, updated from each response
+
+    Attributes
+    ----------
+    workers : int
+        Requests currently allowed in flight
+    peak : int
+        Highest number of requests allowed in flight so far
+    throttled : int
+        Number of throttled requests
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=8):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.workers = max(minimum, min(initial, maximum))
+        self.peak = self.workers
+        self.throttled = 0
+
+    def update(self, headers):
+        """Adjusts the limit from the rate limit headers of a response,
+        left unchanged if Canvas did not send them
+
+        Parameters
+        ----------
+        headers : Mapping
+            Response headers
+        """
+
+        remaining, cost = get_rate_limit(headers)
+        if remaining is None:
+            return
+
+        affordable = int((remaining - RESERVED_QUOTA) // (cost + PREFLIGHT_COST))
+        if affordable < self.workers:
+            self._set_workers(affordable)
+        else:
+            self._set_workers(self.workers + 1)
+
+    def throttle(self):
+        """Halves the limit after a request was throttled"""
+
+        self.throttled += 1
+        self._set_workers(self.workers // 2)
+
+    def _set_workers(self, workers):
+        self.workers = max(self.minimum, min(workers, self.maximum))
+        self.peak = max(self.peak, self.workers)
+
+
+def get_rate_limit(headers):
+    """Gets the remaining quota and request cost from Canvas response headers
+
+    Returns
+    -------
+    remaining : float or None
+        Quota left, None if the header is missing or invalid
+    cost : float
+        Cost of the request, 0 if the header is missing or invalid
+    """
+
+    try:
+        remaining = float(headers[REMAINING_HEADER])
+    except (KeyError, TypeError, ValueError):
+        return None, 0
+
+    try:
+        cost = float(headers[COST_HEADER])
+    except (KeyError, TypeError, ValueError):
+        cost = 0
+
+    return remaining, cost
+
+
+def is_throttled(response):
+    """Checks if Canvas refused a request for exceeding the rate limit"""
+
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and "Rate Limit Exceeded" in response.text
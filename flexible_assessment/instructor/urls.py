@@ -17,6 +17,11 @@ urlpatterns = [
         {"csv": True},
         name="assessments_export",
     ),
+    path(
+        "<int:course_id>/form/simulate/",
+        views.WeightSimulatorView.as_view(),
+        name="simulate_weights",
+    ),
     path(
         "<int:course_id>/form/upload",
         views.ImportAssessmentView.as_view(),
@@ -71,6 +76,17 @@ urlpatterns = [
         {"submit": True},
         name="final_grades_submit",
     ),
+    path(
+        "<int:course_id>/final/list/submit/retry/",
+        views.FinalGradeListView.as_view(),
+        {"retry": True},
+        name="final_grades_retry",
+    ),
+    path(
+        "<int:course_id>/final/list/submit/progress/",
+        views.GradeSubmissionProgressView.as_view(),
+        name="final_grades_progress",
+    ),
     path("<int:course_id>/help", 
          views.InstructorHelp.as_view(), 
          name="instructor_help"
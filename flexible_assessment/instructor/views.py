@@ -4,7 +4,6 @@ import logging
 from datetime import datetime
 import dateutil.parser
 from io import TextIOWrapper
-from threading import Thread
 from datetime import datetime
 
 import flexible_assessment.class_views as views
@@ -17,12 +16,20 @@ from django.core.exceptions import PermissionDenied
 from django.db.models import Case, When
 from django.forms import BaseModelFormSet, ValidationError
 from django.conf import settings
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.urls import reverse
 from django.shortcuts import get_object_or_404, redirect
 from instructor.canvas_api import FlexCanvas
-from decimal import Decimal, ROUND_HALF_UP
-from . import grader, writer
+from instructor.flex_matrix import FlexMatrix
+from oauth.oauth import get_redirect_uri
+from . import (
+    grade_snapshot,
+    grade_submission,
+    gradebook_cache,
+    grader,
+    simulator,
+    writer,
+)
 from .forms import (
     AssessmentFileForm,
     AssessmentGroupForm,
@@ -36,14 +43,6 @@ from .forms import (
 logger = logging.getLogger(__name__)
 
 
-def round_half_up(value, digits=2):
-    if value is None:
-        return None
-    """Rounds a float to the specified number of digits using ROUND_HALF_UP"""
-    d = Decimal(str(value))  # Convert to Decimal
-    return d.quantize(Decimal(10) ** -digits, rounding=ROUND_HALF_UP)
-
-
 def should_show_page(course):
     return course.close is not None
 
@@ -78,6 +77,22 @@ class FlexAssessmentListView(views.ExportView, views.InstructorListView):
                 reverse("instructor:instructor_home", kwargs={"course_id": course_id})
             )
 
+    def get_context_data(self, **kwargs):
+        """Adds flex allocations of all students to context for rendering
+
+        Returns
+        -------
+        context : context
+            Request context
+        """
+
+        context = super().get_context_data(**kwargs)
+        course = context["course"]
+        context["flex_matrix"] = FlexMatrix.load(course, self.get_queryset())
+        context["assessments"] = list(course.assessment_set.all().order_by("order"))
+
+        return context
+
     def export_list(self):
         students = self.get_queryset()
         course_id = self.kwargs["course_id"]
@@ -129,9 +144,15 @@ class FinalGradeListView(views.ExportView, views.InstructorListView):
         students = self.get_queryset()
         course_id = self.kwargs["course_id"]
         course = models.Course.objects.get(pk=course_id)
-        groups = self.get_context_data().get("groups")
-
-        csv_response = writer.grades_csv(course, students, groups)
+        context = self.get_context_data()
+        gradebook = context.get("gradebook")
+        flex_matrix = context.get("flex_matrix")
+        course_grades = context.get("course_grades")
+        optimal_grades = context.get("optimal_grades")
+
+        csv_response = writer.grades_csv(
+            course, students, gradebook, course_grades, flex_matrix, optimal_grades
+        )
 
         logger.info(
             "Final list view exported",
@@ -148,6 +169,9 @@ class FinalGradeListView(views.ExportView, views.InstructorListView):
 
         log_extra = {"course": str(course), "user": request.session["display_name"]}
 
+        if self.kwargs.get("retry", False):
+            return self._retry_failed_grades(course, log_extra)
+
         if self.kwargs.get("submit", False):
             canvas = FlexCanvas(request)
 
@@ -169,30 +193,67 @@ class FinalGradeListView(views.ExportView, views.InstructorListView):
                     reverse("instructor:final_grades", kwargs={"course_id": course_id})
                 )
 
-            success = self._submit_final_grades(course_id, canvas)
-            if not success:
-                messages.error(
-                    request,
-                    "Something went wrong when submitting grades!" "Please try again.",
-                )
-
-                logger.info("Error in submitting final grades", extra=log_extra)
-
-                return HttpResponseRedirect(
-                    reverse("instructor:final_grades", kwargs={"course_id": course_id})
+            hide_totals = request.POST.get("release_total") != "on"
+            submission, created = grade_submission.enqueue(
+                course,
+                request.user,
+                request.session.get("flat", False) == True,
+                hide_totals,
+                get_redirect_uri(request),
+            )
+            if created:
+                logger.info("Queued final grades submission to Canvas", extra=log_extra)
+            else:
+                messages.warning(
+                    request, "Final grades are already being sent to Canvas."
                 )
 
-            logger.info("Completed final grades submission to Canvas", extra=log_extra)
+            return HttpResponseRedirect(
+                reverse("instructor:final_grades", kwargs={"course_id": course_id})
+            )
 
         release_total = request.POST.get("release_total") != "on"
+        canvas = FlexCanvas(request)
         canvas.get_course(course_id).update_settings(hide_final_grades=release_total)
 
         return HttpResponseRedirect(
             reverse("instructor:instructor_home", kwargs={"course_id": course_id})
         )
 
+    def _retry_failed_grades(self, course, log_extra):
+        """Queues the final grades that failed in the course's latest
+        submission to be sent again"""
+
+        request = self.request
+        latest = course.gradesubmission_set.order_by("-created").first()
+        if (
+            latest is None
+            or latest.status != models.JobStatus.FAILED
+            or not latest.enrollments.filter(
+                status=models.EnrollmentStatus.FAILED
+            ).exists()
+        ):
+            messages.error(request, "There are no failed final grades to retry.")
+        else:
+            grade_submission.enqueue(
+                course,
+                request.user,
+                latest.flat,
+                latest.hide_totals,
+                get_redirect_uri(request),
+                retry_of=latest,
+            )
+            logger.info(
+                "Queued failed final grades to be sent to Canvas again",
+                extra=log_extra,
+            )
+
+        return HttpResponseRedirect(
+            reverse("instructor:final_grades", kwargs={"course_id": course.id})
+        )
+
     def get_context_data(self, **kwargs):
-        """Adds Canvas Assignment Groups to context for rendering grades
+        """Adds Canvas gradebook and course grades to context for rendering grades
 
         Returns
         -------
@@ -202,80 +263,62 @@ class FinalGradeListView(views.ExportView, views.InstructorListView):
 
         context = super().get_context_data(**kwargs)
         course_id = self.kwargs["course_id"]
-        # Access the session variable to determine which method to call
+        # Flat grading scores each group by the average of its assignments
         flat_grade = self.request.session.get("flat", False) == True
-        if flat_grade:
-            # If 'flat' is true, call a method that handles flat grades
-            groups, _ = FlexCanvas(self.request).get_flat_groups_and_enrollments(
-                course_id
-            )
-        else:
-            # If 'flat' is false or not set, call the standard method
-            groups, _ = FlexCanvas(self.request).get_groups_and_enrollments(course_id)
-        context["groups"] = groups
+        # Gradebooks are cached for CANVAS_CACHE_TTL unless refreshed
+        refresh = self.request.GET.get("refresh") == "true"
+        gradebook = gradebook_cache.get_gradebook(
+            FlexCanvas(self.request), course_id, flat=flat_grade, refresh=refresh
+        )
+        course = context["course"]
+        students = list(self.get_queryset())
+        flex_matrix = FlexMatrix.load(course, students)
+
+        context["gradebook"] = gradebook
+        context["flex_matrix"] = flex_matrix
+        context["assessments"] = list(course.assessment_set.all().order_by("order"))
+        context["course_grades"] = grade_snapshot.get_course_grades(
+            gradebook, course, students, flex_matrix
+        )
+        context["optimal_grades"] = grader.get_optimal_grades(
+            gradebook, course, students, context["course_grades"]
+        )
 
         context["canvas_domain"] = settings.CANVAS_DOMAIN
 
-        return context
-
-    def _submit_final_grades(self, course_id, canvas):
-        """Uploads final override grades in batches to Canvas"""
+        # Progress of the latest grade submission is shown until it is done
+        submission = course.gradesubmission_set.order_by("-created").first()
+        if submission is not None:
+            context["submission"] = grade_submission.get_progress(submission)
 
-        def _set_override(student_name, enrollment_id, override, incomplete):
-            override = round_half_up(override, 3)
-            override = round_half_up(override, 2)
-            override = float(override)
+        return context
 
-            canvas.set_override(enrollment_id, override, incomplete)
-            logger.info(
-                "Submitted %s final grade to Canvas",
-                student_name,
-                extra={
-                    "course": str(course),
-                    "user": self.request.session["display_name"],
-                },
-            )
 
-        course = models.Course.objects.get(pk=course_id)
+class GradeSubmissionProgressView(views.InstructorTemplateView):
+    """Reports progress of the course's latest final grade submission"""
 
-        flat_grade = self.request.session.get("flat", False) == True
-        if flat_grade:
-            # If flat grading is enabled, use the flat grading method
-            groups, enrollments = FlexCanvas(
-                self.request
-            ).get_flat_groups_and_enrollments(course_id)
-        else:
-            # If not flat grading, use the standard grading method
-            groups, enrollments = FlexCanvas(self.request).get_groups_and_enrollments(
-                course_id
-            )
+    http_method_names = ["get"]
 
-        threads = []
-        incomplete = [False]
-        batch_size = 64
-        for student_id, enrollment_id in enrollments.items():
-            student = models.UserProfile.objects.filter(pk=student_id).first()
-            if not student:
-                continue
-            override = grader.get_override_total(
-                groups, student, course
-            ) or grader.get_default_total(groups, student)
-
-            t = Thread(
-                target=_set_override,
-                args=(student.display_name, enrollment_id, override, incomplete),
-            )
-            threads.append(t)
+    def get(self, request, *args, **kwargs):
+        """Returns the latest submission's status and its counts of
+        students by status, see grade_submission.get_progress
 
-            if len(threads) >= batch_size:
-                [t.start() for t in threads]
-                [t.join() for t in threads]
-                threads = []
+        Returns
+        -------
+        response : JsonResponse
+            Progress, with status 404 if grades were never submitted
+        """
 
-        [t.start() for t in threads]
-        [t.join() for t in threads]
+        course_id = self.kwargs["course_id"]
+        submission = (
+            models.GradeSubmission.objects.filter(course_id=course_id)
+            .order_by("-created")
+            .first()
+        )
+        if submission is None:
+            return JsonResponse({"error": "No grade submission found."}, status=404)
 
-        return not incomplete[0]
+        return JsonResponse(grade_submission.get_progress(submission))
 
 
 class AssessmentGroupView(views.InstructorFormView):
@@ -420,6 +463,9 @@ class AssessmentGroupView(views.InstructorFormView):
         for id in unmatched_group_ids:
             canvas_course.get_assignment_group(id).edit(group_weight=0)
 
+        # Cached gradebooks have the old group weights
+        gradebook_cache.invalidate(course_id)
+
 
 class InstructorAssessmentView(views.ExportView, views.InstructorFormView):
     """FormView for instructor setup of flexible assessment for a course"""
@@ -952,6 +998,59 @@ class InstructorAssessmentView(views.ExportView, views.InstructorFormView):
         return initial
 
 
+class WeightSimulatorView(views.InstructorTemplateView):
+    """Simulates final grades for candidate assessment default, min and max
+    configurations before the instructor saves them"""
+
+    http_method_names = ["post"]
+
+    def post(self, request, *args, **kwargs):
+        """Evaluates the configurations in the JSON request body
+
+        The body is {"configurations": [...]}, see simulator.simulate_course
+
+        Returns
+        -------
+        response : JsonResponse
+            Simulation results, or an error with status 400 if the
+            configurations are not valid
+        """
+
+        course_id = self.kwargs["course_id"]
+        course = models.Course.objects.get(pk=course_id)
+
+        try:
+            configurations = json.loads(request.body)["configurations"]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse(
+                {"error": "Request must contain a list of configurations."},
+                status=400,
+            )
+
+        students = models.UserProfile.objects.filter(
+            usercourse__role=models.Roles.STUDENT, usercourse__course=course
+        )
+        flat_grade = request.session.get("flat", False) == True
+        gradebook = gradebook_cache.get_gradebook(
+            FlexCanvas(request), course_id, flat=flat_grade
+        )
+
+        try:
+            results = simulator.simulate_course(
+                gradebook, course, students, configurations
+            )
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        logger.info(
+            "Simulated %s assessment configurations",
+            len(configurations),
+            extra={"course": str(course), "user": request.session["display_name"]},
+        )
+
+        return JsonResponse(results)
+
+
 class OverrideStudentAssessmentView(views.InstructorFormView):
     """FormView for instructor overriding student flexible allocations"""
 
@@ -8,7 +8,10 @@ from django.conf import settings
 from django.http import HttpResponse
 from django.utils import timezone
 
-from . import grader
+from flexible_assessment.models import UserComment
+
+from . import grade_math, grader
+from .flex_matrix import FlexMatrix
 
 
 class Writer(ABC):
@@ -122,24 +125,29 @@ def students_csv(course, students):
 
     csv_writer.write(header)
 
+    flex_matrix = FlexMatrix.load(course, students)
+    comments = dict(
+        UserComment.objects.filter(course=course).values_list("user_id", "comment")
+    )
+
     for student in students:
         values = []
         values.append("{}, {}".format(student.display_name, student.login_id))
 
         # if first flex doens't exist, student didn't choose flexes
-        first_flex = student.flexassessment_set.get(assessment=assessments[0]).flex
+        first_flex = flex_matrix.get_flex(student.user_id, assessments[0].id)
         if first_flex is None:
             values.append("No")
         else:
             values.append("Yes")
 
         for assessment in assessments:
-            flex = student.flexassessment_set.get(assessment=assessment).flex
+            flex = flex_matrix.get_flex(student.user_id, assessment.id)
             if flex is None:
                 flex = assessment.default
             values.append(flex)
 
-        comment = student.usercomment_set.get(course=course).comment
+        comment = comments.get(student.user_id, "")
         # if comment == "":
         #    comment = "no comment entered for " + str(student.display_name)
         values.append(comment)
@@ -149,18 +157,16 @@ def students_csv(course, students):
     return csv_writer.get_response()
 
 
-from decimal import Decimal, ROUND_HALF_UP
-
 
-def round_half_up(value, digits=2):
-    if value is None:
-        return None
-    """Rounds a float to the specified number of digits using ROUND_HALF_UP"""
-    d = Decimal(str(value))  # Convert to Decimal
-    return d.quantize(Decimal(10) ** -digits, rounding=ROUND_HALF_UP)
 
-
-def grades_csv(course, students, groups):
+def grades_csv(
+    course,
+    students,
+    gradebook,
+    course_grades=None,
+    flex_matrix=None,
+    optimal_grades=None,
+):
     """Creates csv response for final grade list"""
 
     csv_writer = CSVWriter("Grades", course)
@@ -171,52 +177,81 @@ def grades_csv(course, students, groups):
     for assessment in assessments:
         titles.append(f"{assessment.title} Grade %")
         titles.append(
-            f"{assessment.title} Weight % ({grader.get_group_weight(groups, assessment.group)}%)"
+            f"{assessment.title} Weight % ({grader.get_group_weight(gradebook, assessment.group)}%)"
         )
 
     header = (
         ["Student"]
         + ["Override Total", "Default Total", "Difference", "Chose Percentages?"]
+        + ["Optimal Total", "Below Optimal"]
         + titles
     )
 
     csv_writer.write(header)
 
+    if flex_matrix is None:
+        flex_matrix = FlexMatrix.load(course, students)
+    if course_grades is None:
+        course_grades = grader.get_course_grades(
+            gradebook, course, students, flex_matrix
+        )
+    if optimal_grades is None:
+        optimal_grades = grader.get_optimal_grades(
+            gradebook, course, students, course_grades
+        )
+
     for student in students:
         values = []
         values.append("{}, {}".format(student.display_name, student.login_id))
 
-        override_total = grader.get_override_total(groups, student, course)
-        override_total = round_half_up(override_total, 3)
-        default_total = grader.get_default_total(groups, student)
-        default_total = round_half_up(default_total, 3)
+        # Totals are in thousandths, written rounded to hundredths
+        override_total, default_total = course_grades.get_fixed_totals(student)
+        default = grade_math.format_fixed(
+            grade_math.round_fixed(default_total, 3, 2), 2
+        )
 
         if override_total is not None:
-            values.append(round_half_up(override_total, 2))
-            values.append(round_half_up(default_total, 2))
-            diff = override_total - default_total
-            values.append(round_half_up(diff, 2))
+            values.append(
+                grade_math.format_fixed(grade_math.round_fixed(override_total, 3, 2), 2)
+            )
+            values.append(default)
+            diff = grade_math.round_fixed(override_total - default_total, 3, 2)
+            values.append(grade_math.format_fixed(diff, 2))
             values.append("Yes")
         else:
-            values.append(round_half_up(default_total, 2))
-            values.append(round_half_up(default_total, 2))
+            values.append(default)
+            values.append(default)
             values.append("0")
             values.append("No")
 
+        optimal_total, distance = optimal_grades.get_fixed_totals(student)
+        values.append(
+            grade_math.format_fixed(grade_math.round_fixed(optimal_total, 3, 2), 2)
+        )
+        values.append(grade_math.format_fixed(distance, 2))
+
         for assessment in assessments:
-            score = grader.get_score(groups, assessment.group, student)
+            score = grader.get_score(gradebook, assessment.group, student)
             values.append(score)
 
-            group_weight = grader.get_group_weight(groups, assessment.group)
+            group_weight = grader.get_group_weight(gradebook, assessment.group)
 
-            flex = student.flexassessment_set.get(assessment=assessment).flex
+            flex = flex_matrix.get_flex(student.user_id, assessment.id)
             values.append(flex) if flex is not None else values.append(group_weight)
 
         csv_writer.write(values)
 
-    csv_writer.write(["Average Override", "Average Default", "Average Difference"])
+    csv_writer.write(
+        [
+            "Average Override",
+            "Average Default",
+            "Average Difference",
+            "Average Optimal",
+            "Average Below Optimal",
+        ]
+    )
 
-    csv_writer.write(grader.get_averages(groups, course))
+    csv_writer.write(course_grades.averages + optimal_grades.averages)
 
     return csv_writer.get_response()
 
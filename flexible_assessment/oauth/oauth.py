@@ -31,13 +31,20 @@ class FernetCanvas(Fernet):
 
 
 def get_oauth_token(request):
+    return get_user_oauth_token(request.user, get_redirect_uri(request))
+
+
+def get_user_oauth_token(user, redirect_uri):
+    """Gets a user's Canvas access token outside of their requests, e.g. in
+    the grade submission worker, refreshing it with redirect_uri if needed"""
+
     try:
-        oauth_token = request.user.oauth2_token
+        oauth_token = user.oauth2_token
     except CanvasOAuth2Token.DoesNotExist:
-        raise MissingTokenError("No token found for user %s" % request.user.pk)
+        raise MissingTokenError("No token found for user %s" % user.pk)
 
     if oauth_token.expires_within(settings.CANVAS_OAUTH_TOKEN_EXPIRATION_BUFFER):
-        oauth_token = refresh_oauth_token(request)
+        oauth_token = _refresh_user_oauth_token(user, redirect_uri)
 
     fernet = FernetCanvas()
 
@@ -98,8 +105,16 @@ def oauth_callback(request):
     return HttpResponseRedirect(initial_uri)
 
 
+def get_redirect_uri(request):
+    return request.build_absolute_uri(reverse("canvas-oauth-callback"))
+
+
 def refresh_oauth_token(request):
-    oauth_token = request.user.oauth2_token
+    return _refresh_user_oauth_token(request.user, get_redirect_uri(request))
+
+
+def _refresh_user_oauth_token(user, redirect_uri):
+    oauth_token = user.oauth2_token
 
     fernet = FernetCanvas()
 
@@ -110,7 +125,7 @@ def refresh_oauth_token(request):
         grant_type="refresh_token",
         client_id=settings.CANVAS_OAUTH_CLIENT_ID,
         client_secret=settings.CANVAS_OAUTH_CLIENT_SECRET,
-        redirect_uri=request.build_absolute_uri(reverse("canvas-oauth-callback")),
+        redirect_uri=redirect_uri,
         refresh_token=refresh_token,
     )
 